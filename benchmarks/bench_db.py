@@ -0,0 +1,233 @@
+# micro benchmarks for the public db.py operations at several table sizes
+# each size gets its own throwaway database seeded with that many rows in
+# the messages, tasks, context and agents tables, then every operation is
+# timed over a number of rounds with untimed per round setup where needed
+#
+# usage:
+#   python benchmarks/bench_db.py --sizes 1000,100000 --save results.json
+#   python benchmarks/bench_db.py --compare baseline.json --threshold 0.25
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from talktome import db
+
+DEFAULT_SIZES = "1000,100000,1000000"
+
+# rows are spread over this many agents so per agent queries stay realistic
+SEED_AGENTS = 100
+
+# activity is trimmed to the last 100 events on every write
+ACTIVITY_CAP = 100
+
+
+def use_database(path):
+    db.use(path)
+    db.init()
+
+
+# bulk load rows straight through sqlite, the public functions would take hours at 1m rows
+def seed(rows):
+    now = time.time()
+    conn = db.connect()
+    conn.executemany(
+        "INSERT INTO agents (name, path, status, registered_at, last_seen, metadata) VALUES (?, ?, 'active', ?, ?, '{}')",
+        ((f"agent-{i}", f"/projects/agent-{i}", now, now) for i in range(SEED_AGENTS)),
+    )
+    # almost everything in a long lived mailbox has already been read
+    conn.executemany(
+        "INSERT INTO messages (sender, receiver, message, timestamp, read) VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                f"agent-{i % SEED_AGENTS}",
+                f"agent-{(i + 1) % SEED_AGENTS}",
+                f"message body {i}",
+                now,
+                1 if i % 50 else 0,
+            )
+            for i in range(rows)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO tasks (id, agent, description, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (
+                f"s{i:08d}",
+                f"agent-{i % SEED_AGENTS}",
+                f"task {i}",
+                "done" if i % 10 else "pending",
+                now,
+                now,
+            )
+            for i in range(rows)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO context (owner, key, value) VALUES (?, ?, ?)",
+        ((f"agent-{i % SEED_AGENTS}", f"key-{i}", f"value {i}") for i in range(rows)),
+    )
+    conn.executemany(
+        "INSERT INTO activity (event, timestamp, data) VALUES ('message', ?, '{}')",
+        ((now,) for _ in range(min(rows, ACTIVITY_CAP))),
+    )
+    conn.commit()
+    conn.close()
+
+
+# each case is (setup, operation), setup runs untimed before every round
+# and returns the arguments for the operation
+def cases():
+    counter = {"n": 0}
+
+    def fresh(prefix):
+        counter["n"] += 1
+        return f"{prefix}-{counter['n']}"
+
+    def with_unread(agent, count=5):
+        for i in range(count):
+            db.send_message("agent-1", agent, f"unread {i}")
+        return (agent,)
+
+    return {
+        "register": (lambda: (fresh("bench-agent"), "/bench"), db.register),
+        "send_message": (
+            lambda: ("agent-1", "agent-2", "hello from the benchmark"),
+            db.send_message,
+        ),
+        "read_messages": (lambda: with_unread("agent-3"), db.read_messages),
+        "peek_messages": (lambda: ("agent-4",), db.peek_messages),
+        "create_task": (lambda: (fresh("bench-task"), "agent-5", "benchmark task"), db.create_task),
+        "update_task": (lambda: ("s00000000", "running", "still going"), db.update_task),
+        "log_activity": (lambda: ("message",), db.log_activity),
+        "get_activity": (lambda: (), db.get_activity),
+        "set_context": (lambda: ("agent-6", "key-6", "updated value"), db.set_context),
+    }
+
+
+def measure(setup, operation, rounds, warmup):
+    samples = []
+    for i in range(warmup + rounds):
+        args = setup()
+        start = time.perf_counter_ns()
+        operation(*args)
+        elapsed = time.perf_counter_ns() - start
+        if i >= warmup:
+            samples.append(elapsed / 1000)
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        "rounds": rounds,
+        "median_us": round(median, 1),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1),
+        "min_us": round(samples[0], 1),
+        "ops_per_sec": round(1_000_000 / median, 1) if median else 0.0,
+    }
+
+
+def run(sizes, rounds, warmup, only, memory=False):
+    results = {}
+    for rows in sizes:
+        with tempfile.TemporaryDirectory(prefix="talktome-bench-db-") as tmp:
+            use_database(db.MEMORY if memory else os.path.join(tmp, "bridge.db"))
+            start = time.perf_counter()
+            seed(rows)
+            print(f"seeded {rows} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            results[str(rows)] = {}
+            for name, (setup, operation) in cases().items():
+                if only and name not in only:
+                    continue
+                results[str(rows)][name] = measure(setup, operation, rounds, warmup)
+    db.use()
+    return results
+
+
+# compare medians with a baseline, returns the list of regressions found
+def compare(results, baseline, threshold):
+    regressions = []
+    for size, ops in results.items():
+        for op, current in ops.items():
+            before = baseline.get(size, {}).get(op)
+            if before is None or not before["median_us"]:
+                continue
+            change = current["median_us"] / before["median_us"] - 1
+            current["change"] = round(change, 3)
+            if change > threshold:
+                regressions.append((size, op, before["median_us"], current["median_us"], change))
+    return regressions
+
+
+def print_results(results):
+    print(
+        f"{'rows':>9} {'operation':<15} {'median us':>10} {'p95 us':>10} {'ops/s':>10} {'change':>8}"
+    )
+    for size, ops in results.items():
+        for op, r in ops.items():
+            change = f"{r['change'] * 100:+.1f}%" if "change" in r else ""
+            print(
+                f"{size:>9} {op:<15} {r['median_us']:>10.1f} {r['p95_us']:>10.1f}"
+                f" {r['ops_per_sec']:>10.1f} {change:>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="db.py micro benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated row counts")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", default="", help="comma separated operations to run")
+    parser.add_argument("--profile", default="", help="db pragma profile, durable or fast")
+    parser.add_argument(
+        "--memory", action="store_true", help="use an in-memory database instead of a temp file"
+    )
+    parser.add_argument("--save", default="", help="write results to this json file")
+    parser.add_argument("--compare", default="", help="baseline json file to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="allowed median slowdown, 0.25 is 25%%"
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        db.use_profile(args.profile)
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = {s for s in args.only.split(",") if s}
+    results = run(sizes, args.rounds, args.warmup, only, args.memory)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+
+    print_results(results)
+    if args.save:
+        document = {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "rounds": args.rounds,
+            "memory": args.memory,
+            "pragmas": db.pragmas(),
+            "results": results,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+        for size, op, before, after, change in regressions:
+            print(f"  {op} at {size} rows: {before:.1f}us -> {after:.1f}us ({change:+.1%})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
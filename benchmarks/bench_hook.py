@@ -0,0 +1,178 @@
+# end to end cost of `talktome hook-inbox`, the command claude code runs
+# before every tool call. execs the real hook with a PreToolUse payload
+# against a throwaway bridge and reports the wall clock distribution,
+# which includes interpreter startup and imports, for each case:
+#   cold/empty  cooldown expired, nothing waiting
+#   cold/full   cooldown expired, messages and pending tasks waiting
+#   warm        checked within the cooldown, the hook exits early
+#
+# usage: python benchmarks/bench_hook.py [--runs 30] [--budget-ms 250]
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from talktome.bench import free_port, launch_bridge, percentile, wait_for_health
+
+AGENT = "bench-hook-agent"
+
+
+# the installed console script when there is one, otherwise the same entry point via python
+def hook_command():
+    exe = shutil.which("talktome")
+    if exe:
+        return [exe, "hook-inbox"]
+    return [sys.executable, "-c", "from talktome import main; main()", "hook-inbox"]
+
+
+def post(url, endpoint, data):
+    req = urllib.request.Request(
+        f"{url}{endpoint}",
+        data=json.dumps(data).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    urllib.request.urlopen(req, timeout=5).read()
+
+
+def fill_mailbox(url, messages, tasks):
+    post(url, "/register", {"name": "bench-peer", "path": "/bench/peer"})
+    for i in range(messages):
+        post(url, "/send", {"sender": "bench-peer", "peer": AGENT, "message": f"update {i} " * 20})
+    for i in range(tasks):
+        post(url, "/task", {"agent": AGENT, "description": f"follow up on item {i}"})
+
+
+def drain_mailbox(url):
+    urllib.request.urlopen(f"{url}/read/{AGENT}", timeout=5).read()
+
+
+# time a command over a number of runs, prepare runs untimed before each one
+def time_runs(cmd, runs, env=None, stdin=b"", prepare=None):
+    samples = []
+    output = b""
+    for _ in range(runs):
+        if prepare:
+            prepare()
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, input=stdin, env=env, capture_output=True)
+        samples.append((time.perf_counter() - start) * 1000)
+        output = proc.stdout
+    samples.sort()
+    return samples, output
+
+
+def describe(samples):
+    return {
+        "p50_ms": round(percentile(samples, 50), 1),
+        "p95_ms": round(percentile(samples, 95), 1),
+        "p99_ms": round(percentile(samples, 99), 1),
+        "max_ms": round(samples[-1], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hook-inbox latency benchmark")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--messages", type=int, default=20, help="messages in the full case")
+    parser.add_argument("--tasks", type=int, default=5, help="pending tasks in the full case")
+    parser.add_argument(
+        "--budget-ms", type=float, default=0, help="fail when a cold case p95 exceeds this"
+    )
+    parser.add_argument("--json", default="", help="also write the results to this file")
+    args = parser.parse_args()
+
+    cooldown_file = os.path.join(tempfile.gettempdir(), f"talktome-inbox-{AGENT}")
+
+    def cold():
+        if os.path.exists(cooldown_file):
+            os.remove(cooldown_file)
+
+    def warm():
+        with open(cooldown_file, "w") as f:
+            f.write(str(time.time()))
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="talktome-bench-hook-") as tmp:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        bridge = launch_bridge(os.path.join(tmp, "home"), port)
+        try:
+            if not wait_for_health(url):
+                print("bench bridge did not start")
+                return 1
+
+            # a project dir that looks like one the SessionStart hook already registered
+            project = os.path.join(tmp, "project")
+            os.makedirs(os.path.join(project, ".claude"))
+            with open(os.path.join(project, ".claude", ".bridge-identity"), "w") as f:
+                json.dump({"name": AGENT, "session_id": "bench"}, f)
+            post(url, "/register", {"name": AGENT, "path": project})
+
+            payload = json.dumps(
+                {
+                    "session_id": "bench",
+                    "cwd": project,
+                    "hook_event_name": "PreToolUse",
+                    "tool_name": "Bash",
+                    "tool_input": {"command": "ls"},
+                }
+            ).encode()
+            env = dict(os.environ, TALKTOME_URL=url)
+            cmd = hook_command()
+
+            # fixed costs every hook pays before it does any work
+            samples, _ = time_runs([sys.executable, "-c", "pass"], args.runs)
+            results["python startup"] = describe(samples)
+            samples, _ = time_runs([sys.executable, "-c", "import talktome"], args.runs)
+            results["startup + cli"] = describe(samples)
+            samples, _ = time_runs([sys.executable, "-c", "import talktome.hooks"], args.runs)
+            results["startup + import"] = describe(samples)
+
+            drain_mailbox(url)
+            samples, _ = time_runs(cmd, args.runs, env, payload, prepare=cold)
+            results["cold/empty"] = describe(samples)
+
+            fill_mailbox(url, args.messages, args.tasks)
+            samples, output = time_runs(cmd, args.runs, env, payload, prepare=cold)
+            results["cold/full"] = describe(samples)
+            if b"[talktome]" not in output:
+                print("warning: the full mailbox case produced no hook output")
+
+            samples, _ = time_runs(cmd, args.runs, env, payload, prepare=warm)
+            results["warm"] = describe(samples)
+        finally:
+            cold()
+            bridge.terminate()
+            try:
+                bridge.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                bridge.kill()
+                bridge.wait()
+
+    print(f"hook command: {' '.join(cmd[:2])} ... ({args.runs} runs per case)")
+    print(f"{'case':<18} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for case, r in results.items():
+        print(
+            f"{case:<18} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"runs": args.runs, "results": results}, f, indent=2)
+
+    if args.budget_ms:
+        over = [c for c in ("cold/empty", "cold/full") if results[c]["p95_ms"] > args.budget_ms]
+        if over:
+            print(f"over the {args.budget_ms:g} ms budget at p95: {', '.join(over)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+# end to end load test, launches a bridge against a temp database and
+# simulates agents, hooks and dashboard tabs, same as `talktome bench`
+#
+# usage: python benchmarks/bench_load.py [--agents 20] [--duration 30] [--json out.json]
+
+import sys
+
+from talktome.bench import main
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,109 @@
+# response size and serialization benchmark for the heavy dashboard endpoints
+# fills a throwaway database and a fake claude projects dir, fetches
+# /sessions, /tasks and /activity through the asgi app, then times the
+# stdlib encoder against the fast encoder and each content encoding
+#
+# usage: python benchmarks/bench_responses.py [--agents 50] [--tasks 2000] [--sessions 400]
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, server
+from talktome.responses import compress, dumps, orjson
+
+
+def seed(tmp, agents, tasks, sessions):
+    db.use(os.path.join(tmp, "bridge.db"))
+    for i in range(agents):
+        db.register(f"agent-{i}", f"/home/dev/projects/service-{i}")
+    for i in range(tasks):
+        db.create_task(f"t{i:06d}", f"agent-{i % agents}", f"migrate handler {i} to the new schema")
+    for i in range(100):
+        db.log_activity("message", sender="agent-0", peer="agent-1", content=f"status update {i}")
+
+    # one project dir per agent with a spread of session files
+    projects = os.path.join(tmp, "projects")
+    for i in range(sessions):
+        pdir = os.path.join(projects, f"home-dev-projects-service-{i % agents}")
+        os.makedirs(pdir, exist_ok=True)
+        record = {
+            "type": "user",
+            "cwd": f"/home/dev/projects/service-{i % agents}",
+            "slug": f"session-{i}",
+            "gitBranch": "main",
+            "timestamp": "2026-01-01T00:00:00Z",
+        }
+        with open(os.path.join(pdir, f"{i:08x}-session.jsonl"), "w", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    server.CLAUDE_PROJECTS_DIR = projects
+
+
+async def fetch(paths):
+    app = server.mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    payloads = {}
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in paths:
+            resp = await client.get(path, headers={"Accept-Encoding": "identity"})
+            payloads[path] = resp.json()
+    return payloads
+
+
+# what starlette's stock json response does for every request
+def stock_dumps(payload):
+    return json.dumps(
+        payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+# median wall time in milliseconds over a number of runs
+def timeit(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="response size benchmark")
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=400)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed(tmp, args.agents, args.tasks, args.sessions)
+        payloads = asyncio.run(fetch(["/sessions", "/tasks", "/activity"]))
+
+    encoder = "orjson" if orjson is not None else "stdlib compact"
+    print(f"fast encoder: {encoder}")
+    header = f"{'endpoint':<10} {'bytes':>9} {'gzip':>9} {'deflate':>9}"
+    header += f" {'stock ms':>9} {'fast ms':>8} {'gzip ms':>8}"
+    print(header)
+    for path, payload in payloads.items():
+        compact = dumps(payload)
+        gzipped = compress(compact, "gzip")
+        deflated = compress(compact, "deflate")
+        stock_ms = timeit(lambda: stock_dumps(payload), args.runs)
+        fast_ms = timeit(lambda: dumps(payload), args.runs)
+        gzip_ms = timeit(lambda: compress(compact, "gzip"), args.runs)
+        print(
+            f"{path:<10} {len(compact):>9} {len(gzipped):>9} {len(deflated):>9}"
+            f" {stock_ms:>9.2f} {fast_ms:>8.2f} {gzip_ms:>8.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,12 @@
 import json
 import os
 import sys
-import threading
 import time
-import urllib.error
-import urllib.request
-import webbrowser
 
-PORT = 3456
+# urllib, webbrowser and threading are imported where they are used, every hook
+# and cli command imports this package and most of them never need them
+
+PORT = int(os.environ.get("TALKTOME_PORT", "3456"))
 URL = f"http://127.0.0.1:{PORT}"
 
 # path to the claude code global settings file (hooks live here)
@@ -19,6 +18,9 @@ CLAUDE_JSON_PATH = os.path.join(os.path.expanduser("~"), ".claude.json")
 
 # check if the bridge server is already responding on the port
 def is_running():
+    import urllib.error
+    import urllib.request
+
     try:
         req = urllib.request.Request(f"{URL}/health")
         resp = urllib.request.urlopen(req, timeout=3)
@@ -29,6 +31,8 @@ def is_running():
 
 # poll until the server is up then open the browser
 def wait_and_open():
+    import webbrowser
+
     for i in range(20):
         time.sleep(0.3)
         if is_running():
@@ -198,8 +202,92 @@ def uninstall():
     print(f"  mcp server removed from {CLAUDE_JSON_PATH}")
 
 
+# print the sql profile collected by the running bridge
+def profile(reset=False):
+    import urllib.error
+    import urllib.request
+
+    try:
+        if reset:
+            req = urllib.request.Request(f"{URL}/debug/queries/reset", method="POST")
+            urllib.request.urlopen(req, timeout=5)
+            print("query profile cleared")
+            return
+        resp = urllib.request.urlopen(f"{URL}/debug/queries", timeout=5)
+        report = json.loads(resp.read())
+    except (urllib.error.URLError, OSError):
+        print(f"talktome is not running at {URL}")
+        sys.exit(1)
+
+    print(f"slow query threshold: {report['threshold_ms']} ms")
+    print()
+    print("statements by total time")
+    print(f"  {'calls':>7} {'total ms':>10} {'avg ms':>8} {'max ms':>8}  sql")
+    for s in report["statements"]:
+        print(
+            f"  {s['calls']:>7} {s['total_ms']:>10.2f} {s['avg_ms']:>8.3f} "
+            f"{s['max_ms']:>8.2f}  {s['sql'][:100]}"
+        )
+    print()
+    if not report["slow"]:
+        print("no statements over the threshold")
+        return
+    print("slowest statements")
+    for entry in report["slow"]:
+        print(f"  {entry['ms']:>8.2f} ms  {entry['sql'][:100]}")
+        for step in entry["plan"]:
+            print(f"               plan: {step}")
+
+
+# human readable byte count for the stats report
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+# print storage stats for the running bridge, falling back to the database itself
+def stats():
+    import urllib.error
+    import urllib.request
+
+    try:
+        resp = urllib.request.urlopen(f"{URL}/stats", timeout=5)
+        report = json.loads(resp.read())
+    except (urllib.error.URLError, OSError):
+        from talktome import db
+
+        if not db.is_memory() and not os.path.exists(db.path()):
+            print(f"no talktome database at {db.path()}")
+            sys.exit(1)
+        report = db.storage_stats()
+
+    blobs = report["blobs"]
+    print(f"database: {report['path']}")
+    print(
+        f"  size {format_bytes(report['db_bytes'])}, "
+        f"free {format_bytes(report['free_bytes'])}, wal {format_bytes(report['wal_bytes'])}"
+    )
+    print("rows: " + ", ".join(f"{table} {n}" for table, n in report["rows"].items()))
+    print(
+        f"blobs: {format_bytes(blobs['raw_bytes'])} of payloads "
+        f"stored in {format_bytes(blobs['stored_bytes'])}"
+    )
+    print(f"  saved by compression    {format_bytes(blobs['compression_saved_bytes'])}")
+    print(f"  saved by deduplication  {format_bytes(blobs['dedup_saved_bytes'])}")
+    for encoding, e in blobs["by_encoding"].items():
+        print(
+            f"  {encoding:<10} {e['blobs']:>6} blobs  {format_bytes(e['raw_bytes'])}"
+            f" -> {format_bytes(e['stored_bytes'])}"
+        )
+
+
 # start the bridge server and open the dashboard
 def start(open_browser=True):
+    import threading
+    import webbrowser
+
     # if bridge already running just open browser and exit
     if is_running():
         print(f"talktome already running at {URL}")
@@ -215,10 +303,21 @@ def start(open_browser=True):
         opener.start()
 
     # run the server in the foreground, blocks until interrupted
-    from talktome.server import mcp
+    from talktome import federation
+    from talktome.maintenance import worker_count
+    from talktome.server import mcp, run_workers
 
+    workers = worker_count()
     try:
-        mcp.run(transport="http", host="0.0.0.0", port=PORT)
+        federation.check()
+        if workers > 1:
+            print(f"running {workers} workers")
+            run_workers(workers, "0.0.0.0", PORT)
+        else:
+            mcp.run(transport="http", host="0.0.0.0", port=PORT)
+    except ValueError as e:
+        print(f"talktome: {e}")
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\ntalktome stopped")
         sys.exit(0)
@@ -227,14 +326,43 @@ def start(open_browser=True):
 # run the stdio mcp proxy, auto starting the bridge if needed
 def run_proxy():
     from talktome.hooks import ensure_bridge
-    from talktome.proxy import proxy
+    from talktome.proxy import proxy, start_replayer
 
     ensure_bridge()
+    # writes spooled while the bridge was down are sent once it is back
+    start_replayer()
     proxy.run()
 
 
+# pull a `--name VALUE` option out of the arguments and export it as
+# TALKTOME_<NAME> so the bridge and anything it spawns see it
+def apply_option(args, name):
+    flag = "--" + name
+    variable = "TALKTOME_" + name.upper()
+    for i, arg in enumerate(args):
+        if arg == flag and i + 1 < len(args):
+            os.environ[variable] = args[i + 1]
+            del args[i : i + 2]
+            break
+        if arg.startswith(flag + "="):
+            os.environ[variable] = arg[len(flag) + 1 :]
+            del args[i]
+            break
+    return args
+
+
+# `--db PATH` picks the database, ":memory:" keeps it in memory
+def apply_db_option(args):
+    return apply_option(args, "db")
+
+
 # cli entry point, routes to subcommands or starts the dashboard
 def main():
+    apply_db_option(sys.argv)
+    # `--workers N` serves the bridge from n processes
+    apply_option(sys.argv, "workers")
+    # `--peers URL,URL` federates with other bridges
+    apply_option(sys.argv, "peers")
     command = sys.argv[1].lower() if len(sys.argv) > 1 else ""
 
     if command == "install":
@@ -243,6 +371,14 @@ def main():
         uninstall()
     elif command == "proxy":
         run_proxy()
+    elif command == "bench":
+        from talktome.bench import main as bench_main
+
+        sys.exit(bench_main())
+    elif command == "stats":
+        stats()
+    elif command == "profile":
+        profile(reset="--reset" in sys.argv[2:])
     elif command == "hook-register":
         from talktome.hooks import hook_register
 
@@ -1,3 +1,4 @@
+from talktome import PORT
 from talktome.server import mcp
 
-mcp.run(transport="http", host="0.0.0.0", port=3456)
+mcp.run(transport="http", host="0.0.0.0", port=PORT)
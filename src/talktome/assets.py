@@ -0,0 +1,100 @@
+import hashlib
+import os
+from pathlib import Path
+
+from starlette.responses import Response
+
+from talktome.responses import choose_encoding, compress
+
+# static files that ship next to this module and are served by the bridge
+ASSET_DIR = Path(__file__).parent
+MEDIA_TYPES = {
+    "dashboard.html": "text/html; charset=utf-8",
+    "dashboard.css": "text/css; charset=utf-8",
+    "dashboard.js": "text/javascript; charset=utf-8",
+}
+
+# the page itself is revalidated on every load, the fingerprinted assets never change
+PAGE_CACHE_CONTROL = "no-cache"
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# set TALKTOME_DEV=1 to pick up edits to the dashboard files without restarting
+DEV_MODE = os.environ.get("TALKTOME_DEV", "") == "1"
+
+# loaded assets keyed by file name, filled on first use
+_cache = {}
+
+
+# a file held in memory along with its precompressed variants
+class Asset:
+    def __init__(self, name, body, mtime, deps=None):
+        self.name = name
+        self.body = body
+        self.mtime = mtime
+        # fingerprints of the assets this one links to, only set for the page
+        self.deps = deps or {}
+        self.media_type = MEDIA_TYPES[name]
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        self.encoded = {"gzip": compress(body, "gzip"), "deflate": compress(body, "deflate")}
+
+    # the etag of one encoded variant, each gets its own since their bytes differ
+    def tag(self, encoding=None):
+        if not encoding:
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+
+# read a static file, rewriting the page so it links to fingerprinted assets
+def load(name):
+    path = ASSET_DIR / name
+    body = path.read_bytes()
+    deps = {}
+    if name == "dashboard.html":
+        for static in ("dashboard.css", "dashboard.js"):
+            deps[static] = get(static).etag
+            version = deps[static].strip('"')
+            body = body.replace(
+                f"/static/{static}".encode(), f"/static/{static}?v={version}".encode()
+            )
+    return Asset(name, body, path.stat().st_mtime, deps)
+
+
+# return a cached asset, loading it once or again after an edit in dev mode
+def get(name):
+    if name not in MEDIA_TYPES:
+        return None
+    asset = _cache.get(name)
+    if asset is not None and DEV_MODE:
+        # the page embeds the asset fingerprints so it goes stale with them
+        stale = (ASSET_DIR / name).stat().st_mtime != asset.mtime
+        if stale or any(get(dep).etag != etag for dep, etag in asset.deps.items()):
+            asset = None
+    if asset is None:
+        asset = load(name)
+        _cache[name] = asset
+    return asset
+
+
+# drop everything that has been loaded, used by tests
+def clear():
+    _cache.clear()
+
+
+# build a response for an asset honouring conditional and compressed requests
+# if-none-match uses the weak comparison, so a W/ prefix a proxy added still matches
+def respond(request, asset, cache_control):
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": asset.tag(encoding),
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if headers["ETag"] in tags:
+        return Response(status_code=304, headers=headers)
+    body = asset.body
+    if encoding:
+        body = asset.encoded[encoding]
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,295 @@
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# load generator for the bridge, simulates agents whose hooks poll their
+# mailbox, who message each other and hand out tasks, plus dashboard tabs
+# polling the overview. only uses the stdlib so it runs from an installed talktome
+
+# how often the dashboard polls, matches POLL in dashboard.js
+DASHBOARD_POLL_SECONDS = 3.0
+
+
+# nearest rank percentile over an already sorted list
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(samples)) - 1
+    return samples[max(0, min(len(samples) - 1, rank))]
+
+
+# thread safe store of latencies and errors per operation
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, op, seconds, ok=True):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(op, []).append(seconds)
+            else:
+                self.errors[op] = self.errors.get(op, 0) + 1
+                self.latencies.setdefault(op, [])
+
+    # per operation count, throughput and latency percentiles in milliseconds
+    def summary(self, elapsed):
+        result = {}
+        with self.lock:
+            ops = sorted(self.latencies)
+            for op in ops:
+                samples = sorted(self.latencies[op])
+                result[op] = {
+                    "count": len(samples),
+                    "errors": self.errors.get(op, 0),
+                    "per_sec": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                    "p50_ms": round(percentile(samples, 50) * 1000, 2),
+                    "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                    "p99_ms": round(percentile(samples, 99) * 1000, 2),
+                    "max_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+                }
+        return result
+
+
+# small http client bound to one bridge url that records every call
+class Client:
+    def __init__(self, url, recorder):
+        self.url = url
+        self.recorder = recorder
+
+    def call(self, op, endpoint, method="GET", data=None):
+        headers = {}
+        payload = None
+        if data is not None:
+            payload = json.dumps(data).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(
+            f"{self.url}{endpoint}", data=payload, headers=headers, method=method
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                body = json.loads(resp.read())
+            self.recorder.add(op, time.perf_counter() - start)
+            return body
+        except (urllib.error.URLError, OSError, ValueError):
+            self.recorder.add(op, time.perf_counter() - start, ok=False)
+            return None
+
+
+# one simulated claude code session, its hooks poll and it occasionally talks to peers
+def agent_loop(client, name, peers, args, stop, rng):
+    next_message = time.time() + rng.uniform(0, args.message_interval)
+    next_task = time.time() + rng.uniform(0, args.task_interval)
+    while not stop.is_set():
+        # what talktome hook-inbox does on every tool call past the cooldown
+        client.call("hook_peek", f"/peek/{name}")
+        pending = client.call("hook_pending_tasks", f"/tasks/{name}/pending")
+
+        now = time.time()
+        if now >= next_message:
+            peer = rng.choice(peers)
+            client.call(
+                "send_message",
+                "/send",
+                method="POST",
+                data={"sender": name, "peer": peer, "message": f"ping from {name} at {now}"},
+            )
+            client.call("read_mailbox", f"/read/{name}")
+            next_message = now + rng.expovariate(1 / args.message_interval)
+        if now >= next_task:
+            client.call(
+                "create_task",
+                "/task",
+                method="POST",
+                data={"agent": rng.choice(peers), "description": f"task from {name} at {now}"},
+            )
+            next_task = now + rng.expovariate(1 / args.task_interval)
+        # claim one pending task and finish it, like an agent working its queue
+        if pending:
+            task_id = pending[0]["id"]
+            client.call(
+                "claim_task", f"/task/{task_id}", method="PATCH", data={"status": "running"}
+            )
+            client.call(
+                "complete_task",
+                f"/task/{task_id}",
+                method="PATCH",
+                data={"status": "done", "result": "ok"},
+            )
+        stop.wait(rng.uniform(0.5, 1.5) * args.hook_interval)
+
+
+# one open dashboard tab, polls the same endpoints as dashboard.js
+def dashboard_loop(client, stop, rng):
+    stop.wait(rng.uniform(0, DASHBOARD_POLL_SECONDS))
+    while not stop.is_set():
+        client.call("dashboard_health", "/health")
+        client.call("dashboard_agents", "/agents")
+        client.call("dashboard_activity", "/activity")
+        client.call("dashboard_tasks", "/tasks")
+        stop.wait(DASHBOARD_POLL_SECONDS)
+
+
+def wait_for_health(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# environment for a benchmark bridge living entirely in the temp dir home. every
+# talktome setting of the caller is dropped, it could point the bridge at the
+# real database, a config file, peers to federate with or extra workers
+def bridge_env(home, port):
+    env = {k: v for k, v in os.environ.items() if not k.startswith("TALKTOME_")}
+    env["HOME"] = home
+    env["USERPROFILE"] = home
+    env["TALKTOME_PORT"] = str(port)
+    env["TALKTOME_DB"] = os.path.join(home, ".talktome", "bridge.db")
+    return env
+
+
+# start a bridge in a subprocess whose home directory, and so database, is a temp dir
+# python -m talktome runs the server directly, it never opens a browser
+def launch_bridge(home, port):
+    return subprocess.Popen(
+        [sys.executable, "-m", "talktome"],
+        env=bridge_env(home, port),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+# drive the bridge at url with the configured workload and return the summary
+def run_load(url, args):
+    recorder = Recorder()
+    client = Client(url, recorder)
+    names = [f"bench-agent-{i}" for i in range(args.agents)]
+    for name in names:
+        client.call(
+            "register", "/register", method="POST", data={"name": name, "path": f"/b/{name}"}
+        )
+
+    stop = threading.Event()
+    threads = []
+    for i, name in enumerate(names):
+        peers = [n for n in names if n != name] or [name]
+        rng = random.Random(args.seed + i)
+        threads.append(
+            threading.Thread(
+                target=agent_loop, args=(client, name, peers, args, stop, rng), daemon=True
+            )
+        )
+    for i in range(args.dashboards):
+        rng = random.Random(args.seed + 10_000 + i)
+        threads.append(
+            threading.Thread(target=dashboard_loop, args=(client, stop, rng), daemon=True)
+        )
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.perf_counter() - start)
+
+
+def print_summary(summary):
+    print(
+        f"{'operation':<20} {'count':>7} {'errors':>6} {'ops/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    for op, s in summary.items():
+        print(
+            f"{op:<20} {s['count']:>7} {s['errors']:>6} {s['per_sec']:>8.2f} "
+            f"{s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['max_ms']:>8.2f}"
+        )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="talktome bench", description="load test a bridge with simulated agents"
+    )
+    parser.add_argument("--agents", type=int, default=20, help="simulated agents")
+    parser.add_argument("--dashboards", type=int, default=2, help="open dashboard tabs")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument(
+        "--hook-interval", type=float, default=1.0, help="mean seconds between hook-inbox calls"
+    )
+    parser.add_argument(
+        "--message-interval", type=float, default=10.0, help="mean seconds between messages"
+    )
+    parser.add_argument(
+        "--task-interval", type=float, default=20.0, help="mean seconds between new tasks"
+    )
+    parser.add_argument("--url", default="", help="use an already running bridge instead")
+    parser.add_argument("--port", type=int, default=0, help="port for the launched bridge")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", default="", help="also write the summary to this file")
+    return parser.parse_args(argv)
+
+
+# entry point for talktome bench
+def main(argv=None):
+    args = parse_args(sys.argv[2:] if argv is None else argv)
+    proc = None
+    home = None
+    url = args.url.rstrip("/")
+    if not url:
+        home = tempfile.TemporaryDirectory(prefix="talktome-bench-")
+        port = args.port or free_port()
+        url = f"http://127.0.0.1:{port}"
+        proc = launch_bridge(home.name, port)
+        if not wait_for_health(url):
+            proc.kill()
+            print("bench bridge did not start")
+            return 1
+
+    try:
+        print(
+            f"benchmarking {url} with {args.agents} agents and {args.dashboards} dashboards "
+            f"for {args.duration:g}s"
+        )
+        summary = run_load(url, args)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        if home is not None:
+            home.cleanup()
+
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "args": vars(args), "results": summary}, f, indent=2)
+    return 0
@@ -0,0 +1,38 @@
+import json
+import os
+
+# optional settings file, every key can also be given as a TALKTOME_<KEY> environment variable
+CONFIG_PATH = os.environ.get(
+    "TALKTOME_CONFIG", os.path.join(os.path.expanduser("~"), ".talktome", "config.json")
+)
+
+# parsed config file, read on first lookup
+_settings = None
+
+
+# read the config file once, a missing or broken file means no settings
+def load():
+    global _settings
+    if _settings is None:
+        try:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            _settings = data if isinstance(data, dict) else {}
+        except (OSError, json.JSONDecodeError):
+            _settings = {}
+    return _settings
+
+
+# look up a setting, the environment wins over the config file
+# environment values are strings, callers convert them as needed
+def get(key, default=None):
+    env = os.environ.get("TALKTOME_" + key.upper())
+    if env is not None:
+        return env
+    return load().get(key, default)
+
+
+# forget the parsed file so the next lookup reads it again, used by tests
+def reload():
+    global _settings
+    _settings = None
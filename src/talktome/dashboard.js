@@ -0,0 +1,918 @@
+(function () {
+    var POLL = 3000;
+
+    var state = {
+        selectedAgent: null,
+        mode: "task",
+        taskFilter: "all",
+        activityOpen: false,
+        agentNames: [],
+        agentPaths: {},
+        agentsJSON: "",
+        activityJSON: "",
+        contentJSON: "",
+        cachedTasks: [],
+        cachedPeek: null,
+        connected: true,
+        failCount: 0,
+    };
+
+    function txt(el, s) {
+        el.textContent = s || "";
+    }
+
+    function mk(t, c) {
+        var e = document.createElement(t);
+        if (c) e.className = c;
+        return e;
+    }
+
+    function ago(ts) {
+        var s = Math.floor(Date.now() / 1000 - ts);
+        if (s < 5) return "now";
+        if (s < 60) return s + "s";
+        if (s < 3600) return Math.floor(s / 60) + "m";
+        if (s < 86400)
+            return Math.floor(s / 3600) + "h";
+        return Math.floor(s / 86400) + "d";
+    }
+
+    // large values arrive as a preview, the rest is fetched on click
+    function addBlobLink(el, ref) {
+        var more = mk("span", "blob-more");
+        txt(more, " … show full (" + Math.ceil(ref.size / 1024) + " KB)");
+        more.onclick = function () {
+            get("/blob/" + ref.hash).then(function (b) {
+                if (b) txt(el, b.value);
+            });
+        };
+        el.appendChild(more);
+    }
+
+    function get(u) {
+        return fetch(u)
+            .then(function (r) {
+                if (!r.ok) throw 0;
+                return r.json();
+            })
+            .catch(function () {
+                return null;
+            });
+    }
+
+    function shortPath(p) {
+        if (!p) return "";
+        var clean = p
+            .replace(/\\/g, "/")
+            .replace(/\/+$/, "");
+        var parts = clean.split("/");
+        if (parts.length >= 2)
+            return parts.slice(-2).join("/");
+        return parts[parts.length - 1] || "";
+    }
+
+    function escHtml(s) {
+        var d = document.createElement("div");
+        d.textContent = s;
+        return d.innerHTML;
+    }
+
+    function avatarColor(name) {
+        var colors = [
+            "#ff6b6b",
+            "#ffd93d",
+            "#6bcb77",
+            "#4d96ff",
+            "#ff922b",
+            "#845ef7",
+            "#20c997",
+            "#e64980",
+        ];
+        var hash = 0;
+        for (var i = 0; i < name.length; i++) {
+            hash =
+                name.charCodeAt(i) +
+                ((hash << 5) - hash);
+        }
+        return colors[Math.abs(hash) % colors.length];
+    }
+
+    function statusColor(s) {
+        if (s === "done") return "#00ff88";
+        if (s === "running") return "#ffcc00";
+        if (s === "failed") return "#ff3333";
+        return "rgba(255,255,255,0.25)";
+    }
+
+    // agent selection
+    function selectAgent(name) {
+        state.selectedAgent = name;
+        state.taskFilter = "all";
+        state.contentJSON = "";
+
+        var cards =
+            document.querySelectorAll(".agent-card");
+        for (var i = 0; i < cards.length; i++) {
+            cards[i].classList.remove("active");
+        }
+        if (name) {
+            var el = document.getElementById(
+                "sb-agent-" + name,
+            );
+            if (el) el.classList.add("active");
+        }
+
+        txt(
+            document.getElementById("content-title"),
+            name || "overview",
+        );
+        txt(
+            document.getElementById("content-sub"),
+            name
+                ? shortPath(
+                      state.agentPaths[name] || "",
+                  )
+                : "",
+        );
+
+        document.getElementById("cmd-agent").value =
+            name || "";
+        renderContent();
+    }
+
+    document
+        .getElementById("home-btn")
+        .addEventListener("click", function () {
+            selectAgent(null);
+        });
+
+    // activity accordion
+    document
+        .getElementById("activity-toggle")
+        .addEventListener("click", function () {
+            state.activityOpen = !state.activityOpen;
+            document
+                .getElementById("activity-toggle")
+                .classList.toggle(
+                    "open",
+                    state.activityOpen,
+                );
+            document
+                .getElementById("activity-body")
+                .classList.toggle(
+                    "open",
+                    state.activityOpen,
+                );
+        });
+
+    // command bar mode
+    function setMode(m) {
+        state.mode = m;
+        var taskBtn =
+            document.getElementById("mode-task");
+        var msgBtn =
+            document.getElementById("mode-msg");
+        var sendBtn =
+            document.getElementById("cmd-send");
+
+        taskBtn.className =
+            "cmdbar-mode-btn" +
+            (m === "task" ? " task-active" : "");
+        msgBtn.className =
+            "cmdbar-mode-btn" +
+            (m === "message" ? " msg-active" : "");
+        sendBtn.className =
+            "cmdbar-send " +
+            (m === "task" ? "task-mode" : "msg-mode");
+
+        document.getElementById(
+            "cmd-input",
+        ).placeholder =
+            m === "task"
+                ? "assign a task..."
+                : "send a message...";
+    }
+
+    document
+        .getElementById("mode-task")
+        .addEventListener("click", function () {
+            setMode("task");
+        });
+    document
+        .getElementById("mode-msg")
+        .addEventListener("click", function () {
+            setMode("message");
+        });
+
+    // polling
+    function setConnected(ok) {
+        var overlay =
+            document.getElementById("reconnect");
+        var dot = document.getElementById("hd");
+        if (ok) {
+            state.failCount = 0;
+            if (!state.connected) {
+                state.connected = true;
+                overlay.classList.remove("visible");
+                // force refresh all data on reconnect
+                state.agentsJSON = "";
+                state.activityJSON = "";
+                state.contentJSON = "";
+            }
+            dot.classList.add("on");
+        } else {
+            state.failCount++;
+            dot.classList.remove("on");
+            // show overlay after 2 consecutive failures
+            if (state.failCount >= 2) {
+                state.connected = false;
+                overlay.classList.add("visible");
+            }
+        }
+    }
+
+    function pollHealth() {
+        return get("/health").then(function (d) {
+            setConnected(
+                d && d.status === "ok",
+            );
+        });
+    }
+
+    function pollAgents() {
+        return get("/agents").then(function (data) {
+            if (!data) return;
+            var j = JSON.stringify(data);
+            if (j === state.agentsJSON) return;
+            state.agentsJSON = j;
+            txt(
+                document.getElementById(
+                    "agent-count",
+                ),
+                String(data.length),
+            );
+
+            state.agentNames = [];
+            state.agentPaths = {};
+            var list =
+                document.getElementById("agent-list");
+            list.innerHTML = "";
+
+            if (!data.length) {
+                var em = mk("div", "empty");
+                em.style.padding = "16px";
+                em.style.textAlign = "left";
+                em.style.fontSize = "0.65rem";
+                txt(em, "no agents online");
+                list.appendChild(em);
+                updateAgentSelect();
+                return;
+            }
+
+            for (var i = 0; i < data.length; i++) {
+                var a = data[i];
+                state.agentNames.push(a.name);
+                state.agentPaths[a.name] = a.path;
+
+                var card = mk("div", "agent-card");
+                card.id = "sb-agent-" + a.name;
+                if (state.selectedAgent === a.name) {
+                    card.classList.add("active");
+                }
+
+                (function (agentName) {
+                    card.addEventListener(
+                        "click",
+                        function () {
+                            selectAgent(agentName);
+                        },
+                    );
+                })(a.name);
+
+                var dot = mk("div", "agent-dot");
+                dot.classList.add(
+                    a.status === "active"
+                        ? "on"
+                        : "off",
+                );
+                card.appendChild(dot);
+
+                var info = mk("div", "agent-info");
+                var name = mk("div", "agent-name");
+                txt(name, a.name);
+                info.appendChild(name);
+
+                if (a.path) {
+                    var path = mk(
+                        "div",
+                        "agent-path",
+                    );
+                    txt(path, shortPath(a.path));
+                    info.appendChild(path);
+                }
+
+                card.appendChild(info);
+
+                if (a.mailbox_count > 0) {
+                    var badge = mk(
+                        "span",
+                        "agent-badge",
+                    );
+                    txt(badge, a.mailbox_count);
+                    card.appendChild(badge);
+                }
+
+                list.appendChild(card);
+            }
+            updateAgentSelect();
+        });
+    }
+
+    function updateAgentSelect() {
+        var sel =
+            document.getElementById("cmd-agent");
+        var cur = sel.value;
+        sel.innerHTML = "";
+        var def = mk("option");
+        def.value = "";
+        txt(def, "agent");
+        sel.appendChild(def);
+        for (
+            var i = 0;
+            i < state.agentNames.length;
+            i++
+        ) {
+            var opt = mk("option");
+            opt.value = state.agentNames[i];
+            txt(opt, state.agentNames[i]);
+            sel.appendChild(opt);
+        }
+        if (
+            cur &&
+            state.agentNames.indexOf(cur) >= 0
+        )
+            sel.value = cur;
+    }
+
+    function pollActivity() {
+        return get("/activity").then(function (data) {
+            if (!data) return;
+            var j = JSON.stringify(data);
+            if (j === state.activityJSON) return;
+            state.activityJSON = j;
+
+            txt(
+                document.getElementById(
+                    "activity-count",
+                ),
+                String(data.length),
+            );
+
+            var list = document.getElementById(
+                "activity-list",
+            );
+            list.innerHTML = "";
+
+            for (
+                var i = data.length - 1;
+                i >= 0;
+                i--
+            ) {
+                var it = data[i];
+                var item = mk(
+                    "div",
+                    "activity-item",
+                );
+                var tag = mk(
+                    "span",
+                    "activity-tag",
+                );
+                var text = mk(
+                    "span",
+                    "activity-text",
+                );
+                var time = mk(
+                    "span",
+                    "activity-time",
+                );
+                txt(time, ago(it.timestamp));
+
+                if (it.event === "register") {
+                    tag.classList.add("join");
+                    txt(tag, "join");
+                    txt(text, it.agent || "");
+                } else if (
+                    it.event === "message"
+                ) {
+                    tag.classList.add("msg");
+                    txt(tag, "msg");
+                    txt(
+                        text,
+                        (it.sender || "?") +
+                            " \u2192 " +
+                            (it.peer || "?"),
+                    );
+                } else if (
+                    it.event === "publish"
+                ) {
+                    tag.classList.add("msg");
+                    txt(tag, "pub");
+                    txt(
+                        text,
+                        (it.sender || "?") +
+                            " \u2192 #" +
+                            (it.topic || "?"),
+                    );
+                } else if (
+                    it.event === "task_created"
+                ) {
+                    tag.classList.add("task");
+                    txt(tag, "task");
+                    txt(
+                        text,
+                        (it.agent || "") +
+                            ": " +
+                            (it.description || ""),
+                    );
+                } else if (
+                    it.event === "task_updated"
+                ) {
+                    tag.classList.add("update");
+                    txt(tag, "upd");
+                    txt(
+                        text,
+                        (it.task_id || "") +
+                            " \u2192 " +
+                            (it.status || ""),
+                    );
+                } else {
+                    txt(tag, it.event);
+                }
+
+                item.appendChild(tag);
+                item.appendChild(text);
+                item.appendChild(time);
+                list.appendChild(item);
+            }
+        });
+    }
+
+    // content rendering
+    function renderContent() {
+        var agent = state.selectedAgent;
+
+        if (agent) {
+            Promise.all([
+                get("/peek/" + agent),
+                get("/tasks/" + agent),
+            ]).then(function (results) {
+                var peek = results[0] || {
+                    count: 0,
+                    messages: [],
+                };
+                var tasks = results[1] || [];
+                state.cachedTasks = tasks;
+                state.cachedPeek = peek;
+
+                var j = JSON.stringify([
+                    peek,
+                    tasks,
+                    state.taskFilter,
+                ]);
+                if (j === state.contentJSON) return;
+                state.contentJSON = j;
+
+                renderAgentView(peek, tasks);
+            });
+        } else {
+            get("/tasks").then(function (tasks) {
+                tasks = tasks || [];
+                state.cachedTasks = tasks;
+
+                var j = JSON.stringify([
+                    tasks,
+                    state.taskFilter,
+                ]);
+                if (j === state.contentJSON) return;
+                state.contentJSON = j;
+
+                renderOverview(tasks);
+            });
+        }
+    }
+
+    function renderOverview(tasks) {
+        var area =
+            document.getElementById("content-area");
+        area.innerHTML = "";
+
+        // stats row
+        var counts = {
+            pending: 0,
+            running: 0,
+            done: 0,
+            failed: 0,
+        };
+        for (var i = 0; i < tasks.length; i++) {
+            var s = tasks[i].status;
+            if (counts[s] !== undefined)
+                counts[s]++;
+        }
+
+        var stats = mk("div", "stats-row");
+        addStat(
+            stats,
+            "on",
+            state.agentNames.length + " agents",
+        );
+        addSep(stats);
+        addStat(
+            stats,
+            "pending",
+            counts.pending + " pending",
+        );
+        addSep(stats);
+        addStat(
+            stats,
+            "running",
+            counts.running + " running",
+        );
+        addSep(stats);
+        addStat(
+            stats,
+            "done",
+            counts.done + " done",
+        );
+        if (counts.failed > 0) {
+            addSep(stats);
+            addStat(
+                stats,
+                "failed",
+                counts.failed + " failed",
+            );
+        }
+        area.appendChild(stats);
+
+        // section label
+        var label = mk("div", "section-label");
+        txt(label, "tasks (" + tasks.length + ")");
+        area.appendChild(label);
+
+        // filter tabs
+        var tabsEl = mk("div", "filter-tabs");
+        tabsEl.id = "filter-tabs";
+        renderFilterTabs(tasks, tabsEl);
+        area.appendChild(tabsEl);
+
+        // task list
+        var listEl = mk("div", "");
+        listEl.id = "task-list";
+        renderTaskList(tasks, listEl);
+        area.appendChild(listEl);
+    }
+
+    function renderAgentView(peek, tasks) {
+        var area =
+            document.getElementById("content-area");
+        area.innerHTML = "";
+
+        // messages section
+        var msgLabel = mk("div", "section-label");
+        txt(
+            msgLabel,
+            "messages (" + peek.count + ")",
+        );
+        area.appendChild(msgLabel);
+
+        if (
+            !peek.messages ||
+            !peek.messages.length
+        ) {
+            var em = mk("div", "empty");
+            em.innerHTML =
+                "no messages<br><span class='empty-hint'>agents will reply here</span>";
+            area.appendChild(em);
+        } else {
+            for (
+                var i = 0;
+                i < peek.messages.length;
+                i++
+            ) {
+                area.appendChild(
+                    buildMsgCard(peek.messages[i]),
+                );
+            }
+        }
+
+        // tasks section
+        var section = mk("div", "tasks-section");
+        var label = mk("div", "section-label");
+        txt(label, "tasks (" + tasks.length + ")");
+        section.appendChild(label);
+
+        var tabsEl = mk("div", "filter-tabs");
+        tabsEl.id = "filter-tabs";
+        renderFilterTabs(tasks, tabsEl);
+        section.appendChild(tabsEl);
+
+        var listEl = mk("div", "");
+        listEl.id = "task-list";
+        renderTaskList(tasks, listEl);
+        section.appendChild(listEl);
+
+        area.appendChild(section);
+    }
+
+    function renderFilterTabs(tasks, container) {
+        var counts = {
+            all: tasks.length,
+            pending: 0,
+            running: 0,
+            done: 0,
+            failed: 0,
+        };
+        for (var i = 0; i < tasks.length; i++) {
+            var s = tasks[i].status;
+            if (counts[s] !== undefined)
+                counts[s]++;
+        }
+
+        container.innerHTML = "";
+        var filters = [
+            "all",
+            "pending",
+            "running",
+            "done",
+        ];
+        if (counts.failed > 0)
+            filters.push("failed");
+
+        for (var f = 0; f < filters.length; f++) {
+            var name = filters[f];
+            var btn = mk(
+                "button",
+                "filter-tab" +
+                    (state.taskFilter === name
+                        ? " active"
+                        : ""),
+            );
+            txt(
+                btn,
+                name + " (" + counts[name] + ")",
+            );
+            (function (filterName) {
+                btn.addEventListener(
+                    "click",
+                    function () {
+                        state.taskFilter =
+                            filterName;
+                        state.contentJSON = "";
+                        var tabsEl =
+                            document.getElementById(
+                                "filter-tabs",
+                            );
+                        var listEl =
+                            document.getElementById(
+                                "task-list",
+                            );
+                        if (tabsEl && listEl) {
+                            renderFilterTabs(
+                                state.cachedTasks,
+                                tabsEl,
+                            );
+                            renderTaskList(
+                                state.cachedTasks,
+                                listEl,
+                            );
+                        }
+                    },
+                );
+            })(name);
+            container.appendChild(btn);
+        }
+    }
+
+    function renderTaskList(tasks, container) {
+        container.innerHTML = "";
+        var filtered =
+            state.taskFilter === "all"
+                ? tasks
+                : tasks.filter(function (t) {
+                      return (
+                          t.status ===
+                          state.taskFilter
+                      );
+                  });
+
+        if (!filtered.length) {
+            var em = mk("div", "empty");
+            if (state.taskFilter === "all") {
+                em.innerHTML =
+                    "no tasks yet<br><span class='empty-hint'>select an agent and assign one below</span>";
+            } else {
+                txt(
+                    em,
+                    "no " +
+                        state.taskFilter +
+                        " tasks",
+                );
+            }
+            container.appendChild(em);
+            return;
+        }
+
+        for (
+            var i = 0;
+            i < filtered.length;
+            i++
+        ) {
+            container.appendChild(
+                buildTaskCard(filtered[i]),
+            );
+        }
+    }
+
+    function buildTaskCard(t) {
+        var card = mk("div", "task-card");
+        // status shown by dot + badge text only
+
+        // top row: status badge + task id
+        var top = mk("div", "task-top");
+        var badge = mk("span", "task-status-badge");
+        badge.style.color = statusColor(t.status);
+        var dot = mk(
+            "span",
+            "task-status-dot" +
+                (t.status === "running"
+                    ? " running"
+                    : ""),
+        );
+        dot.style.background = statusColor(t.status);
+        badge.appendChild(dot);
+        var statusText = document.createTextNode(
+            " " + t.status,
+        );
+        badge.appendChild(statusText);
+        top.appendChild(badge);
+
+        var tid = mk("span", "task-id");
+        txt(tid, t.id);
+        top.appendChild(tid);
+        card.appendChild(top);
+
+        // agent name
+        var agent = mk("div", "task-agent");
+        txt(agent, t.agent);
+        card.appendChild(agent);
+
+        // description
+        var desc = mk("div", "task-desc");
+        txt(desc, t.description);
+        card.appendChild(desc);
+
+        // result block
+        if (t.result) {
+            var res = mk(
+                "div",
+                "task-result-block",
+            );
+            txt(res, t.result);
+            if (t.result_blob) addBlobLink(res, t.result_blob);
+            card.appendChild(res);
+        }
+
+        // timestamp
+        var tm = mk("div", "task-time");
+        txt(tm, ago(t.created_at));
+        card.appendChild(tm);
+
+        return card;
+    }
+
+    function buildMsgCard(m) {
+        var card = mk("div", "msg-card");
+
+        // avatar
+        var senderName = m.from || "unknown";
+        var avatar = mk("div", "msg-avatar");
+        avatar.style.background =
+            avatarColor(senderName);
+        txt(avatar, senderName.charAt(0));
+        card.appendChild(avatar);
+
+        // content
+        var content = mk("div", "msg-content");
+
+        var header = mk("div", "msg-header");
+        var sender = mk("span", "msg-sender");
+        txt(sender, senderName);
+        header.appendChild(sender);
+        var time = mk("span", "msg-time");
+        txt(time, ago(m.timestamp));
+        header.appendChild(time);
+        content.appendChild(header);
+
+        var body = mk("div", "msg-body");
+        txt(body, m.message);
+        if (m.blob) addBlobLink(body, m.blob);
+        content.appendChild(body);
+
+        card.appendChild(content);
+        return card;
+    }
+
+    function addStat(parent, cls, text) {
+        var span = mk("span", "stat");
+        var dot = mk("span", "stat-dot " + cls);
+        span.appendChild(dot);
+        span.appendChild(
+            document.createTextNode(" " + text),
+        );
+        parent.appendChild(span);
+    }
+
+    function addSep(parent) {
+        var sep = mk("span", "stat-sep");
+        txt(sep, "\u00b7");
+        parent.appendChild(sep);
+    }
+
+    // send command
+    function send() {
+        var sel =
+            document.getElementById("cmd-agent");
+        var inp =
+            document.getElementById("cmd-input");
+        var agent = sel.value;
+        var text = inp.value.trim();
+        if (!agent || !text) return;
+
+        if (state.mode === "task") {
+            fetch("/task", {
+                method: "POST",
+                headers: {
+                    "Content-Type":
+                        "application/json",
+                },
+                body: JSON.stringify({
+                    agent: agent,
+                    description: text,
+                }),
+            })
+                .then(function () {
+                    inp.value = "";
+                    tick();
+                })
+                .catch(function () {});
+        } else {
+            fetch("/send", {
+                method: "POST",
+                headers: {
+                    "Content-Type":
+                        "application/json",
+                },
+                body: JSON.stringify({
+                    sender: "dashboard",
+                    peer: agent,
+                    message: text,
+                }),
+            })
+                .then(function () {
+                    inp.value = "";
+                    tick();
+                })
+                .catch(function () {});
+        }
+    }
+
+    document
+        .getElementById("cmd-send")
+        .addEventListener("click", send);
+    document
+        .getElementById("cmd-input")
+        .addEventListener("keydown", function (e) {
+            if (e.key === "Enter") send();
+        });
+
+    function tick() {
+        pollHealth();
+        pollAgents();
+        pollActivity();
+        renderContent();
+    }
+
+    // register dashboard as a peer so agents can message it
+    fetch("/register", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+            name: "dashboard",
+            path: "dashboard",
+        }),
+    }).then(function () {
+        tick();
+    });
+    setInterval(tick, POLL);
+})();
@@ -1,25 +1,197 @@
+import hashlib
+import itertools
 import json
 import os
 import sqlite3
+import threading
 import time
+import uuid
+import zlib
+
+from talktome import config, metrics, profiler
 
 # store the database in the user home directory so it persists across projects
-DB_DIR = os.path.join(os.path.expanduser("~"), ".talktome")
-DB_PATH = os.path.join(DB_DIR, "bridge.db")
+# the db setting (TALKTOME_DB or --db) points it somewhere else, and ":memory:"
+# keeps everything in an in-memory database that lives as long as the process
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".talktome", "bridge.db")
+MEMORY = ":memory:"
+
+# resolved on first use so importing this module never touches the disk
+_path = None
+_uri = None
+_ready = False
+_init_lock = threading.Lock()
+# in-memory databases vanish with their last connection, this one keeps it alive
+_keeper = None
+# each in-memory database gets its own name so databases opened with use() never share state
+_memory_ids = itertools.count(1)
+
+
+# pragma profiles applied to every connection, picked with the db_profile setting
+# durable fsyncs on every commit, fast only fsyncs at checkpoints which in wal mode
+# can lose the last commits on power loss but never corrupts the database
+PRAGMA_PROFILES = {
+    "durable": {
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+    "fast": {
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+}
+DEFAULT_PROFILE = "fast"
+
+# resolved pragmas, worked out on the first connection
+_pragmas = None
+
+
+# resolve the pragma profile from TALKTOME_DB_PROFILE or db_profile in the config file,
+# individual values can be overridden with a pragmas object in the config file
+def pragmas():
+    global _pragmas
+    if _pragmas is None:
+        name = config.get("db_profile", DEFAULT_PROFILE)
+        if name not in PRAGMA_PROFILES:
+            raise ValueError(
+                f"unknown db profile '{name}', expected one of {', '.join(PRAGMA_PROFILES)}"
+            )
+        resolved = dict(PRAGMA_PROFILES[name])
+        overrides = config.get("pragmas", {})
+        if isinstance(overrides, dict):
+            for key, value in overrides.items():
+                # values end up in a pragma statement so only plain words and numbers are allowed
+                if key in resolved and str(value).lstrip("-").isalnum():
+                    resolved[key] = value
+        _pragmas = resolved
+    return _pragmas
+
+
+# switch profile at runtime, used by tests and benchmarks
+def use_profile(name):
+    global _pragmas
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(
+            f"unknown db profile '{name}', expected one of {', '.join(PRAGMA_PROFILES)}"
+        )
+    _pragmas = dict(PRAGMA_PROFILES[name])
+
+
+# the database file in use, or ":memory:"
+def path():
+    global _path
+    if _path is None:
+        _path = str(config.get("db") or DEFAULT_PATH)
+        if _path != MEMORY:
+            _path = os.path.abspath(os.path.expanduser(_path))
+    return _path
+
+
+def is_memory():
+    return path() == MEMORY
+
+
+# the name sqlite opens, in-memory databases use the memdb vfs so every
+# connection in the process sees the same data. unlike a shared cache, memdb
+# locks the whole database like a file does, so the busy timeout makes writers
+# wait for each other instead of failing with database table is locked
+def _target():
+    global _uri
+    if not is_memory():
+        return path(), False
+    if _uri is None:
+        _uri = f"file:/talktome-{os.getpid()}-{next(_memory_ids)}?vfs=memdb"
+    return _uri, True
+
+
+# bumped whenever the database is swapped or wiped, in-memory indexes built
+# from it compare this to know they have to be rebuilt
+_epoch = 0
+
+
+def epoch():
+    return _epoch
+
+
+# switch to another database, none goes back to the configured one. the schema
+# is created again on the next connect, used by tests, benchmarks and the cli
+def use(new_path=None):
+    global _path, _uri, _ready, _keeper, _epoch
+    with _init_lock:
+        if _keeper is not None:
+            _keeper.close()
+            _keeper = None
+        _path = None
+        _uri = None
+        _ready = False
+        if new_path is not None:
+            _path = new_path if new_path == MEMORY else os.path.abspath(new_path)
+        _epoch += 1
+    _agents_changed()
+
+
+# open a raw connection with the pragmas applied, without creating the schema
+def _open():
+    target, uri = _target()
+    if not uri:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+    metrics.DB_CONNECTIONS.inc()
+    settings = pragmas()
+    # the busy timeout makes writers wait for the lock instead of failing with database is locked
+    conn = sqlite3.connect(
+        target,
+        timeout=int(settings["busy_timeout"]) / 1000,
+        factory=profiler.ProfiledConnection,
+        uri=uri,
+        # the in-memory keeper may be closed by use() from another thread
+        check_same_thread=not uri,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    for name, value in settings.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
 
 
 # open a connection to the sqlite database with wal mode for concurrency
+# the tables are created on the first connect instead of at import time
 def connect():
-    os.makedirs(DB_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    return conn
+    if not _ready:
+        init()
+    return _open()
 
 
-# create all tables if they do not already exist
+# record the latency of a db operation under its function name
+def timed(fn):
+    return metrics.timed(metrics.DB_DURATION, op=fn.__name__)(fn)
+
+
+# create all tables if they do not already exist, safe to call from several threads
 def init():
-    conn = connect()
+    global _ready, _keeper
+    with _init_lock:
+        if _ready:
+            return
+        conn = _open()
+        _create_tables(conn)
+        if is_memory():
+            _keeper = conn
+        else:
+            conn.close()
+        _ready = True
+
+
+def _create_tables(conn):
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS agents (
             name TEXT PRIMARY KEY,
@@ -36,13 +208,22 @@ def init():
             receiver TEXT NOT NULL,
             message TEXT NOT NULL,
             timestamp REAL NOT NULL,
-            read INTEGER NOT NULL DEFAULT 0
+            read INTEGER NOT NULL DEFAULT 0,
+            thread_id TEXT,
+            reply_to INTEGER,
+            reply_bridge TEXT,
+            blob TEXT,
+            expires_at REAL
         );
 
         CREATE TABLE IF NOT EXISTS context (
             owner TEXT NOT NULL,
             key TEXT NOT NULL,
             value TEXT NOT NULL,
+            blob TEXT,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL DEFAULT 0,
+            expires_at REAL,
             PRIMARY KEY (owner, key)
         );
 
@@ -53,7 +234,15 @@ def init():
             status TEXT NOT NULL DEFAULT 'pending',
             result TEXT,
             created_at REAL NOT NULL,
-            updated_at REAL NOT NULL
+            updated_at REAL NOT NULL,
+            result_blob TEXT,
+            origin TEXT,
+            remote_id TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS context_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
         );
 
         CREATE TABLE IF NOT EXISTS activity (
@@ -62,12 +251,216 @@ def init():
             timestamp REAL NOT NULL,
             data TEXT NOT NULL DEFAULT '{}'
         );
+
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            encoding TEXT NOT NULL DEFAULT 'identity'
+        );
+
+        CREATE TABLE IF NOT EXISTS topic_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            message TEXT NOT NULL,
+            timestamp REAL NOT NULL,
+            blob TEXT,
+            expires_at REAL
+        );
+
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            agent TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            cursor INTEGER NOT NULL DEFAULT 0,
+            subscribed_at REAL NOT NULL,
+            PRIMARY KEY (agent, topic)
+        );
+
+        CREATE TABLE IF NOT EXISTS workers (
+            pid INTEGER PRIMARY KEY,
+            port INTEGER NOT NULL,
+            started_at REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS remote_agents (
+            name TEXT PRIMARY KEY,
+            bridge TEXT NOT NULL,
+            status TEXT NOT NULL,
+            last_seen REAL NOT NULL,
+            synced_at REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bridge TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            status INTEGER,
+            response TEXT,
+            fingerprint TEXT,
+            claimed_at REAL NOT NULL DEFAULT 0,
+            expires_at REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS federation_delivered (
+            origin TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            received_at REAL NOT NULL,
+            PRIMARY KEY (origin, id)
+        );
     """)
-    conn.close()
+    _migrate(conn)
+    conn.executescript("""
+        INSERT OR IGNORE INTO context_seq (id, version)
+            SELECT 1, COALESCE(MAX(version), 0) FROM context;
+        CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages (thread_id, id);
+        CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages (receiver, id) WHERE read=0;
+        CREATE INDEX IF NOT EXISTS idx_agents_presence ON agents (status, last_seen);
+        CREATE INDEX IF NOT EXISTS idx_context_version ON context (version);
+        CREATE INDEX IF NOT EXISTS idx_messages_expiry ON messages (expires_at)
+            WHERE expires_at IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_context_expiry ON context (expires_at)
+            WHERE expires_at IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_topic_messages ON topic_messages (topic, id);
+        CREATE INDEX IF NOT EXISTS idx_topic_messages_expiry ON topic_messages (expires_at)
+            WHERE expires_at IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_topic ON subscriptions (topic);
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expiry ON idempotency_keys (expires_at);
+        CREATE INDEX IF NOT EXISTS idx_remote_agents_bridge ON remote_agents (bridge);
+        CREATE INDEX IF NOT EXISTS idx_outbox_bridge ON outbox (bridge, id);
+    """)
+    _create_search(conn)
+
+
+# full text indexes over the inline text of messages, tasks and context, kept in
+# sync by triggers. they are external content tables, the text itself is only
+# stored once in the source table. offloaded values are indexed by their preview
+SEARCH_INDEXES = {
+    "messages_fts": ("messages", "id", ("message",)),
+    "tasks_fts": ("tasks", "rowid", ("description", "result")),
+    "context_fts": ("context", "rowid", ("key", "value")),
+}
+
+# whether this sqlite build has fts5, checked when the tables are created
+_fts = None
+
+
+def _create_search(conn):
+    global _fts
+    existing = {
+        r["name"] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    }
+    try:
+        for fts, (table, rowid, columns) in SEARCH_INDEXES.items():
+            cols = ", ".join(columns)
+            new = ", ".join(f"new.{c}" for c in columns)
+            old = ", ".join(f"old.{c}" for c in columns)
+            conn.executescript(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {cols}, content='{table}', content_rowid='{rowid}'
+                );
+                CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts} (rowid, {cols}) VALUES (new.{rowid}, {new});
+                END;
+                CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.{rowid}, {old});
+                END;
+                CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {cols} ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.{rowid}, {old});
+                    INSERT INTO {fts} (rowid, {cols}) VALUES (new.{rowid}, {new});
+                END;
+            """)
+            # rows written before the index existed
+            if fts not in existing:
+                conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        conn.commit()
+        _fts = True
+    except sqlite3.OperationalError:
+        # built without fts5, everything else keeps working and search reports it
+        conn.rollback()
+        _fts = False
+
+
+# columns added after the first release, create table if not exists leaves
+# older databases without them so they are added here
+MIGRATIONS = {
+    "messages": [
+        ("thread_id", "TEXT"),
+        ("reply_to", "INTEGER"),
+        ("blob", "TEXT"),
+        ("expires_at", "REAL"),
+        ("reply_bridge", "TEXT"),
+    ],
+    "tasks": [("result_blob", "TEXT"), ("origin", "TEXT"), ("remote_id", "TEXT")],
+    "context": [
+        ("blob", "TEXT"),
+        ("version", "INTEGER NOT NULL DEFAULT 0"),
+        ("updated_at", "REAL NOT NULL DEFAULT 0"),
+        ("expires_at", "REAL"),
+    ],
+    "blobs": [("encoding", "TEXT NOT NULL DEFAULT 'identity'")],
+    "idempotency_keys": [("claimed_at", "REAL NOT NULL DEFAULT 0"), ("fingerprint", "TEXT")],
+}
+
+
+def _migrate(conn):
+    for table, columns in MIGRATIONS.items():
+        existing = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns:
+            if name not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+                except sqlite3.OperationalError as e:
+                    # another process starting against the same file added it first
+                    if "duplicate column" not in str(e):
+                        raise
+    conn.commit()
 
 
 # registry operations, manage agent registration and status
+
+# bumped after every write to the agents table so in-process caches of it
+# can tell they are out of date without a query
+_agents_generation = 0
+
+
+def _agents_changed():
+    global _agents_generation
+    _agents_generation += 1
+
+
+def agents_generation():
+    return _agents_generation
+
+
+def _agent(row):
+    return {
+        "name": row["name"],
+        "path": row["path"],
+        "status": row["status"],
+        "registered_at": row["registered_at"],
+        "last_seen": row["last_seen"],
+        "metadata": json.loads(row["metadata"]),
+    }
+
+
 # register or update an agent with its name and project path
+@timed
 def register(name, path, metadata=None):
     now = time.time()
     entry = {
@@ -89,37 +482,44 @@ def register(name, path, metadata=None):
     )
     conn.commit()
     conn.close()
+    _agents_changed()
     return entry
 
 
 # remove an agent from the registry by name
+@timed
 def deregister(name):
     conn = connect()
     cursor = conn.execute("DELETE FROM agents WHERE name=?", (name,))
     conn.commit()
     deleted = cursor.rowcount > 0
     conn.close()
+    _agents_changed()
     return deleted
 
 
 # fetch a single agent record by name, returns none if not found
+@timed
 def get_agent(name):
     conn = connect()
     row = conn.execute("SELECT * FROM agents WHERE name=?", (name,)).fetchone()
     conn.close()
     if row is None:
         return None
-    return {
-        "name": row["name"],
-        "path": row["path"],
-        "status": row["status"],
-        "registered_at": row["registered_at"],
-        "last_seen": row["last_seen"],
-        "metadata": json.loads(row["metadata"]),
-    }
+    return _agent(row)
+
+
+# every agent record keyed by name, what the registry cache is built from
+@timed
+def get_agents():
+    conn = connect()
+    rows = conn.execute("SELECT * FROM agents ORDER BY name").fetchall()
+    conn.close()
+    return {r["name"]: _agent(r) for r in rows}
 
 
 # return a sorted list of all registered agent names
+@timed
 def list_agents():
     conn = connect()
     rows = conn.execute("SELECT name FROM agents ORDER BY name").fetchall()
@@ -128,6 +528,7 @@ def list_agents():
 
 
 # change an agents status and update its last seen timestamp
+@timed
 def update_status(name, status):
     conn = connect()
     cursor = conn.execute(
@@ -137,10 +538,51 @@ def update_status(name, status):
     conn.commit()
     updated = cursor.rowcount > 0
     conn.close()
+    _agents_changed()
+    return updated
+
+
+# record heartbeats from a name to timestamp mapping in one transaction, a
+# heartbeat brings a stale or inactive agent back to active. one older than
+# last_seen is dropped so a deregister that landed after it is not undone
+@timed
+def touch_agents(seen):
+    conn = connect()
+    cursor = conn.executemany(
+        "UPDATE agents SET last_seen=?, status='active' WHERE name=? AND last_seen < ?",
+        ((ts, name, ts) for name, ts in seen.items()),
+    )
+    conn.commit()
+    updated = cursor.rowcount
+    conn.close()
+    if updated:
+        _agents_changed()
     return updated
 
 
+# mark active agents not seen for stale_after seconds as stale, and stale ones
+# not seen for inactive_after seconds as inactive, returns how many moved to each
+@timed
+def mark_stale(stale_after, inactive_after):
+    now = time.time()
+    conn = connect()
+    stale = conn.execute(
+        "UPDATE agents SET status='stale' WHERE status='active' AND last_seen < ?",
+        (now - stale_after,),
+    ).rowcount
+    inactive = conn.execute(
+        "UPDATE agents SET status='inactive' WHERE status='stale' AND last_seen < ?",
+        (now - inactive_after,),
+    ).rowcount
+    conn.commit()
+    conn.close()
+    if stale or inactive:
+        _agents_changed()
+    return {"stale": stale, "inactive": inactive}
+
+
 # replace the metadata json blob for an agent
+@timed
 def update_metadata(name, metadata):
     conn = connect()
     cursor = conn.execute(
@@ -150,10 +592,12 @@ def update_metadata(name, metadata):
     conn.commit()
     updated = cursor.rowcount > 0
     conn.close()
+    _agents_changed()
     return updated
 
 
 # check if an agent with this name exists in the registry
+@timed
 def is_registered(name):
     conn = connect()
     row = conn.execute("SELECT 1 FROM agents WHERE name=?", (name,)).fetchone()
@@ -162,6 +606,7 @@ def is_registered(name):
 
 
 # return the total number of registered agents
+@timed
 def agent_count():
     conn = connect()
     row = conn.execute("SELECT COUNT(*) as c FROM agents").fetchone()
@@ -169,54 +614,282 @@ def agent_count():
     return row["c"]
 
 
+# expiry, messages and context entries can carry a ttl in seconds. expired rows
+# are hidden from reads right away and deleted in batches by sweep_expired
+
+
+def _expires_at(ttl, now):
+    return now + ttl if ttl and ttl > 0 else None
+
+
+# sql condition for rows that have not expired, takes the current time as parameter
+def _live(alias):
+    return f"({alias}.expires_at IS NULL OR {alias}.expires_at > ?)"
+
+
+# blob operations, large message bodies, task results and context values are
+# stored once in the blobs table keyed by their sha256, and the row keeps a
+# short preview plus the hash so polls and listings stay small
+
+# values over this many utf-8 bytes are offloaded, zero or less turns it off
+BLOB_THRESHOLD = 4096
+# characters of an offloaded value kept inline
+PREVIEW_CHARS = 280
+
+
+def blob_threshold():
+    return int(config.get("blob_threshold", BLOB_THRESHOLD))
+
+
+# blobs are zlib compressed unless blob_compression is "none", the encoding
+# column records how each one was stored so reads decompress transparently
+BLOB_COMPRESSION = "zlib"
+COMPRESSION_LEVEL = 6
+
+
+def _encode(data):
+    if str(config.get("blob_compression", BLOB_COMPRESSION)) == "zlib":
+        packed = zlib.compress(data, COMPRESSION_LEVEL)
+        # keep it raw when compressing does not pay off, e.g. for random ids
+        if len(packed) < len(data):
+            return packed, "zlib"
+    return data, "identity"
+
+
+def _decode(data, encoding):
+    data = bytes(data)
+    if encoding == "zlib":
+        data = zlib.decompress(data)
+    return data.decode()
+
+
+# the inline form of a value, shortened when it is large enough to be offloaded
+def preview(value):
+    threshold = blob_threshold()
+    if value is None or threshold <= 0 or len(value.encode()) <= threshold:
+        return value
+    return value[:PREVIEW_CHARS]
+
+
+# store a large value in the blobs table inside the callers transaction,
+# returns the inline value and the blob hash, or the value and none when it is small
+def _offload(conn, value):
+    if value is None:
+        return None, None
+    data = value.encode()
+    threshold = blob_threshold()
+    if threshold <= 0 or len(data) <= threshold:
+        return value, None
+    digest = hashlib.sha256(data).hexdigest()
+    # take the write lock before looking, otherwise the blob gc could delete an
+    # orphaned copy between the check and the insert of the row pointing at it
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    # identical payloads sent to many peers are stored, and compressed, once
+    if conn.execute("SELECT 1 FROM blobs WHERE hash=?", (digest,)).fetchone() is None:
+        stored, encoding = _encode(data)
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (hash, size, data, created_at, encoding) VALUES (?, ?, ?, ?, ?)",
+            (digest, len(data), stored, time.time(), encoding),
+        )
+    return value[:PREVIEW_CHARS], digest
+
+
+def _blob_ref(digest, size):
+    if not digest:
+        return None
+    return {"hash": digest, "size": size}
+
+
+# full values for a set of blob hashes
+def _load_blobs(conn, hashes):
+    hashes = [h for h in set(hashes) if h]
+    if not hashes:
+        return {}
+    marks = ",".join("?" * len(hashes))
+    rows = conn.execute(f"SELECT hash, data, encoding FROM blobs WHERE hash IN ({marks})", hashes)
+    return {r["hash"]: _decode(r["data"], r["encoding"]) for r in rows}
+
+
+# fetch a blob by hash, returns none if it does not exist
+@timed
+def get_blob(digest):
+    conn = connect()
+    row = conn.execute("SELECT size, data, encoding FROM blobs WHERE hash=?", (digest,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return {"hash": digest, "size": row["size"], "value": _decode(row["data"], row["encoding"])}
+
+
+# delete blobs no message, task or context value points at anymore
+# a single write statement, writers that offload hold the write lock from
+# the moment they find an existing blob until their reference is committed
+@timed
+def gc_blobs():
+    conn = connect()
+    cursor = conn.execute(
+        """DELETE FROM blobs WHERE hash NOT IN (
+               SELECT blob FROM messages WHERE blob IS NOT NULL
+               UNION SELECT blob FROM topic_messages WHERE blob IS NOT NULL
+               UNION SELECT result_blob FROM tasks WHERE result_blob IS NOT NULL
+               UNION SELECT blob FROM context WHERE blob IS NOT NULL)"""
+    )
+    conn.commit()
+    deleted = cursor.rowcount
+    conn.close()
+    return deleted
+
+
 # queue operations, store and retrieve messages between agents
+MESSAGE_COLUMNS = (
+    "m.id, m.sender, m.message, m.timestamp, m.thread_id, m.reply_to, m.reply_bridge,"
+    " m.blob, b.size AS blob_size"
+)
+MESSAGE_FROM = "messages m LEFT JOIN blobs b ON b.hash = m.blob"
+
+
+def _message(row):
+    entry = {
+        "id": row["id"],
+        "from": row["sender"],
+        "message": row["message"],
+        "timestamp": row["timestamp"],
+        "thread_id": row["thread_id"],
+        "reply_to": row["reply_to"],
+    }
+    if row["reply_bridge"]:
+        entry["reply_bridge"] = row["reply_bridge"]
+    if row["blob"]:
+        entry["blob"] = _blob_ref(row["blob"], row["blob_size"])
+    return entry
+
+
+# unread messages for an agent, optionally only the ones in one thread
+def _unread(conn, agent, thread_id=None):
+    if thread_id:
+        return conn.execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM {MESSAGE_FROM}"
+            f" WHERE m.receiver=? AND m.read=0 AND m.thread_id=? AND {_live('m')} ORDER BY m.id",
+            (agent, thread_id, time.time()),
+        ).fetchall()
+    return conn.execute(
+        f"SELECT {MESSAGE_COLUMNS} FROM {MESSAGE_FROM}"
+        f" WHERE m.receiver=? AND m.read=0 AND {_live('m')} ORDER BY m.id",
+        (agent, time.time()),
+    ).fetchall()
+
+
 # insert a new message into the mailbox for the receiver
-def send_message(sender, receiver, message):
+# a message without a thread starts a new one, replies pass the thread along.
+# a reply that came from a peer bridge names it, reply_to is an id over there
+@timed
+def send_message(
+    sender, receiver, message, thread_id=None, reply_to=None, ttl=None, reply_bridge=None
+):
     now = time.time()
-    entry = {"from": sender, "message": message, "timestamp": now}
+    thread_id = thread_id or uuid.uuid4().hex[:12]
     conn = connect()
-    conn.execute(
-        "INSERT INTO messages (sender, receiver, message, timestamp) VALUES (?, ?, ?, ?)",
-        (sender, receiver, message, now),
+    inline, digest = _offload(conn, message)
+    cursor = conn.execute(
+        "INSERT INTO messages (sender, receiver, message, timestamp, thread_id, reply_to, reply_bridge, blob, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            sender,
+            receiver,
+            inline,
+            now,
+            thread_id,
+            reply_to,
+            reply_bridge,
+            digest,
+            _expires_at(ttl, now),
+        ),
     )
     conn.commit()
     conn.close()
+    entry = {
+        "id": cursor.lastrowid,
+        "from": sender,
+        "message": message,
+        "timestamp": now,
+        "thread_id": thread_id,
+        "reply_to": reply_to,
+    }
+    if reply_bridge:
+        entry["reply_bridge"] = reply_bridge
+    if digest:
+        entry["blob"] = _blob_ref(digest, len(message.encode()))
     return entry
 
 
-# read all unread messages for an agent and mark them as read
-def read_messages(agent):
+# sender and thread of a message, none when it does not exist
+@timed
+def message_origin(message_id):
+    conn = connect()
+    row = conn.execute(
+        "SELECT sender, thread_id FROM messages WHERE id=?", (message_id,)
+    ).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+# answer a message, the reply goes back to its sender in the same thread
+# returns none when the original message does not exist
+@timed
+def reply_message(sender, message_id, message):
+    row = message_origin(message_id)
+    if row is None:
+        return None
+    # messages from before threading have no thread, the reply starts one
+    thread_id = row["thread_id"] or uuid.uuid4().hex[:12]
+    entry = send_message(sender, row["sender"], message, thread_id=thread_id, reply_to=message_id)
+    entry["to"] = row["sender"]
+    return entry
+
+
+# every message in a thread oldest first, read or not
+# large messages come back as a preview with their blob reference
+@timed
+def get_thread(thread_id):
     conn = connect()
     rows = conn.execute(
-        "SELECT sender, message, timestamp FROM messages WHERE receiver=? AND read=0 ORDER BY id",
-        (agent,),
+        f"SELECT {MESSAGE_COLUMNS}, m.receiver FROM {MESSAGE_FROM} WHERE m.thread_id=? ORDER BY m.id",
+        (thread_id,),
     ).fetchall()
-    # mark all fetched messages as read so they are not returned again
-    conn.execute(
-        "UPDATE messages SET read=1 WHERE receiver=? AND read=0",
-        (agent,),
-    )
+    conn.close()
+    return [dict(_message(r), to=r["receiver"]) for r in rows]
+
+
+# read all unread messages for an agent and mark them as read
+# reading is the on demand fetch, so offloaded messages come back in full
+@timed
+def read_messages(agent, thread_id=None):
+    conn = connect()
+    rows = _unread(conn, agent, thread_id)
+    # mark exactly the fetched messages as read so they are not returned again
+    # and anything that arrived in between stays unread
+    conn.executemany("UPDATE messages SET read=1 WHERE id=?", ((r["id"],) for r in rows))
     conn.commit()
+    full = _load_blobs(conn, (r["blob"] for r in rows))
     conn.close()
-    return [
-        {"from": r["sender"], "message": r["message"], "timestamp": r["timestamp"]} for r in rows
-    ]
+    messages = [_message(r) for r in rows]
+    for entry in messages:
+        if "blob" in entry and entry["blob"]["hash"] in full:
+            entry["message"] = full[entry["blob"]["hash"]]
+    return messages
 
 
-# peek at unread messages without marking them as read
-def peek_messages(agent):
+# peek at unread messages without marking them as read, large ones as previews
+@timed
+def peek_messages(agent, thread_id=None):
     conn = connect()
-    rows = conn.execute(
-        "SELECT sender, message, timestamp FROM messages WHERE receiver=? AND read=0 ORDER BY id",
-        (agent,),
-    ).fetchall()
+    rows = _unread(conn, agent, thread_id)
     conn.close()
-    return [
-        {"from": r["sender"], "message": r["message"], "timestamp": r["timestamp"]} for r in rows
-    ]
+    return [_message(r) for r in rows]
 
 
 # mark all unread messages for an agent as read without returning them
+@timed
 def clear_messages(agent):
     conn = connect()
     cursor = conn.execute(
@@ -230,105 +903,301 @@ def clear_messages(agent):
 
 
 # count the number of unread messages waiting for an agent
+@timed
 def message_count(agent):
     conn = connect()
     row = conn.execute(
-        "SELECT COUNT(*) as c FROM messages WHERE receiver=? AND read=0",
-        (agent,),
+        f"SELECT COUNT(*) as c FROM messages m WHERE m.receiver=? AND m.read=0 AND {_live('m')}",
+        (agent, time.time()),
     ).fetchone()
     conn.close()
     return row["c"]
 
 
-# task operations, create and manage tasks assigned to agents
-# create a new task with pending status assigned to an agent
-def create_task(task_id, agent, description):
-    now = time.time()
-    conn = connect()
-    conn.execute(
-        "INSERT INTO tasks (id, agent, description, status, created_at, updated_at) VALUES (?, ?, ?, 'pending', ?, ?)",
-        (task_id, agent, description, now, now),
-    )
-    conn.commit()
-    conn.close()
-    return {
-        "id": task_id,
-        "agent": agent,
-        "description": description,
-        "status": "pending",
-        "result": None,
-        "created_at": now,
-        "updated_at": now,
+# topic operations, publish once to a named topic and let every subscriber read
+# it through its own cursor. a publish is one insert however many agents listen,
+# and a subscriber's unread topic messages are the rows past its cursor
+TOPIC_COLUMNS = "t.id, t.topic, t.sender, t.message, t.timestamp, t.blob, b.size AS blob_size"
+
+
+def _topic_message(row):
+    entry = {
+        "topic": row["topic"],
+        "topic_message_id": row["id"],
+        "from": row["sender"],
+        "message": row["message"],
+        "timestamp": row["timestamp"],
     }
+    if row["blob"]:
+        entry["blob"] = _blob_ref(row["blob"], row["blob_size"])
+    return entry
 
 
-# fetch a single task by its id, returns none if not found
-def get_task(task_id):
+# unread topic messages for an agent across its subscriptions, its own posts left out
+def _topic_unread(conn, agent):
+    return conn.execute(
+        f"""SELECT {TOPIC_COLUMNS} FROM subscriptions s
+            JOIN topic_messages t ON t.topic = s.topic AND t.id > s.cursor
+            LEFT JOIN blobs b ON b.hash = t.blob
+            WHERE s.agent=? AND t.sender != s.agent AND {_live("t")} ORDER BY t.id""",
+        (agent, time.time()),
+    ).fetchall()
+
+
+# subscribe an agent to a topic, it receives what is published from now on
+# returns false when it was already subscribed
+@timed
+def subscribe(agent, topic):
     conn = connect()
-    row = conn.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
+    cursor = conn.execute(
+        """INSERT OR IGNORE INTO subscriptions (agent, topic, cursor, subscribed_at)
+           VALUES (?, ?, (SELECT COALESCE(MAX(id), 0) FROM topic_messages WHERE topic=?), ?)""",
+        (agent, topic, topic, time.time()),
+    )
+    conn.commit()
+    created = cursor.rowcount > 0
     conn.close()
-    if row is None:
-        return None
-    return {
-        "id": row["id"],
-        "agent": row["agent"],
-        "description": row["description"],
-        "status": row["status"],
-        "result": row["result"],
-        "created_at": row["created_at"],
-        "updated_at": row["updated_at"],
-    }
+    return created
 
 
-# return all tasks sorted by newest first
-def get_tasks():
+# drop a subscription, returns false when there was none
+@timed
+def unsubscribe(agent, topic):
     conn = connect()
-    rows = conn.execute("SELECT * FROM tasks ORDER BY created_at DESC").fetchall()
+    cursor = conn.execute("DELETE FROM subscriptions WHERE agent=? AND topic=?", (agent, topic))
+    conn.commit()
+    removed = cursor.rowcount > 0
     conn.close()
-    return [
-        {
-            "id": r["id"],
-            "agent": r["agent"],
-            "description": r["description"],
-            "status": r["status"],
-            "result": r["result"],
-            "created_at": r["created_at"],
-            "updated_at": r["updated_at"],
-        }
-        for r in rows
-    ]
+    return removed
 
 
-# return all tasks assigned to a specific agent, newest first
-def get_agent_tasks(agent):
+# topics an agent is subscribed to
+@timed
+def get_subscriptions(agent):
     conn = connect()
     rows = conn.execute(
-        "SELECT * FROM tasks WHERE agent=? ORDER BY created_at DESC", (agent,)
+        "SELECT topic FROM subscriptions WHERE agent=? ORDER BY topic", (agent,)
     ).fetchall()
     conn.close()
-    return [
-        {
-            "id": r["id"],
-            "agent": r["agent"],
-            "description": r["description"],
-            "status": r["status"],
-            "result": r["result"],
-            "created_at": r["created_at"],
-            "updated_at": r["updated_at"],
-        }
-        for r in rows
-    ]
+    return [r["topic"] for r in rows]
 
 
-# return only pending tasks for an agent, oldest first so they process in order
-def get_pending_tasks(agent):
+# post a message to a topic as a single row, returns it with the live subscriber count
+@timed
+def publish(sender, topic, message, ttl=None):
+    now = time.time()
     conn = connect()
-    rows = conn.execute(
-        "SELECT * FROM tasks WHERE agent=? AND status='pending' ORDER BY created_at",
-        (agent,),
-    ).fetchall()
+    inline, digest = _offload(conn, message)
+    cursor = conn.execute(
+        "INSERT INTO topic_messages (topic, sender, message, timestamp, blob, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (topic, sender, inline, now, digest, _expires_at(ttl, now)),
+    )
+    # agents that went stale or inactive are not counted as listening
+    subscribers = conn.execute(
+        """SELECT COUNT(*) FROM subscriptions WHERE topic=? AND agent != ?
+           AND agent NOT IN (SELECT name FROM agents WHERE status != 'active')""",
+        (topic, sender),
+    ).fetchone()[0]
+    conn.commit()
     conn.close()
-    return [
+    entry = {
+        "topic": topic,
+        "topic_message_id": cursor.lastrowid,
+        "from": sender,
+        "message": message,
+        "timestamp": now,
+        "subscribers": subscribers,
+    }
+    if digest:
+        entry["blob"] = _blob_ref(digest, len(message.encode()))
+    return entry
+
+
+# read unread topic messages for an agent and move its cursors past them
+# like direct messages, reading returns offloaded ones in full
+@timed
+def read_topic_messages(agent):
+    conn = connect()
+    rows = _topic_unread(conn, agent)
+    last = {}
+    for r in rows:
+        last[r["topic"]] = r["id"]
+    # never move a cursor backwards, a concurrent read may have gone further
+    conn.executemany(
+        "UPDATE subscriptions SET cursor=? WHERE agent=? AND topic=? AND cursor < ?",
+        ((last_id, agent, topic, last_id) for topic, last_id in last.items()),
+    )
+    conn.commit()
+    full = _load_blobs(conn, (r["blob"] for r in rows))
+    conn.close()
+    messages = [_topic_message(r) for r in rows]
+    for entry in messages:
+        if "blob" in entry and entry["blob"]["hash"] in full:
+            entry["message"] = full[entry["blob"]["hash"]]
+    return messages
+
+
+# peek at unread topic messages without moving any cursor
+@timed
+def peek_topic_messages(agent):
+    conn = connect()
+    rows = _topic_unread(conn, agent)
+    conn.close()
+    return [_topic_message(r) for r in rows]
+
+
+# move every cursor of an agent to the end of its topic
+@timed
+def clear_topic_messages(agent):
+    conn = connect()
+    cursor = conn.execute(
+        """UPDATE subscriptions SET cursor = (
+               SELECT MAX(id) FROM topic_messages WHERE topic = subscriptions.topic)
+           WHERE agent=? AND cursor < (
+               SELECT COALESCE(MAX(id), 0) FROM topic_messages WHERE topic = subscriptions.topic)""",
+        (agent,),
+    )
+    conn.commit()
+    cleared = cursor.rowcount > 0
+    conn.close()
+    return cleared
+
+
+# count unread topic messages for an agent
+@timed
+def topic_message_count(agent):
+    conn = connect()
+    row = conn.execute(
+        f"""SELECT COUNT(*) AS c FROM subscriptions s
+            JOIN topic_messages t ON t.topic = s.topic AND t.id > s.cursor
+            WHERE s.agent=? AND t.sender != s.agent AND {_live("t")}""",
+        (agent, time.time()),
+    ).fetchone()
+    conn.close()
+    return row["c"]
+
+
+# every topic with its subscribers and how many messages it holds
+@timed
+def list_topics():
+    conn = connect()
+    topics = {}
+    for r in conn.execute("SELECT topic, agent FROM subscriptions ORDER BY topic, agent"):
+        topics.setdefault(r["topic"], {"subscribers": [], "messages": 0})
+        topics[r["topic"]]["subscribers"].append(r["agent"])
+    for r in conn.execute(
+        f"SELECT topic, COUNT(*) AS c FROM topic_messages t WHERE {_live('t')} GROUP BY topic",
+        (time.time(),),
+    ):
+        topics.setdefault(r["topic"], {"subscribers": [], "messages": 0})
+        topics[r["topic"]]["messages"] = r["c"]
+    conn.close()
+    return [dict(topic=name, **topics[name]) for name in sorted(topics)]
+
+
+# task operations, create and manage tasks assigned to agents
+# large results are offloaded to the blobs table, listings carry the preview and
+# a result_blob reference while get_task returns the full result
+TASK_SELECT = (
+    "SELECT t.*, b.size AS result_size FROM tasks t LEFT JOIN blobs b ON b.hash = t.result_blob"
+)
+
+
+def _task(row):
+    entry = {
+        "id": row["id"],
+        "agent": row["agent"],
+        "description": row["description"],
+        "status": row["status"],
+        "result": row["result"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+    if row["result_blob"]:
+        entry["result_blob"] = _blob_ref(row["result_blob"], row["result_size"])
+    if row["origin"]:
+        entry["origin"] = row["origin"]
+    if row["remote_id"]:
+        entry["remote_id"] = row["remote_id"]
+    return entry
+
+
+# create a new task with pending status assigned to an agent
+# origin is the bridge a task forwarded from another bridge came from, and
+# remote_id its id there when that id was already taken here
+@timed
+def create_task(task_id, agent, description, origin=None, remote_id=None):
+    now = time.time()
+    conn = connect()
+    conn.execute(
+        "INSERT INTO tasks (id, agent, description, status, created_at, updated_at, origin, remote_id) VALUES (?, ?, ?, 'pending', ?, ?, ?, ?)",
+        (task_id, agent, description, now, now, origin, remote_id),
+    )
+    conn.commit()
+    conn.close()
+    entry = {
+        "id": task_id,
+        "agent": agent,
+        "description": description,
+        "status": "pending",
+        "result": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    if origin:
+        entry["origin"] = origin
+    if remote_id:
+        entry["remote_id"] = remote_id
+    return entry
+
+
+# fetch a single task by its id with its full result, returns none if not found
+@timed
+def get_task(task_id):
+    conn = connect()
+    row = conn.execute(f"{TASK_SELECT} WHERE t.id=?", (task_id,)).fetchone()
+    if row is None:
+        conn.close()
+        return None
+    entry = _task(row)
+    if row["result_blob"]:
+        entry["result"] = _load_blobs(conn, [row["result_blob"]]).get(
+            row["result_blob"], entry["result"]
+        )
+    conn.close()
+    return entry
+
+
+# return all tasks sorted by newest first
+@timed
+def get_tasks():
+    conn = connect()
+    rows = conn.execute(f"{TASK_SELECT} ORDER BY t.created_at DESC").fetchall()
+    conn.close()
+    return [_task(r) for r in rows]
+
+
+# return all tasks assigned to a specific agent, newest first
+@timed
+def get_agent_tasks(agent):
+    conn = connect()
+    rows = conn.execute(
+        f"{TASK_SELECT} WHERE t.agent=? ORDER BY t.created_at DESC", (agent,)
+    ).fetchall()
+    conn.close()
+    return [_task(r) for r in rows]
+
+
+# return only pending tasks for an agent, oldest first so they process in order
+@timed
+def get_pending_tasks(agent):
+    conn = connect()
+    rows = conn.execute(
+        "SELECT * FROM tasks WHERE agent=? AND status='pending' ORDER BY created_at",
+        (agent,),
+    ).fetchall()
+    conn.close()
+    return [
         {
             "id": r["id"],
             "agent": r["agent"],
@@ -342,22 +1211,27 @@ def get_pending_tasks(agent):
 
 
 # update a tasks status and optional result, returns none if task not found
+@timed
 def update_task(task_id, status=None, result=None):
     conn = connect()
-    row = conn.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
+    row = conn.execute(f"{TASK_SELECT} WHERE t.id=?", (task_id,)).fetchone()
     if row is None:
         conn.close()
         return None
     new_status = status or row["status"]
-    new_result = result if result is not None else row["result"]
+    if result is not None:
+        new_result, new_blob = _offload(conn, result)
+        new_size = len(result.encode()) if new_blob else None
+    else:
+        new_result, new_blob, new_size = row["result"], row["result_blob"], row["result_size"]
     now = time.time()
     conn.execute(
-        "UPDATE tasks SET status=?, result=?, updated_at=? WHERE id=?",
-        (new_status, new_result, now, task_id),
+        "UPDATE tasks SET status=?, result=?, result_blob=?, updated_at=? WHERE id=?",
+        (new_status, new_result, new_blob, now, task_id),
     )
     conn.commit()
     conn.close()
-    return {
+    entry = {
         "id": task_id,
         "agent": row["agent"],
         "description": row["description"],
@@ -366,40 +1240,206 @@ def update_task(task_id, status=None, result=None):
         "created_at": row["created_at"],
         "updated_at": now,
     }
+    if new_blob:
+        entry["result_blob"] = _blob_ref(new_blob, new_size)
+    if row["origin"]:
+        entry["origin"] = row["origin"]
+    if row["remote_id"]:
+        entry["remote_id"] = row["remote_id"]
+    return entry
 
 
 # context operations, key value store scoped per agent
+# every write stamps the entry with the next global context version, so a
+# watcher can ask for everything that changed after the version it last saw
+
+
+def _context_entry(row):
+    entry = {
+        "key": row["key"],
+        "value": row["value"],
+        "version": row["version"],
+        "updated_at": row["updated_at"],
+    }
+    if row["blob"]:
+        entry["blob"] = _blob_ref(row["blob"], row["blob_size"])
+    return entry
+
+
+CONTEXT_SELECT = (
+    "SELECT c.key, c.value, c.blob, c.version, c.updated_at, b.size AS blob_size"
+    " FROM context c LEFT JOIN blobs b ON b.hash = c.blob"
+)
+
+
+# bounds that select every key starting with prefix through the primary key
+def _prefix_range(prefix):
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
 
-# store or overwrite a context value for an agent
-def set_context(owner, key, value):
+# take the next global context version inside the writing transaction. the
+# counter has its own row, so deleting the newest entry through expiry or a
+# create over an expired key never hands its number out a second time
+def _next_version(conn):
+    return conn.execute(
+        "UPDATE context_seq SET version = version + 1 RETURNING version"
+    ).fetchone()[0]
+
+
+# store a context value for an agent, large values go to the blobs table
+# if_version makes it a compare and set: 0 only creates the key, any other
+# number only overwrites it while it is still at that version
+# returns the new version, or none when the condition did not hold
+@timed
+def set_context(owner, key, value, if_version=None, ttl=None):
+    now = time.time()
     conn = connect()
-    conn.execute(
-        """INSERT INTO context (owner, key, value) VALUES (?, ?, ?)
-           ON CONFLICT(owner, key) DO UPDATE SET value=excluded.value""",
-        (owner, key, value),
-    )
+    inline, digest = _offload(conn, value)
+    # every write sets the expiry again, a write without a ttl keeps the value forever
+    expires_at = _expires_at(ttl, now)
+    version = _next_version(conn)
+    if if_version is None:
+        cursor = conn.execute(
+            """INSERT INTO context (owner, key, value, blob, version, updated_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(owner, key) DO UPDATE SET
+                    value=excluded.value, blob=excluded.blob, version=excluded.version,
+                    updated_at=excluded.updated_at, expires_at=excluded.expires_at
+                RETURNING version""",
+            (owner, key, inline, digest, version, now, expires_at),
+        )
+    elif if_version == 0:
+        # an expired entry that was not swept yet does not count as existing
+        conn.execute(
+            "DELETE FROM context WHERE owner=? AND key=? AND expires_at <= ?", (owner, key, now)
+        )
+        cursor = conn.execute(
+            """INSERT INTO context (owner, key, value, blob, version, updated_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(owner, key) DO NOTHING
+                RETURNING version""",
+            (owner, key, inline, digest, version, now, expires_at),
+        )
+    else:
+        cursor = conn.execute(
+            f"""UPDATE context SET value=?, blob=?, version=?, updated_at=?, expires_at=?
+                WHERE owner=? AND key=? AND version=? AND {_live("context")}
+                RETURNING version""",
+            (inline, digest, version, now, expires_at, owner, key, if_version, now),
+        )
+    row = cursor.fetchone()
     conn.commit()
     conn.close()
+    return row["version"] if row else None
 
 
-# retrieve a context value for an agent, returns none if not set
-def get_context(owner, key):
-    conn = connect()
+def _read_context(conn, owner, key):
     row = conn.execute(
-        "SELECT value FROM context WHERE owner=? AND key=?",
-        (owner, key),
+        f"SELECT value, blob, version, updated_at FROM context c WHERE owner=? AND key=? AND {_live('c')}",
+        (owner, key, time.time()),
     ).fetchone()
-    conn.close()
     if row is None:
         return None
-    return row["value"]
+    value = row["value"]
+    if row["blob"]:
+        value = _load_blobs(conn, [row["blob"]]).get(row["blob"], value)
+    return {"value": value, "version": row["version"], "updated_at": row["updated_at"]}
+
+
+# retrieve a context value for an agent, returns none if not set
+@timed
+def get_context(owner, key):
+    conn = connect()
+    entry = _read_context(conn, owner, key)
+    conn.close()
+    return entry["value"] if entry else None
+
+
+# a context value with its version and update time, returns none if not set
+# with if_newer the value is only loaded when the version moved past it, otherwise
+# the entry comes back without a value so a cached copy can be kept
+@timed
+def get_context_entry(owner, key, if_newer=None):
+    conn = connect()
+    if if_newer is not None:
+        row = conn.execute(
+            f"SELECT version, updated_at FROM context c WHERE owner=? AND key=? AND {_live('c')}",
+            (owner, key, time.time()),
+        ).fetchone()
+        if row is not None and row["version"] <= if_newer:
+            conn.close()
+            return {"version": row["version"], "updated_at": row["updated_at"], "unchanged": True}
+    entry = _read_context(conn, owner, key)
+    conn.close()
+    return entry
+
+
+# full values for several keys of one owner in one query, missing keys are left out
+@timed
+def get_context_many(owner, keys):
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+    conn = connect()
+    marks = ",".join("?" * len(keys))
+    rows = conn.execute(
+        f"SELECT key, value, blob FROM context c WHERE owner=? AND key IN ({marks}) AND {_live('c')}",
+        (owner, *keys, time.time()),
+    ).fetchall()
+    full = _load_blobs(conn, (r["blob"] for r in rows))
+    conn.close()
+    return {r["key"]: full.get(r["blob"], r["value"]) for r in rows}
+
+
+# keys of one owner in key order, optionally only those starting with prefix
+# values are inline, so large ones come back as a preview with a blob reference
+@timed
+def list_context(owner, prefix=""):
+    conn = connect()
+    if prefix:
+        low, high = _prefix_range(prefix)
+        rows = conn.execute(
+            f"{CONTEXT_SELECT} WHERE c.owner=? AND c.key >= ? AND c.key < ? AND {_live('c')}"
+            " ORDER BY c.key",
+            (owner, low, high, time.time()),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            f"{CONTEXT_SELECT} WHERE c.owner=? AND {_live('c')} ORDER BY c.key",
+            (owner, time.time()),
+        ).fetchall()
+    conn.close()
+    return [_context_entry(r) for r in rows]
+
+
+# entries of one owner written after a version, oldest change first, and the
+# version to pass as since next time
+@timed
+def context_changes(owner, since=0, prefix=""):
+    conn = connect()
+    if prefix:
+        low, high = _prefix_range(prefix)
+        rows = conn.execute(
+            f"{CONTEXT_SELECT} WHERE c.owner=? AND c.version > ? AND c.key >= ? AND c.key < ?"
+            f" AND {_live('c')} ORDER BY c.version",
+            (owner, since, low, high, time.time()),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            f"{CONTEXT_SELECT} WHERE c.owner=? AND c.version > ? AND {_live('c')}"
+            " ORDER BY c.version",
+            (owner, since, time.time()),
+        ).fetchall()
+    conn.close()
+    changes = [_context_entry(r) for r in rows]
+    return {"version": changes[-1]["version"] if changes else since, "changes": changes}
 
 
 # activity operations, log and retrieve recent events for the dashboard
 
 
 # record an activity event with arbitrary keyword data
+@timed
 def log_activity(event, **kwargs):
     conn = connect()
     conn.execute(
@@ -416,6 +1456,7 @@ def log_activity(event, **kwargs):
 
 
 # return the last 100 activity events as a list of flat dicts
+@timed
 def get_activity():
     conn = connect()
     rows = conn.execute(
@@ -431,21 +1472,560 @@ def get_activity():
     return result
 
 
+# everything unread, what the mailbox index in queue.py is rebuilt from. topic
+# messages every subscriber has already read are left out
+@timed
+def mailbox_snapshot():
+    conn = connect()
+    direct = conn.execute("SELECT receiver, id, expires_at FROM messages WHERE read=0").fetchall()
+    cursors = conn.execute("SELECT agent, topic, cursor FROM subscriptions").fetchall()
+    last = conn.execute("SELECT topic, MAX(id) AS id FROM topic_messages GROUP BY topic").fetchall()
+    pending = conn.execute(
+        """SELECT t.id, t.topic, t.sender, t.expires_at FROM topic_messages t
+           WHERE t.id > (SELECT MIN(s.cursor) FROM subscriptions s WHERE s.topic = t.topic)
+           ORDER BY t.id"""
+    ).fetchall()
+    conn.close()
+    return {
+        "direct": [(r["receiver"], r["id"], r["expires_at"]) for r in direct],
+        "cursors": [(r["agent"], r["topic"], r["cursor"]) for r in cursors],
+        "last": {r["topic"]: r["id"] for r in last},
+        "pending": [(r["topic"], r["id"], r["sender"], r["expires_at"]) for r in pending],
+    }
+
+
+# metrics snapshots, aggregate counts read when /metrics is scraped
+
+
+# unread message counts grouped by receiver
+@timed
+def mailbox_depths():
+    conn = connect()
+    rows = conn.execute(
+        "SELECT receiver, COUNT(*) as c FROM messages WHERE read=0 GROUP BY receiver"
+    ).fetchall()
+    conn.close()
+    return {r["receiver"]: r["c"] for r in rows}
+
+
+# task counts grouped by status
+@timed
+def task_counts():
+    conn = connect()
+    rows = conn.execute("SELECT status, COUNT(*) as c FROM tasks GROUP BY status").fetchall()
+    conn.close()
+    return {r["status"]: r["c"] for r in rows}
+
+
+# agent counts grouped by status
+@timed
+def agent_counts():
+    conn = connect()
+    rows = conn.execute("SELECT status, COUNT(*) as c FROM agents GROUP BY status").fetchall()
+    conn.close()
+    return {r["status"]: r["c"] for r in rows}
+
+
+# run a wal checkpoint, mode is PASSIVE, FULL, RESTART or TRUNCATE
+# returns whether it was blocked and how many wal frames exist and were copied back
+@timed
+def checkpoint(mode="PASSIVE"):
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"unknown checkpoint mode '{mode}'")
+    conn = connect()
+    row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    conn.close()
+    return {"busy": row[0], "log": row[1], "checkpointed": row[2]}
+
+
+# size of the write ahead log in bytes, zero when it has been checkpointed away
+def wal_size():
+    if is_memory():
+        return 0
+    try:
+        return os.path.getsize(path() + "-wal")
+    except OSError:
+        return 0
+
+
+# delete expired messages, topic messages and context entries in batches of batch rows, each
+# batch its own short transaction so writers are never blocked for long
+# stops after max_batches per table and returns the rows deleted per table
+@timed
+def sweep_expired(batch=500, max_batches=20):
+    now = time.time()
+    deleted = {}
+    conn = connect()
+    for table in ("messages", "topic_messages", "context", "idempotency_keys"):
+        total = 0
+        for _ in range(max_batches):
+            cursor = conn.execute(
+                f"""DELETE FROM {table} WHERE rowid IN (
+                        SELECT rowid FROM {table} WHERE expires_at <= ? LIMIT ?)""",
+                (now, batch),
+            )
+            conn.commit()
+            total += cursor.rowcount
+            if cursor.rowcount < batch:
+                break
+        deleted[table] = total
+    conn.close()
+    return deleted
+
+
+# idempotency keys, a client that retries a write with the same key gets the
+# stored response of the first attempt instead of applying it twice
+
+
+# claim a key for a request about to run, returns (claimed, existing) where
+# existing is the row of an earlier request with the same key, its fingerprint,
+# status and response, the response being none while that request still runs.
+# a claim older than stale seconds without a response belonged to a request
+# that died mid way, a retry of the same request takes it over
+@timed
+def claim_idempotency_key(key, fingerprint, ttl, stale):
+    now = time.time()
+    conn = connect()
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO idempotency_keys (key, fingerprint, claimed_at, expires_at) VALUES (?, ?, ?, ?)",
+        (key, fingerprint, now, now + ttl),
+    )
+    if cursor.rowcount == 0:
+        cursor = conn.execute(
+            """UPDATE idempotency_keys SET claimed_at=?, expires_at=?
+               WHERE key=? AND fingerprint=? AND response IS NULL AND claimed_at < ?""",
+            (now, now + ttl, key, fingerprint, now - stale),
+        )
+    conn.commit()
+    if cursor.rowcount > 0:
+        conn.close()
+        return True, None
+    row = conn.execute(
+        "SELECT fingerprint, status, response FROM idempotency_keys WHERE key=?", (key,)
+    ).fetchone()
+    conn.close()
+    # none when it was swept between the insert and the select
+    return False, dict(row) if row else None
+
+
+# remember the response a claimed key produced
+@timed
+def store_idempotent_response(key, status, response):
+    conn = connect()
+    conn.execute(
+        "UPDATE idempotency_keys SET status=?, response=? WHERE key=?", (status, response, key)
+    )
+    conn.commit()
+    conn.close()
+
+
+# give up a claimed key so a retry runs the request again, used when it failed
+@timed
+def release_idempotency_key(key):
+    conn = connect()
+    conn.execute("DELETE FROM idempotency_keys WHERE key=? AND response IS NULL", (key,))
+    conn.commit()
+    conn.close()
+
+
+# worker coordination, in multi worker mode each server process records the
+# port of its notification socket here, and a lease picks the one process that
+# runs the database wide maintenance jobs
+
+
+# record a worker and the udp port it listens on for notifications
+@timed
+def add_worker(pid, port):
+    conn = connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO workers (pid, port, started_at) VALUES (?, ?, ?)",
+        (pid, port, time.time()),
+    )
+    conn.commit()
+    conn.close()
+
+
+@timed
+def remove_worker(pid):
+    conn = connect()
+    conn.execute("DELETE FROM workers WHERE pid=?", (pid,))
+    conn.commit()
+    conn.close()
+
+
+# notification ports of every running worker
+@timed
+def worker_ports():
+    conn = connect()
+    rows = conn.execute("SELECT port FROM workers ORDER BY pid").fetchall()
+    conn.close()
+    return [r["port"] for r in rows]
+
+
+# forget workers and leases left by a previous run, called before workers start
+@timed
+def clear_workers():
+    conn = connect()
+    conn.execute("DELETE FROM workers")
+    conn.execute("DELETE FROM leases")
+    conn.commit()
+    conn.close()
+
+
+# take or renew a named lease for seconds, true when owner holds it afterwards
+# it can only be taken over once the current holder let it lapse
+@timed
+def acquire_lease(name, owner, seconds):
+    now = time.time()
+    conn = connect()
+    cursor = conn.execute(
+        """INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+           ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at
+           WHERE leases.owner=excluded.owner OR leases.expires_at < ?""",
+        (name, owner, now + seconds, now),
+    )
+    conn.commit()
+    held = cursor.rowcount > 0
+    conn.close()
+    return held
+
+
+# federation, agents registered on peer bridges and the outbox of messages,
+# tasks and task updates waiting to be delivered to them. bridges are named by
+# their base url
+
+
+# replace everything known about a peer bridge's agents with what it just reported
+@timed
+def set_remote_agents(bridge, agents):
+    now = time.time()
+    conn = connect()
+    conn.execute("DELETE FROM remote_agents WHERE bridge=?", (bridge,))
+    conn.executemany(
+        """INSERT OR REPLACE INTO remote_agents (name, bridge, status, last_seen, synced_at)
+           VALUES (?, ?, ?, ?, ?)""",
+        (
+            (a["name"], bridge, a.get("status", "active"), a.get("last_seen", now), now)
+            for a in agents
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+# the bridge an agent is registered on, none when no peer reported it
+@timed
+def remote_bridge(name):
+    conn = connect()
+    row = conn.execute("SELECT bridge FROM remote_agents WHERE name=?", (name,)).fetchone()
+    conn.close()
+    return row["bridge"] if row else None
+
+
+@timed
+def list_remote_agents():
+    conn = connect()
+    rows = conn.execute("SELECT * FROM remote_agents ORDER BY name").fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+# queue an item for a peer bridge, returns its outbox id
+@timed
+def enqueue_outbox(bridge, kind, payload):
+    now = time.time()
+    conn = connect()
+    cursor = conn.execute(
+        "INSERT INTO outbox (bridge, kind, payload, created_at, next_attempt) VALUES (?, ?, ?, ?, ?)",
+        (bridge, kind, json.dumps(payload), now, now),
+    )
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+# bridges with anything waiting in the outbox
+@timed
+def outbox_bridges():
+    conn = connect()
+    rows = conn.execute("SELECT DISTINCT bridge FROM outbox ORDER BY bridge").fetchall()
+    conn.close()
+    return [r["bridge"] for r in rows]
+
+
+# the oldest items waiting for a bridge, in the order they were queued
+@timed
+def outbox_batch(bridge, limit=100):
+    conn = connect()
+    rows = conn.execute(
+        """SELECT id, kind, payload, attempts, next_attempt FROM outbox
+           WHERE bridge=? ORDER BY id LIMIT ?""",
+        (bridge, limit),
+    ).fetchall()
+    conn.close()
+    return [dict(r, payload=json.loads(r["payload"])) for r in rows]
+
+
+# drop items the bridge confirmed
+@timed
+def ack_outbox(ids):
+    conn = connect()
+    conn.executemany("DELETE FROM outbox WHERE id=?", ((i,) for i in ids))
+    conn.commit()
+    conn.close()
+
+
+# push a failed delivery back until next_attempt
+@timed
+def retry_outbox(ids, next_attempt):
+    conn = connect()
+    conn.executemany(
+        "UPDATE outbox SET attempts=attempts+1, next_attempt=? WHERE id=?",
+        ((next_attempt, i) for i in ids),
+    )
+    conn.commit()
+    conn.close()
+
+
+# items waiting per bridge
+@timed
+def outbox_depths():
+    conn = connect()
+    rows = conn.execute("SELECT bridge, COUNT(*) AS n FROM outbox GROUP BY bridge").fetchall()
+    conn.close()
+    return {r["bridge"]: r["n"] for r in rows}
+
+
+# whether an item from a peer was applied already, peers retry until they hear
+# back so the same item can arrive twice
+@timed
+def was_delivered(origin, item_id):
+    conn = connect()
+    row = conn.execute(
+        "SELECT 1 FROM federation_delivered WHERE origin=? AND id=?", (origin, item_id)
+    ).fetchone()
+    conn.close()
+    return row is not None
+
+
+# record an item received from a peer once it was applied, false when it was
+# recorded before
+@timed
+def mark_delivered(origin, item_id):
+    conn = connect()
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO federation_delivered (origin, id, received_at) VALUES (?, ?, ?)",
+        (origin, item_id, time.time()),
+    )
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+# forget received items older than before, peers stop retrying long before that
+@timed
+def prune_delivered(before):
+    conn = connect()
+    cursor = conn.execute("DELETE FROM federation_delivered WHERE received_at < ?", (before,))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+
+# search operations, ranked full text search over messages, tasks and context
+
+SEARCH_KINDS = ("message", "task", "context")
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+# turn free text into an fts5 query, every word must match and a trailing *
+# makes it a prefix, quoting keeps characters like - and : from being syntax
+def search_query(text):
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+# best matches first across the requested kinds, optionally only rows that
+# involve one agent, each hit carries a snippet with the matches in [brackets]
+@timed
+def search(text, kinds=SEARCH_KINDS, agent="", limit=20):
+    if _fts is None:
+        init()
+    if not _fts:
+        raise SearchUnavailable("full text search needs an sqlite build with fts5")
+    query = search_query(text)
+    if not query:
+        return []
+    now = time.time()
+    conn = connect()
+    hits = []
+    if "message" in kinds:
+        where = " AND (m.sender=? OR m.receiver=?)" if agent else ""
+        params = (query, now, agent, agent, limit) if agent else (query, now, limit)
+        rows = conn.execute(
+            f"""SELECT m.id, m.sender, m.receiver, m.thread_id, m.timestamp,
+                       snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet,
+                       bm25(messages_fts) AS score
+                FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND {_live("m")}{where}
+                ORDER BY score LIMIT ?""",
+            params,
+        ).fetchall()
+        hits += [
+            {
+                "kind": "message",
+                "id": r["id"],
+                "from": r["sender"],
+                "to": r["receiver"],
+                "thread_id": r["thread_id"],
+                "timestamp": r["timestamp"],
+                "snippet": r["snippet"],
+                "score": r["score"],
+            }
+            for r in rows
+        ]
+    if "task" in kinds:
+        where = " AND t.agent=?" if agent else ""
+        params = (query, agent, limit) if agent else (query, limit)
+        rows = conn.execute(
+            f"""SELECT t.id, t.agent, t.status, t.updated_at,
+                       snippet(tasks_fts, -1, '[', ']', '…', 12) AS snippet,
+                       bm25(tasks_fts) AS score
+                FROM tasks_fts JOIN tasks t ON t.rowid = tasks_fts.rowid
+                WHERE tasks_fts MATCH ?{where}
+                ORDER BY score LIMIT ?""",
+            params,
+        ).fetchall()
+        hits += [
+            {
+                "kind": "task",
+                "id": r["id"],
+                "agent": r["agent"],
+                "status": r["status"],
+                "timestamp": r["updated_at"],
+                "snippet": r["snippet"],
+                "score": r["score"],
+            }
+            for r in rows
+        ]
+    if "context" in kinds:
+        where = " AND c.owner=?" if agent else ""
+        params = (query, now, agent, limit) if agent else (query, now, limit)
+        rows = conn.execute(
+            f"""SELECT c.owner, c.key, c.version, c.updated_at,
+                       snippet(context_fts, -1, '[', ']', '…', 12) AS snippet,
+                       bm25(context_fts) AS score
+                FROM context_fts JOIN context c ON c.rowid = context_fts.rowid
+                WHERE context_fts MATCH ? AND {_live("c")}{where}
+                ORDER BY score LIMIT ?""",
+            params,
+        ).fetchall()
+        hits += [
+            {
+                "kind": "context",
+                "owner": r["owner"],
+                "key": r["key"],
+                "version": r["version"],
+                "timestamp": r["updated_at"],
+                "snippet": r["snippet"],
+                "score": r["score"],
+            }
+            for r in rows
+        ]
+    conn.close()
+    # bm25 scores are negative, the most relevant hit has the lowest
+    hits.sort(key=lambda h: h["score"])
+    return hits[:limit]
+
+
+# storage report for talktome stats, row counts, file sizes and what blob
+# offloading and compression saved
+@timed
+def storage_stats():
+    conn = connect()
+    rows = {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in (
+            "agents",
+            "messages",
+            "topic_messages",
+            "subscriptions",
+            "tasks",
+            "context",
+            "activity",
+            "blobs",
+        )
+    }
+    encodings = {
+        r["encoding"]: {"blobs": r["n"], "raw_bytes": r["raw"], "stored_bytes": r["stored"]}
+        for r in conn.execute(
+            """SELECT encoding, COUNT(*) AS n, SUM(size) AS raw, SUM(LENGTH(data)) AS stored
+               FROM blobs GROUP BY encoding"""
+        )
+    }
+    # every reference to a blob would otherwise have stored the full value inline
+    references = conn.execute(
+        """SELECT COALESCE(SUM(b.size), 0) FROM (
+               SELECT blob AS hash FROM messages WHERE blob IS NOT NULL
+               UNION ALL SELECT blob FROM topic_messages WHERE blob IS NOT NULL
+               UNION ALL SELECT result_blob FROM tasks WHERE result_blob IS NOT NULL
+               UNION ALL SELECT blob FROM context WHERE blob IS NOT NULL) r
+           JOIN blobs b ON b.hash = r.hash"""
+    ).fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.close()
+    raw = sum(e["raw_bytes"] for e in encodings.values())
+    stored = sum(e["stored_bytes"] for e in encodings.values())
+    return {
+        "path": path(),
+        "db_bytes": page_size * page_count,
+        "free_bytes": page_size * freelist,
+        "wal_bytes": wal_size(),
+        "rows": rows,
+        "blobs": {
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "compression_saved_bytes": raw - stored,
+            "dedup_saved_bytes": max(0, references - raw),
+            "by_encoding": encodings,
+        },
+    }
+
+
 # test helper, wipes all data from every table
 
 
 # clear all tables, used by tests to reset state between runs
 def reset():
+    global _epoch
     conn = connect()
     conn.executescript("""
         DELETE FROM agents;
         DELETE FROM messages;
+        DELETE FROM topic_messages;
+        DELETE FROM subscriptions;
         DELETE FROM context;
         DELETE FROM tasks;
         DELETE FROM activity;
+        DELETE FROM blobs;
+        DELETE FROM workers;
+        DELETE FROM leases;
+        DELETE FROM remote_agents;
+        DELETE FROM outbox;
+        DELETE FROM federation_delivered;
+        DELETE FROM idempotency_keys;
+        UPDATE context_seq SET version = 0;
     """)
     conn.close()
-
-
-# automatically create tables when the module is first imported
-init()
+    _epoch += 1
+    _agents_changed()
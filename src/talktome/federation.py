@@ -0,0 +1,322 @@
+import hmac
+import json
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+from talktome import config, db, metrics, queue, registry
+
+# federation between bridges that cannot see each other's database, one per
+# machine or container. every bridge stays local first: agents register,
+# read and write on their own bridge, and peers only swap two things over http.
+# a sync exchanges the agents each side has registered, and anything addressed
+# to an agent on another bridge goes into a durable outbox that a background
+# job delivers in batches, retrying with backoff until the peer confirms it
+
+# items sent to a peer per request
+BATCH = 100
+
+# seconds between retries grow from 2 up to this
+MAX_BACKOFF = 300.0
+
+# seconds a received item id is remembered to drop redeliveries
+DELIVERED_TTL = 86400.0
+
+# seconds to wait on a peer before counting the attempt as failed
+TIMEOUT = 5.0
+
+
+# the url peers reach this bridge on, they send task updates back to it
+def self_url():
+    url = config.get("public_url") or f"http://127.0.0.1:{config.get('port', 3456)}"
+    return url.rstrip("/")
+
+
+# why a bridge could not reach this one back, none when it can. without
+# public_url this bridge advertises a loopback address, which only works for
+# peers on the same host
+def unreachable_from(bridge):
+    if config.get("public_url"):
+        return None
+    host = urllib.parse.urlsplit(bridge).hostname or ""
+    if host in ("localhost", "::1") or host.startswith("127."):
+        return None
+    return f"set public_url, {bridge} cannot reach this bridge on {self_url()}"
+
+
+# refuse to peer with bridges on other hosts they could not answer
+def check():
+    for bridge in peers():
+        reason = unreachable_from(bridge)
+        if reason:
+            raise ValueError(reason)
+
+
+# peer bridge urls, a list in the config file or comma separated in TALKTOME_PEERS
+def peers():
+    value = config.get("peers") or []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [url.strip().rstrip("/") for url in value if url.strip()]
+
+
+# optional shared secret, peers present it as a bearer token
+def _token():
+    return config.get("federation_token") or ""
+
+
+# true when a request to a federation endpoint carries the shared secret, or none is set
+def authorized(headers):
+    token = _token()
+    return not token or hmac.compare_digest(headers.get("authorization", ""), "Bearer " + token)
+
+
+# whether a bridge url a federation request names may be written down and sent to.
+# without a shared secret anyone who reaches this bridge could otherwise make it
+# post task updates and deliveries to any url, so only configured peers count
+def trusted(bridge):
+    return bool(_token()) or bridge in peers()
+
+
+def _post(bridge, endpoint, data):
+    headers = {"Content-Type": "application/json"}
+    if _token():
+        headers["Authorization"] = "Bearer " + _token()
+    req = urllib.request.Request(
+        bridge + endpoint, data=json.dumps(data).encode(), headers=headers, method="POST"
+    )
+    with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+        return json.loads(resp.read())
+
+
+# the peer bridge an agent lives on, none for local and unknown agents
+# a local registration always wins over a remote one with the same name
+def bridge_for(name):
+    if registry.is_registered(name):
+        return None
+    return db.remote_bridge(name)
+
+
+# agents registered here, as reported to peers
+def local_agents():
+    agents = []
+    for name in registry.list_all():
+        entry = registry.get(name)
+        agents.append({"name": name, "status": entry["status"], "last_seen": entry["last_seen"]})
+    return agents
+
+
+# agents peers reported that are not also registered here
+def remote_agents():
+    return [a for a in db.list_remote_agents() if not registry.is_registered(a["name"])]
+
+
+def _enqueue(bridge, kind, payload):
+    db.enqueue_outbox(bridge, kind, payload)
+    metrics.FEDERATED_ITEMS.inc(direction="queued", kind=kind)
+
+
+# queue a message for an agent on another bridge, the thread id is picked here
+# so the sender can follow the conversation before it is delivered. a reply
+# carries the id the answered message has here, the peer records this bridge with it
+def forward_message(bridge, sender, receiver, message, thread_id=None, ttl=None, reply_to=None):
+    thread_id = thread_id or uuid.uuid4().hex[:12]
+    expires_at = time.time() + ttl if ttl and ttl > 0 else None
+    payload = {
+        "sender": sender,
+        "receiver": receiver,
+        "message": message,
+        "thread_id": thread_id,
+        "expires_at": expires_at,
+        "reply_to": reply_to,
+    }
+    _enqueue(bridge, "message", payload)
+    return {"to": receiver, "bridge": bridge, "thread_id": thread_id}
+
+
+# answer a message whose sender is on another bridge, none when the sender is
+# local or unknown so the reply goes to a mailbox here as usual
+def reply(sender, message_id, message):
+    original = db.message_origin(message_id)
+    if original is None:
+        return None
+    bridge = bridge_for(original["sender"])
+    if bridge is None:
+        return None
+    return forward_message(
+        bridge, sender, original["sender"], message, original["thread_id"], reply_to=message_id
+    )
+
+
+# queue a task created here for an agent on another bridge, the local copy
+# keeps the same id and is updated when the agent reports back. raises
+# ValueError when the peer could not send those updates back here
+def forward_task(bridge, task):
+    reason = unreachable_from(bridge)
+    if reason:
+        raise ValueError(reason)
+    payload = {
+        "id": task["id"],
+        "agent": task["agent"],
+        "description": task["description"],
+        "origin": self_url(),
+    }
+    _enqueue(bridge, "task", payload)
+
+
+# report an update of a task that came from another bridge back to it, under
+# the id it has there
+def task_updated(task, result=None):
+    if task.get("origin"):
+        task_id = task.get("remote_id", task["id"])
+        payload = {"id": task_id, "status": task["status"], "result": result}
+        _enqueue(task["origin"], "task_update", payload)
+
+
+def _apply(origin, kind, payload):
+    if kind == "message":
+        expires_at = payload.get("expires_at")
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            return
+        reply_to = payload.get("reply_to")
+        queue.send(
+            payload["sender"],
+            payload["receiver"],
+            payload["message"],
+            thread_id=payload.get("thread_id"),
+            reply_to=reply_to,
+            ttl=expires_at - now if expires_at is not None else None,
+            reply_bridge=origin if reply_to is not None else None,
+        )
+        db.log_activity(
+            "message",
+            sender=payload["sender"],
+            peer=payload["receiver"],
+            content=db.preview(payload["message"]),
+            via=origin,
+        )
+    elif kind == "task":
+        # updates go back to the bridge that delivered the task, not to a url it names
+        task_id, remote_id = payload["id"], None
+        if db.get_task(task_id) is not None:
+            # redeliveries never get here, another task already has the id. this
+            # one gets a new id and keeps the peer's to report back under
+            task_id, remote_id = uuid.uuid4().hex[:8], payload["id"]
+        db.create_task(task_id, payload["agent"], payload["description"], origin, remote_id)
+        db.log_activity(
+            "task_created",
+            agent=payload["agent"],
+            task_id=task_id,
+            description=payload["description"],
+            via=origin,
+        )
+    elif kind == "task_update":
+        if db.update_task(payload["id"], payload.get("status"), payload.get("result")):
+            db.log_activity(
+                "task_updated", task_id=payload["id"], status=payload.get("status"), via=origin
+            )
+    else:
+        # a newer peer sending something this bridge does not know yet
+        return
+    metrics.FEDERATED_ITEMS.inc(direction="received", kind=kind)
+
+
+# payload fields each item kind needs, kinds not listed here are skipped on arrival
+REQUIRED = {
+    "message": ("sender", "receiver", "message"),
+    "task": ("id", "agent", "description"),
+    "task_update": ("id",),
+}
+
+
+# why a delivered item cannot be applied, none when it is well formed
+def invalid(item):
+    if not isinstance(item, dict) or "id" not in item or not isinstance(item.get("kind"), str):
+        return "every item needs an id and a kind"
+    payload = item.get("payload")
+    if not isinstance(payload, dict):
+        return f"item {item['id']} needs a payload object"
+    missing = [f for f in REQUIRED.get(item["kind"], ()) if f not in payload]
+    if missing:
+        return f"item {item['id']} is missing {', '.join(missing)}"
+    return None
+
+
+# deliver a batch a peer sent, returns the ids it can drop from its outbox
+# items seen before are confirmed again without applying them twice. an item is
+# recorded only once it was applied, one that fails is sent again by the peer
+def receive(origin, items):
+    accepted = []
+    for item in items:
+        if not db.was_delivered(origin, item["id"]):
+            _apply(origin, item["kind"], item["payload"])
+            db.mark_delivered(origin, item["id"])
+        accepted.append(item["id"])
+    return accepted
+
+
+# swap agent lists with a peer
+def sync(bridge):
+    answer = _post(bridge, "/federation/sync", {"bridge": self_url(), "agents": local_agents()})
+    db.set_remote_agents(bridge, answer.get("agents", []))
+    return len(answer.get("agents", []))
+
+
+# send a peer the oldest batch waiting for it, returns how many it confirmed
+# a failed batch is retried after a backoff, later items wait behind it so
+# every peer receives items in the order they were queued
+def flush(bridge):
+    batch = db.outbox_batch(bridge, BATCH)
+    if not batch or batch[0]["next_attempt"] > time.time():
+        return 0
+    items = [{"id": i["id"], "kind": i["kind"], "payload": i["payload"]} for i in batch]
+    try:
+        answer = _post(bridge, "/federation/deliver", {"origin": self_url(), "items": items})
+    except (OSError, ValueError):
+        delay = min(2.0 ** (batch[0]["attempts"] + 1), MAX_BACKOFF)
+        db.retry_outbox([i["id"] for i in batch], time.time() + delay)
+        metrics.FEDERATION_ERRORS.inc(bridge=bridge)
+        return 0
+    accepted = set(answer.get("accepted", []))
+    db.ack_outbox(accepted)
+    for item in batch:
+        if item["id"] in accepted:
+            metrics.FEDERATED_ITEMS.inc(direction="sent", kind=item["kind"])
+    return len(accepted)
+
+
+# the background job, sync every configured peer, then drain the outbox
+def run():
+    synced = 0
+    for bridge in peers():
+        try:
+            sync(bridge)
+            synced += 1
+        except (OSError, ValueError):
+            metrics.FEDERATION_ERRORS.inc(bridge=bridge)
+    sent = 0
+    for bridge in db.outbox_bridges():
+        while True:
+            delivered = flush(bridge)
+            sent += delivered
+            if delivered < BATCH:
+                break
+    db.prune_delivered(time.time() - DELIVERED_TTL)
+    return {"synced": synced, "sent": sent}
+
+
+# peers, what they reported and what is waiting for them
+def status():
+    depths = db.outbox_depths()
+    agents = {}
+    for a in db.list_remote_agents():
+        agents.setdefault(a["bridge"], []).append(a["name"])
+    bridges = sorted(set(peers()) | set(depths) | set(agents))
+    return {
+        "bridge": self_url(),
+        "peers": [
+            {"url": b, "agents": agents.get(b, []), "outbox": depths.get(b, 0)} for b in bridges
+        ],
+    }
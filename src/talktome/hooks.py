@@ -204,7 +204,7 @@ def hook_inbox():
             parts.append(
                 f"{data['count']} new message(s). "
                 f"preview: {preview}. "
-                f"call bridge_read_mailbox('{name}') to read and respond."
+                f"call bridge_read_mailbox('{name}') to read and bridge_reply to respond."
             )
     except (urllib.error.URLError, OSError):
         # bridge unreachable, try to restart it as a fallback
@@ -0,0 +1,201 @@
+import asyncio
+import contextlib
+import os
+
+from talktome import config, db, federation, metrics, notify, presence, queue, registry
+
+# background jobs that keep a long running bridge healthy, started and
+# stopped with the server through its lifespan
+
+# seconds between wal checkpoints
+CHECKPOINT_INTERVAL = 30.0
+
+# seconds between sweeps for blobs nothing references anymore
+BLOB_GC_INTERVAL = 3600.0
+
+# seconds between sweeps for expired messages and context entries
+EXPIRY_INTERVAL = 60.0
+
+# seconds between heartbeat flushes and stale agent sweeps
+PRESENCE_INTERVAL = 15.0
+
+# seconds between registry syncs with peer bridges and outbox deliveries
+FEDERATION_INTERVAL = 5.0
+
+# seconds between reloads of the in-memory mailbox index and agent list in multi
+# worker mode, a notification lost between workers is made good by the next one
+RESYNC_INTERVAL = 30.0
+
+# seconds the worker running the database wide jobs holds on to that role
+# without renewing it, another worker takes over once it lapses
+LEASE_SECONDS = 120.0
+
+
+# server processes sharing the port, from the workers setting
+def worker_count():
+    return max(1, int(config.get("workers", 1)))
+
+
+# size and modification time of the wal file, none when there is no wal
+def wal_signature():
+    if db.is_memory():
+        return None
+    try:
+        stat = os.stat(db.path() + "-wal")
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+# checkpoints the wal on a timer, passive while writes are flowing so it never
+# blocks them, truncate once a whole interval went by without writes so the
+# wal file shrinks back to nothing while the bridge is idle
+class Checkpointer:
+    def __init__(self):
+        self.last_seen = None
+
+    def tick(self):
+        # checkpoints only read the wal, so an untouched file means nobody wrote to it
+        idle = self.last_seen is not None and wal_signature() == self.last_seen
+        status = db.checkpoint("PASSIVE")
+        mode = "passive"
+        if idle and status["log"] > 0 and status["checkpointed"] == status["log"]:
+            db.checkpoint("TRUNCATE")
+            mode = "truncate"
+        self.last_seen = wal_signature()
+        metrics.WAL_CHECKPOINTS.inc(mode=mode)
+        metrics.WAL_BYTES.set(db.wal_size())
+        return mode
+
+
+# delete messages and context entries whose ttl ran out
+def sweep_expired():
+    deleted = db.sweep_expired()
+    for table, count in deleted.items():
+        metrics.EXPIRED_ROWS.inc(count, table=table)
+    return deleted
+
+
+# write buffered heartbeats and mark agents that stopped calling in
+def sweep_presence():
+    marked = presence.sweep()
+    for status, count in marked.items():
+        metrics.PRESENCE_CHANGES.inc(count, status=status)
+    return marked
+
+
+# drop blobs left behind by overwritten context values and task results
+def collect_blobs():
+    deleted = db.gc_blobs()
+    metrics.BLOBS_COLLECTED.inc(deleted)
+    return deleted
+
+
+# reload what this worker keeps in memory from the database, other workers
+# announce their writes over udp and a datagram can get lost
+def resync():
+    registry.invalidate()
+    queue.rebuild()
+
+
+# with several workers only the one holding the maintenance lease runs a job,
+# every run renews the lease so the role stays put while its holder is alive
+def leader_only(job):
+    owner = str(os.getpid())
+
+    def run():
+        if not db.acquire_lease("maintenance", owner, LEASE_SECONDS):
+            return None
+        return job()
+
+    return run
+
+
+# run a blocking job off the event loop every interval seconds until cancelled
+async def every(name, interval, job):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(job)
+        except Exception:
+            # a failed run is retried on the next tick, the loop itself must survive
+            metrics.MAINTENANCE_ERRORS.inc(job=name)
+
+
+# the jobs to run as (name, interval, callable), intervals are read when the server starts
+# and an interval of zero or less turns a job off. every worker flushes its own
+# heartbeats and resyncs its own caches, the jobs that work on the whole
+# database run in one worker only
+def jobs():
+    workers = worker_count()
+    shared = leader_only if workers > 1 else (lambda job: job)
+    every_job = [
+        (
+            "checkpoint",
+            float(config.get("checkpoint_interval", CHECKPOINT_INTERVAL)),
+            shared(Checkpointer().tick),
+        ),
+        (
+            "expiry",
+            float(config.get("expiry_interval", EXPIRY_INTERVAL)),
+            shared(sweep_expired),
+        ),
+        (
+            "presence",
+            float(config.get("presence_interval", PRESENCE_INTERVAL)),
+            sweep_presence,
+        ),
+        (
+            "blob_gc",
+            float(config.get("blob_gc_interval", BLOB_GC_INTERVAL)),
+            shared(collect_blobs),
+        ),
+        (
+            "federation",
+            float(config.get("federation_interval", FEDERATION_INTERVAL)),
+            shared(federation.run),
+        ),
+    ]
+    # a single worker makes every write itself, its caches are never behind
+    if workers > 1:
+        every_job.append(("resync", float(config.get("resync_interval", RESYNC_INTERVAL)), resync))
+    return every_job
+
+
+def start():
+    return [
+        asyncio.create_task(every(name, interval, job))
+        for name, interval, job in jobs()
+        if interval > 0
+    ]
+
+
+async def stop(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# server lifespan, keeps the background jobs running while the bridge is up
+# it also holds one connection open the whole time, otherwise sqlite checkpoints
+# and deletes the wal every time the last per call connection closes, which
+# costs a checkpoint on every single write. the checkpointer does that work instead
+@contextlib.asynccontextmanager
+async def lifespan(server):
+    # create the tables at startup so the first request does not pay for it,
+    # and load the unread index so mailbox counts never have to
+    db.init()
+    queue.rebuild()
+    # other workers reach this one through the notification channel
+    if worker_count() > 1:
+        await notify.open_channel()
+    anchor = db.connect()
+    tasks = start()
+    try:
+        yield {}
+    finally:
+        await stop(tasks)
+        # keep the last heartbeats, a restart should not make live agents look stale
+        presence.flush()
+        notify.close_channel()
+        anchor.close()
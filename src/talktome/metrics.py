@@ -0,0 +1,253 @@
+import functools
+import threading
+import time
+
+# in-process counters rendered in the prometheus text format by the /metrics endpoint
+# kept dependency free so the db layer can record into it without pulling in the server
+
+# latency buckets in seconds, from sub millisecond sqlite calls up to slow scans
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# base class, holds one value per combination of label values
+class Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def clear(self):
+        with _lock:
+            self.values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+# monotonically increasing count
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+# value that can go up and down or be set from a snapshot
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    # swap in a fresh snapshot so label values that disappeared stop being reported
+    def replace(self, values):
+        snapshot = {}
+        for labels, value in values:
+            snapshot[self._key(labels)] = value
+        with _lock:
+            self.values = snapshot
+
+
+# distribution of observations in cumulative buckets
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self.values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# record how long a function takes into a histogram under the given label
+def timed(histogram, **labels):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+# render every registered metric as one prometheus exposition document
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# reset all values, used by tests
+def reset():
+    for metric in _metrics:
+        metric.clear()
+
+
+# metrics recorded by the bridge
+
+HTTP_REQUESTS = Counter(
+    "talktome_http_requests_total",
+    "rest requests handled, by route, method and status",
+    ("route", "method", "status"),
+)
+HTTP_DURATION = Histogram(
+    "talktome_http_request_duration_seconds",
+    "rest request latency by route",
+    ("route",),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "talktome_http_requests_in_flight",
+    "rest requests currently being handled",
+)
+TOOL_CALLS = Counter(
+    "talktome_tool_calls_total",
+    "mcp tool calls, by tool and outcome",
+    ("tool", "outcome"),
+)
+TOOL_DURATION = Histogram(
+    "talktome_tool_duration_seconds",
+    "mcp tool call latency by tool",
+    ("tool",),
+)
+DB_DURATION = Histogram(
+    "talktome_db_operation_duration_seconds",
+    "db.py operation latency including connect and commit",
+    ("op",),
+)
+DB_CONNECTIONS = Counter(
+    "talktome_db_connections_total",
+    "sqlite connections opened",
+)
+MAILBOX_DEPTH = Gauge(
+    "talktome_mailbox_depth",
+    "unread messages waiting per agent",
+    ("agent",),
+)
+TASKS = Gauge(
+    "talktome_tasks",
+    "tasks by status",
+    ("status",),
+)
+AGENTS = Gauge(
+    "talktome_agents",
+    "registered agents by status",
+    ("status",),
+)
+WAL_BYTES = Gauge(
+    "talktome_wal_bytes",
+    "size of the sqlite write ahead log file",
+)
+WAL_CHECKPOINTS = Counter(
+    "talktome_wal_checkpoints_total",
+    "background wal checkpoints by mode",
+    ("mode",),
+)
+MAINTENANCE_ERRORS = Counter(
+    "talktome_maintenance_errors_total",
+    "background job runs that raised",
+    ("job",),
+)
+BLOBS_COLLECTED = Counter(
+    "talktome_blobs_collected_total",
+    "unreferenced blobs deleted by the blob sweeper",
+)
+EXPIRED_ROWS = Counter(
+    "talktome_expired_rows_total",
+    "messages and context entries deleted by the expiry sweeper, by table",
+    ("table",),
+)
+PRESENCE_CHANGES = Counter(
+    "talktome_presence_changes_total",
+    "agents the presence sweeper marked stale or inactive, by new status",
+    ("status",),
+)
+FEDERATED_ITEMS = Counter(
+    "talktome_federated_items_total",
+    "messages, tasks and task updates exchanged with peer bridges, by direction and kind",
+    ("direction", "kind"),
+)
+FEDERATION_ERRORS = Counter(
+    "talktome_federation_errors_total",
+    "failed registry syncs and outbox deliveries, by peer bridge",
+    ("bridge",),
+)
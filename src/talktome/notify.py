@@ -0,0 +1,152 @@
+import asyncio
+import os
+import socket
+
+from talktome import db
+
+# change notifications for long polls. a waiter takes the current event for a
+# topic before it checks the database, and a writer publishes the topic after it
+# commits, so a change between the check and the wait is never missed
+
+_events = {}
+_loop = None
+
+# in multi worker mode every worker also opens a udp socket on localhost and
+# records its port in the workers table. a publish is sent to every other worker,
+# which fires the topic locally as if it had been published there
+WORKERS_TOPIC = "workers"
+
+_transport = None
+_sender = None
+_port = None
+_peers = []
+_handlers = {}
+
+
+# the event that fires on the next publish of this topic, call from the event loop
+def listen(topic):
+    global _loop
+    loop = asyncio.get_running_loop()
+    if loop is not _loop:
+        # events belong to the loop that waits on them, start over on a new one
+        _events.clear()
+        _loop = loop
+    event = _events.get(topic)
+    if event is None:
+        event = _events[topic] = asyncio.Event()
+    return event
+
+
+# wait until the event fires or the timeout passes, true when it fired
+async def wait(event, timeout):
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def _fire(topic):
+    event = _events.pop(topic, None)
+    if event is not None:
+        event.set()
+
+
+# wake everyone listening on a topic in this and every other worker, safe to
+# call from worker threads
+def publish(topic):
+    _broadcast(topic)
+    loop = _loop
+    if loop is None or loop.is_closed():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        _fire(topic)
+    else:
+        loop.call_soon_threadsafe(_fire, topic)
+
+
+# call handler(topic) when another worker publishes topic, used to drop
+# in-memory state built from rows that worker just changed
+def on_remote(topic, handler):
+    _handlers.setdefault(topic, []).append(handler)
+
+
+def _broadcast(topic):
+    sender = _sender
+    if sender is None:
+        return
+    data = topic.encode()
+    for port in _peers:
+        try:
+            sender.sendto(data, ("127.0.0.1", port))
+        except OSError:
+            # a worker that went away, it is dropped from the list when it deregisters
+            pass
+
+
+def _refresh_peers():
+    global _peers
+    _peers = [port for port in db.worker_ports() if port != _port]
+
+
+# a publish that arrived from another worker
+def _deliver(topic):
+    if topic == WORKERS_TOPIC:
+        _refresh_peers()
+    for handler in _handlers.get(topic, ()):
+        handler(topic)
+    if _loop is not None:
+        _fire(topic)
+
+
+class _Receiver(asyncio.DatagramProtocol):
+    def datagram_received(self, data, addr):
+        _deliver(data.decode(errors="replace"))
+
+
+# join the other workers, call from the event loop when the worker starts
+async def open_channel():
+    global _transport, _sender, _port, _loop
+    loop = asyncio.get_running_loop()
+    if loop is not _loop:
+        _events.clear()
+        _loop = loop
+    _transport, _ = await loop.create_datagram_endpoint(_Receiver, local_addr=("127.0.0.1", 0))
+    _port = _transport.get_extra_info("sockname")[1]
+    _sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    _sender.setblocking(False)
+    db.add_worker(os.getpid(), _port)
+    _refresh_peers()
+    # let the workers already running pick this one up
+    _broadcast(WORKERS_TOPIC)
+    return _port
+
+
+# whether this process is one of several workers sharing the database
+def joined():
+    return _transport is not None
+
+
+# leave the other workers, call when the worker shuts down
+def close_channel():
+    global _transport, _sender, _port, _peers
+    if _transport is None:
+        return
+    db.remove_worker(os.getpid())
+    _broadcast(WORKERS_TOPIC)
+    _transport.close()
+    _sender.close()
+    _transport = _sender = _port = None
+    _peers = []
+
+
+# drop every pending event, used by tests
+def reset():
+    global _loop
+    close_channel()
+    _events.clear()
+    _loop = None
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from talktome import config, db, registry
+
+# agent heartbeats. hook calls note that an agent is alive here in memory and
+# the presence job writes them to last_seen in one batch, so a hook poll never
+# costs a write of its own. agents that stop calling in go stale and then inactive
+
+# seconds without a heartbeat before an active agent is marked stale
+STALE_AFTER = 300.0
+
+# seconds without a heartbeat before a stale agent is marked inactive
+INACTIVE_AFTER = 1800.0
+
+_lock = threading.Lock()
+_pending = {}
+
+
+# remember that an agent was seen just now, cheap enough to call on every request
+def touch(name):
+    if not name:
+        return
+    with _lock:
+        _pending[name] = time.time()
+
+
+# write buffered heartbeats to the database, returns how many agents were updated
+def flush():
+    global _pending
+    with _lock:
+        seen, _pending = _pending, {}
+    if not seen:
+        return 0
+    updated = db.touch_agents(seen)
+    if updated:
+        registry.changed()
+    return updated
+
+
+# flush heartbeats, then mark agents that went quiet as stale or inactive
+def sweep():
+    flush()
+    marked = db.mark_stale(
+        float(config.get("stale_after", STALE_AFTER)),
+        float(config.get("inactive_after", INACTIVE_AFTER)),
+    )
+    if any(marked.values()):
+        registry.changed()
+    return marked
+
+
+# drop buffered heartbeats, used by tests
+def reset():
+    global _pending
+    with _lock:
+        _pending = {}
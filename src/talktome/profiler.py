@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+
+from talktome import config
+
+# statement level profiling for every sqlite connection opened by db.py
+# aggregates are kept for all statements, statements slower than the threshold
+# are also kept individually with their query plan so stalls can be traced to sql
+
+# statements at or above this many milliseconds go into the slow log, negative
+# disables it. slow_query_ms in the config file or TALKTOME_SLOW_QUERY_MS overrides it
+SLOW_QUERY_MS = 25.0
+
+# how many of the slowest statements to keep, overridden by slow_query_top
+SLOW_QUERY_TOP = 20
+
+
+# settings are looked up on every statement so a config change needs no restart
+def threshold_ms():
+    return float(config.get("slow_query_ms", SLOW_QUERY_MS))
+
+
+def top():
+    return int(config.get("slow_query_top", SLOW_QUERY_TOP))
+
+
+_lock = threading.Lock()
+_seq = itertools.count()
+# normalized sql mapped to [calls, total seconds, max seconds]
+_stats = {}
+# min heap of (seconds, seq, record) holding the slowest statements seen
+_slow = []
+# query plans are stable per statement so each one is explained only once
+_plans = {}
+
+
+# collapse whitespace so the same statement always maps to the same key
+def normalize(sql):
+    return " ".join(sql.split())
+
+
+# ask sqlite how it runs a statement, returns the plan detail lines
+def explain(conn, sql, parameters):
+    key = normalize(sql)
+    if key in _plans:
+        return _plans[key]
+    try:
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parameters)
+        plan = [row[3] for row in rows.fetchall()]
+    except sqlite3.Error:
+        plan = []
+    _plans[key] = plan
+    return plan
+
+
+# account for one executed statement, or with before set for more rows fetched
+# from one that already ran for that many seconds
+def record(conn, sql, parameters, seconds, before=None):
+    key = normalize(sql)
+    elapsed = seconds + (before or 0.0)
+    threshold = threshold_ms()
+    limit = top()
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            entry = _stats[key] = [0, 0.0, 0.0]
+        if before is None:
+            entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], elapsed)
+        # a statement goes into the slow log once, when it crosses the threshold
+        if threshold < 0 or elapsed * 1000 < threshold:
+            return
+        if before is not None and before * 1000 >= threshold:
+            return
+        if len(_slow) >= limit and elapsed <= _slow[0][0]:
+            return
+    # explain outside the lock, it runs another statement on the same connection
+    plan = explain(conn, sql, parameters) if parameters is not None else []
+    entry = {"sql": key, "ms": round(elapsed * 1000, 3), "at": time.time(), "plan": plan}
+    with _lock:
+        heapq.heappush(_slow, (elapsed, next(_seq), entry))
+        while len(_slow) > limit:
+            heapq.heappop(_slow)
+
+
+# cursor that adds the time spent stepping through rows to its statement
+class ProfiledCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        self._sql, self._parameters = sql, parameters
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - start
+            record(self.connection, sql, parameters, self._elapsed)
+
+    def _fetched(self, start):
+        seconds = time.perf_counter() - start
+        record(self.connection, self._sql, self._parameters, seconds, self._elapsed)
+        self._elapsed += seconds
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._fetched(start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._fetched(start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._fetched(start)
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._fetched(start)
+
+
+# sqlite connection that times every statement it executes, from the first
+# step in execute through every row fetched from its cursor
+class ProfiledConnection(sqlite3.Connection):
+    def execute(self, sql, parameters=()):
+        return self.cursor(ProfiledCursor).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record(self, sql, None, time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record(self, sql_script, None, time.perf_counter() - start)
+
+
+# snapshot of the profile, statements by total time and the slowest individual runs
+def report(limit=20):
+    with _lock:
+        stats = sorted(_stats.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        slow = sorted(_slow, reverse=True)
+    return {
+        "threshold_ms": threshold_ms(),
+        "statements": [
+            {
+                "sql": sql,
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total * 1000 / calls, 3),
+                "max_ms": round(worst * 1000, 3),
+            }
+            for sql, (calls, total, worst) in stats
+        ],
+        "slow": [entry for _, _, entry in slow],
+    }
+
+
+# forget everything recorded so far
+def reset():
+    with _lock:
+        _stats.clear()
+        _slow.clear()
+        _plans.clear()
@@ -1,34 +1,213 @@
+import contextlib
 import json
 import os
+import threading
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
+import uuid
 
 from fastmcp import FastMCP
 
 BRIDGE_URL = os.environ.get("TALKTOME_URL", "http://127.0.0.1:3456")
 
+# writes the bridge could not be reached for wait in this append only file, one
+# json line each, and are replayed in order once the bridge answers again
+SPOOL_PATH = os.environ.get(
+    "TALKTOME_SPOOL", os.path.join(os.path.expanduser("~"), ".talktome", "spool.jsonl")
+)
+
+# seconds between replay attempts while something is spooled
+REPLAY_INTERVAL = 5.0
+
+# a spool lock older than this was left behind by a proxy that died holding it
+LOCK_STALE = 30.0
+
 proxy = FastMCP("talktome")
 
 
-def call_bridge(endpoint, method="GET", data=None):
+# send one request to the bridge and return its status with the json body, a
+# bridge that cannot be reached raises OSError. a key makes the bridge apply the
+# write once however often it is sent
+def send_request(endpoint, method="GET", data=None, timeout=10, key=None):
+    headers = {}
+    payload = None
+    if data is not None:
+        payload = json.dumps(data).encode()
+        headers["Content-Type"] = "application/json"
+    if key:
+        headers["Idempotency-Key"] = key
+    req = urllib.request.Request(
+        f"{BRIDGE_URL}{endpoint}", data=payload, headers=headers, method=method
+    )
     try:
-        if data is not None:
-            payload = json.dumps(data).encode()
-            req = urllib.request.Request(
-                f"{BRIDGE_URL}{endpoint}",
-                data=payload,
-                headers={"Content-Type": "application/json"},
-                method=method,
-            )
-        else:
-            req = urllib.request.Request(f"{BRIDGE_URL}{endpoint}", method=method)
-        resp = urllib.request.urlopen(req, timeout=10)
-        return json.loads(resp.read())
-    except (urllib.error.URLError, OSError) as e:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        # error responses carry a json body with the reason, e.g. a 409 version conflict
+        try:
+            return e.code, json.loads(e.read())
+        except ValueError:
+            return e.code, {"error": str(e)}
+
+
+# the body of a bridge response, error responses come back as their json body
+def request_bridge(endpoint, method="GET", data=None, timeout=10, key=None):
+    return send_request(endpoint, method, data, timeout, key)[1]
+
+
+def call_bridge(endpoint, method="GET", data=None, timeout=10):
+    try:
+        return request_bridge(endpoint, method, data, timeout)
+    except OSError as e:
         return {"error": str(e)}
 
 
+# spool operations, several proxies share the file so every access holds a lock
+# file created exclusively, which works the same on every platform
+
+
+@contextlib.contextmanager
+def spool_lock():
+    lock = SPOOL_PATH + ".lock"
+    os.makedirs(os.path.dirname(lock) or ".", exist_ok=True)
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > LOCK_STALE:
+                    os.remove(lock)
+                    continue
+            except OSError:
+                # the holder just let go
+                continue
+            time.sleep(0.05)
+    try:
+        yield lock
+    finally:
+        os.close(fd)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(lock)
+
+
+def read_spool():
+    entries = []
+    try:
+        with open(SPOOL_PATH, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # a line cut short by a crash mid write
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def append_spool(entry):
+    with spool_lock():
+        with open(SPOOL_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def spooled():
+    try:
+        return os.path.getsize(SPOOL_PATH) > 0
+    except OSError:
+        return False
+
+
+# whether a replayed write is finished with. a 409 means the key is still in
+# progress or the write conflicts for now, and a 5xx is the bridge failing, both
+# are tried again later. any other 4xx will never succeed so it is dropped
+def settled(status):
+    return status < 500 and status != 409
+
+
+# send spooled writes for this bridge in the order they were made, stops at the
+# first one the bridge cannot be reached for or has not settled. true when none
+# are left
+def replay():
+    if not spooled():
+        return True
+    if call_bridge("/health", timeout=2).get("status") != "ok":
+        return False
+    with spool_lock() as lock:
+        entries = read_spool()
+        remaining = []
+        blocked = False
+        for entry in entries:
+            if not blocked and entry.get("bridge") == BRIDGE_URL:
+                try:
+                    status, _ = send_request(
+                        entry["endpoint"], entry["method"], entry["data"], key=entry["key"]
+                    )
+                    # keep the lock fresh so nobody takes it for a dead one
+                    os.utime(lock)
+                    if settled(status):
+                        continue
+                except OSError:
+                    pass
+                blocked = True
+            remaining.append(entry)
+        if remaining:
+            with open(SPOOL_PATH + ".tmp", "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(e) + "\n" for e in remaining)
+            os.replace(SPOOL_PATH + ".tmp", SPOOL_PATH)
+        else:
+            os.remove(SPOOL_PATH)
+    return not any(e.get("bridge") == BRIDGE_URL for e in remaining)
+
+
+# a write that has to reach the bridge eventually. when it cannot be reached the
+# write is spooled and replayed later, the agent gets an answer right away
+def write_bridge(endpoint, method, data):
+    entry = {
+        "bridge": BRIDGE_URL,
+        "endpoint": endpoint,
+        "method": method,
+        "data": data,
+        "key": uuid.uuid4().hex,
+        "queued_at": time.time(),
+    }
+    # nothing overtakes writes that are already waiting
+    if not replay():
+        append_spool(entry)
+        return queued()
+    try:
+        return request_bridge(endpoint, method, data, key=entry["key"])
+    except OSError:
+        append_spool(entry)
+        return queued()
+
+
+def queued():
+    return {
+        "result": "bridge unreachable, queued and will be delivered when it is back",
+        "queued": True,
+    }
+
+
+# replay the spool in the background while the proxy runs
+def start_replayer():
+    def loop():
+        while True:
+            time.sleep(REPLAY_INTERVAL)
+            try:
+                replay()
+            except OSError:
+                # a spool file that cannot be read now is tried again next time
+                pass
+
+    threading.Thread(target=loop, daemon=True).start()
+
+
 @proxy.tool()
 async def bridge_register(name: str, path: str) -> dict:
     """register a codebase with the bridge"""
@@ -37,61 +216,181 @@ async def bridge_register(name: str, path: str) -> dict:
 
 @proxy.tool()
 async def bridge_list_peers() -> list:
-    """list all connected codebases"""
+    """list connected codebases, agents that stopped checking in are left out"""
     result = call_bridge("/agents")
     if isinstance(result, list):
-        return [a["name"] for a in result]
+        return [a["name"] for a in result if a["status"] == "active"]
     return []
 
 
 @proxy.tool()
-async def bridge_send_message(sender: str, peer: str, message: str) -> str:
-    """send an async message to a peer codebase's mailbox"""
-    result = call_bridge(
-        "/send",
-        method="POST",
-        data={"sender": sender, "peer": peer, "message": message},
-    )
+async def bridge_send_message(
+    sender: str, peer: str, message: str, thread_id: str = "", ttl: int = 0
+) -> str:
+    """send an async message to a peer codebase's mailbox, optionally continuing a thread.
+    a ttl in seconds drops the message if it is still unread by then"""
+    data = {"sender": sender, "peer": peer, "message": message}
+    if thread_id:
+        data["thread_id"] = thread_id
+    if ttl:
+        data["ttl"] = ttl
+    result = write_bridge("/send", "POST", data)
     return result.get("result", str(result))
 
 
 @proxy.tool()
-async def bridge_read_mailbox(name: str) -> list[dict]:
-    """read and drain all incoming messages for this agent"""
-    result = call_bridge(f"/read/{name}")
+async def bridge_reply(sender: str, message_id: int, message: str) -> str:
+    """reply to a message by id, the answer goes to its sender in the same thread"""
+    result = write_bridge(
+        "/reply", "POST", {"sender": sender, "message_id": message_id, "message": message}
+    )
+    return result.get("result", result.get("error", str(result)))
+
+
+@proxy.tool()
+async def bridge_get_thread(thread_id: str) -> list[dict]:
+    """get every message in a conversation thread, oldest first"""
+    result = call_bridge(f"/thread/{urllib.parse.quote(thread_id)}")
     if isinstance(result, list):
         return result
     return []
 
 
 @proxy.tool()
-async def bridge_share_context(owner: str, key: str, value: str) -> str:
-    """push a piece of context that other peers can read"""
-    result = call_bridge(
-        "/context",
-        method="POST",
-        data={"owner": owner, "key": key, "value": value},
-    )
-    return result.get("result", str(result))
+async def bridge_get_blob(hash: str) -> str:
+    """fetch the full text of a large message, task result or context value by its blob hash"""
+    result = call_bridge(f"/blob/{hash}")
+    return result.get("value", result.get("error", str(result)))
+
+
+# query string that limits a mailbox call to one thread
+def thread_query(thread_id):
+    return f"?thread={urllib.parse.quote(thread_id)}" if thread_id else ""
+
+
+@proxy.tool()
+async def bridge_read_mailbox(name: str, thread_id: str = "") -> list[dict]:
+    """read and drain incoming messages for this agent, optionally only one thread"""
+    result = call_bridge(f"/read/{name}{thread_query(thread_id)}")
+    if isinstance(result, list):
+        return result
+    return []
+
+
+@proxy.tool()
+async def bridge_subscribe(agent: str, topic: str) -> str:
+    """subscribe to a named topic, messages published to it from now on show up
+    in your mailbox alongside direct messages"""
+    result = call_bridge("/subscribe", method="POST", data={"agent": agent, "topic": topic})
+    return result.get("result", result.get("error", str(result)))
+
+
+@proxy.tool()
+async def bridge_unsubscribe(agent: str, topic: str) -> str:
+    """stop receiving messages published to a topic"""
+    result = call_bridge("/unsubscribe", method="POST", data={"agent": agent, "topic": topic})
+    return result.get("result", result.get("error", str(result)))
+
+
+@proxy.tool()
+async def bridge_publish(sender: str, topic: str, message: str, ttl: int = 0) -> str:
+    """publish a message to every subscriber of a topic. it is stored once however
+    many peers listen, a ttl in seconds drops it for anyone who has not read it by then"""
+    data = {"sender": sender, "topic": topic, "message": message}
+    if ttl:
+        data["ttl"] = ttl
+    result = write_bridge("/publish", "POST", data)
+    return result.get("result", result.get("error", str(result)))
+
+
+@proxy.tool()
+async def bridge_list_topics() -> list[dict]:
+    """list topics with their subscribers and message counts"""
+    result = call_bridge("/topics")
+    if isinstance(result, list):
+        return result
+    return []
 
 
 @proxy.tool()
-async def bridge_get_context(owner: str, key: str) -> str:
-    """pull a piece of context from a peer"""
-    result = call_bridge(f"/context/{owner}/{key}")
+async def bridge_share_context(
+    owner: str, key: str, value: str, if_version: int | None = None, ttl: int = 0
+) -> str:
+    """push a piece of context that other peers can read. pass if_version to only
+    write when the key is still at that version, 0 to only create it, and a ttl
+    in seconds to have the entry expire"""
+    data = {"owner": owner, "key": key, "value": value}
+    if if_version is not None:
+        data["if_version"] = if_version
+    if ttl:
+        data["ttl"] = ttl
+    result = call_bridge("/context", method="POST", data=data)
+    if "result" in result:
+        return f"{result['result']} (version {result['version']})"
+    return result.get("error", str(result))
+
+
+@proxy.tool()
+async def bridge_get_context(owner: str, key: str, if_newer: int | None = None) -> str:
+    """pull a piece of context from a peer. pass the version of a cached copy as
+    if_newer to skip the value when it has not changed"""
+    query = f"?if_newer={if_newer}" if if_newer is not None else ""
+    result = call_bridge(f"/context/{owner}/{key}{query}")
+    if result.get("unchanged"):
+        return f"context '{key}' unchanged since version {if_newer}"
     if "value" in result:
         return result["value"]
     return result.get("error", str(result))
 
 
+@proxy.tool()
+async def bridge_get_context_many(owner: str, keys: list[str]) -> dict:
+    """pull several context values from a peer in one call, missing keys are left out"""
+    result = call_bridge(f"/context/{owner}/many", method="POST", data={"keys": keys})
+    if "error" in result:
+        return {}
+    return result
+
+
+@proxy.tool()
+async def bridge_list_context(owner: str, prefix: str = "") -> list[dict]:
+    """list a peer's context keys with their versions, optionally only keys starting with prefix"""
+    query = f"?prefix={urllib.parse.quote(prefix)}" if prefix else ""
+    result = call_bridge(f"/context/{owner}{query}")
+    if isinstance(result, list):
+        return result
+    return []
+
+
+@proxy.tool()
+async def bridge_watch_context(
+    owner: str, since: int = 0, prefix: str = "", timeout: int = 30
+) -> dict:
+    """wait for a peer's context to change after version since, returns the changed
+    entries and the version to pass as since next time, since 0 returns everything"""
+    query = urllib.parse.urlencode({"since": since, "prefix": prefix, "timeout": timeout})
+    # the bridge holds the request open for up to timeout seconds
+    return call_bridge(f"/watch/context/{owner}?{query}", timeout=timeout + 10)
+
+
+@proxy.tool()
+async def bridge_search(
+    query: str, kinds: str = "", agent: str = "", limit: int = 20
+) -> list[dict]:
+    """full text search over messages, tasks and context, best matches first with
+    snippets. kinds is a comma separated subset of message,task,context and agent
+    limits it to what one agent sent, received, was assigned or owns"""
+    params = urllib.parse.urlencode({"q": query, "kinds": kinds, "agent": agent, "limit": limit})
+    result = call_bridge(f"/search?{params}")
+    if isinstance(result, list):
+        return result
+    return [result]
+
+
 @proxy.tool()
 async def bridge_create_task(agent: str, description: str) -> dict:
     """create a task assigned to an agent"""
-    return call_bridge(
-        "/task",
-        method="POST",
-        data={"agent": agent, "description": description},
-    )
+    return write_bridge("/task", "POST", {"agent": agent, "description": description})
 
 
 @proxy.tool()
@@ -112,16 +411,18 @@ async def bridge_update_task(task_id: str, status: str, result: str = "") -> dic
     data = {"status": status}
     if result:
         data["result"] = result
-    return call_bridge(f"/task/{task_id}", method="PATCH", data=data)
+    return write_bridge(f"/task/{task_id}", "PATCH", data)
 
 
 @proxy.tool()
-async def bridge_wait_for_reply(name: str, timeout: int = 30) -> list[dict]:
-    """wait for messages to arrive in this agent's mailbox, polling every 2s"""
+async def bridge_wait_for_reply(name: str, timeout: int = 30, thread_id: str = "") -> list[dict]:
+    """wait for messages to arrive in this agent's mailbox, polling every 2s
+    with a thread_id only replies in that thread count, the rest stay unread"""
+    query = thread_query(thread_id)
     deadline = time.time() + timeout
     while time.time() < deadline:
-        result = call_bridge(f"/peek/{name}")
+        result = call_bridge(f"/peek/{name}{query}")
         if isinstance(result, dict) and result.get("count", 0) > 0:
-            return call_bridge(f"/read/{name}")
+            return call_bridge(f"/read/{name}{query}")
         time.sleep(2)
     return []
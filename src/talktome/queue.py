@@ -1,23 +1,241 @@
-from talktome import db
+import bisect
+import threading
+import time
 
-# thin wrapper, delegates to sqlite backed db module
+from talktome import db, notify
 
+# wrapper over the sqlite backed db module that also keeps an in-memory index of
+# what every agent has unread, so counts and empty peeks never touch the database.
+# sqlite stays the source of truth, the index is rebuilt from it at startup,
+# whenever the database is swapped or wiped and after another worker wrote to a
+# mailbox, and every write made here updates it
 
-def send(sender_agent, receiver_agent, message):
-    return db.send_message(sender_agent, receiver_agent, message)
+# topic published after every mailbox write so other workers rebuild their index
+MAILBOX_TOPIC = "mailbox"
 
+_lock = threading.RLock()
+_epoch = None
+# mailbox writes reported by other workers
+_remote_writes = 0
+# agent -> {message id: expires_at} for unread direct messages
+_direct = {}
+# agent -> {topic: cursor}
+_cursors = {}
+# topic -> newest topic message id
+_last = {}
+# topic -> [(id, sender, expires_at)] oldest first, only what some cursor has not passed
+_pending = {}
 
-def read(agent):
-    return db.read_messages(agent)
 
+# load the index from the database, call after writing to it behind this module's back
+def rebuild():
+    global _epoch, _direct, _cursors, _last, _pending
+    with _lock:
+        # taken before the snapshot, a write reported while it loads triggers another rebuild
+        epoch = (db.epoch(), _remote_writes)
+        snapshot = db.mailbox_snapshot()
+        direct = {}
+        for receiver, message_id, expires_at in snapshot["direct"]:
+            direct.setdefault(receiver, {})[message_id] = expires_at
+        cursors = {}
+        for agent, topic, cursor in snapshot["cursors"]:
+            cursors.setdefault(agent, {})[topic] = cursor
+        pending = {}
+        for topic, message_id, sender, expires_at in snapshot["pending"]:
+            pending.setdefault(topic, []).append((message_id, sender, expires_at))
+        _direct, _cursors, _last, _pending = direct, cursors, snapshot["last"], pending
+        _epoch = epoch
 
-def peek(agent):
-    return db.peek_messages(agent)
+
+def _fresh():
+    if (db.epoch(), _remote_writes) != _epoch:
+        rebuild()
+
+
+def _written_elsewhere(topic):
+    global _remote_writes
+    _remote_writes += 1
+
+
+notify.on_remote(MAILBOX_TOPIC, _written_elsewhere)
+
+
+def _expiry(ttl, timestamp):
+    return timestamp + ttl if ttl and ttl > 0 else None
+
+
+def _live(expires_at, now):
+    return expires_at is None or expires_at > now
+
+
+# unread direct messages, expired ones are dropped since no read returns them again
+def _direct_count(agent, now):
+    unread = _direct.get(agent)
+    if not unread:
+        return 0
+    for message_id in [i for i, e in unread.items() if not _live(e, now)]:
+        del unread[message_id]
+    return len(unread)
+
+
+# unread topic messages, the ones past each cursor that someone else published
+def _topic_count(agent, now):
+    total = 0
+    for topic, cursor in _cursors.get(agent, {}).items():
+        entries = _pending.get(topic, [])
+        start = bisect.bisect_right(entries, cursor, key=lambda e: e[0])
+        total += sum(1 for _, sender, e in entries[start:] if sender != agent and _live(e, now))
+    return total
+
+
+# forget topic messages every subscriber has read
+def _prune(topic):
+    cursors = [c[topic] for c in _cursors.values() if topic in c]
+    entries = _pending.get(topic)
+    if not entries:
+        return
+    if not cursors:
+        del _pending[topic]
+        return
+    del entries[: bisect.bisect_right(entries, min(cursors), key=lambda e: e[0])]
+
+
+# move an agent's cursors forward like the database did, then prune those topics
+def _advance(agent, positions):
+    cursors = _cursors.get(agent, {})
+    for topic, message_id in positions.items():
+        if topic in cursors and cursors[topic] < message_id:
+            cursors[topic] = message_id
+            _prune(topic)
+
+
+def _forget(agent, messages):
+    unread = _direct.get(agent, {})
+    for m in messages:
+        unread.pop(m["id"], None)
+
+
+def send(
+    sender_agent,
+    receiver_agent,
+    message,
+    thread_id=None,
+    reply_to=None,
+    ttl=None,
+    reply_bridge=None,
+):
+    with _lock:
+        _fresh()
+        entry = db.send_message(
+            sender_agent, receiver_agent, message, thread_id, reply_to, ttl, reply_bridge
+        )
+        _direct.setdefault(receiver_agent, {})[entry["id"]] = _expiry(ttl, entry["timestamp"])
+    notify.publish(MAILBOX_TOPIC)
+    return entry
+
+
+def reply(sender_agent, message_id, message):
+    with _lock:
+        _fresh()
+        entry = db.reply_message(sender_agent, message_id, message)
+        if entry is not None:
+            _direct.setdefault(entry["to"], {})[entry["id"]] = None
+    notify.publish(MAILBOX_TOPIC)
+    return entry
+
+
+def thread(thread_id):
+    return db.get_thread(thread_id)
+
+
+# a mailbox holds direct messages and messages on subscribed topics, oldest first
+# a thread only ever holds direct messages
+def _merge(direct, topic):
+    return sorted(direct + topic, key=lambda m: m["timestamp"])
+
+
+# true when the index says nothing is unread and that can be trusted. other
+# workers announce their writes over udp and a datagram can get lost, so with
+# several workers an empty mailbox is confirmed by the database
+def _empty(agent):
+    return count(agent) == 0 and not notify.joined()
+
+
+def read(agent, thread_id=None):
+    with _lock:
+        if _empty(agent):
+            return []
+        direct = db.read_messages(agent, thread_id)
+        _forget(agent, direct)
+        topic = [] if thread_id else db.read_topic_messages(agent)
+        _advance(agent, {m["topic"]: m["topic_message_id"] for m in topic})
+    notify.publish(MAILBOX_TOPIC)
+    return _merge(direct, topic)
+
+
+def peek(agent, thread_id=None):
+    if _empty(agent):
+        return []
+    if thread_id:
+        return db.peek_messages(agent, thread_id)
+    return _merge(db.peek_messages(agent), db.peek_topic_messages(agent))
 
 
 def clear(agent):
-    return db.clear_messages(agent)
+    with _lock:
+        _fresh()
+        cleared = db.clear_messages(agent)
+        cleared = db.clear_topic_messages(agent) or cleared
+        _direct.pop(agent, None)
+        _advance(agent, {topic: _last.get(topic, 0) for topic in _cursors.get(agent, {})})
+    notify.publish(MAILBOX_TOPIC)
+    return cleared
 
 
+# unread direct and topic messages, answered from the index
 def count(agent):
-    return db.message_count(agent)
+    with _lock:
+        _fresh()
+        now = time.time()
+        return _direct_count(agent, now) + _topic_count(agent, now)
+
+
+def publish(sender_agent, topic, message, ttl=None):
+    with _lock:
+        _fresh()
+        entry = db.publish(sender_agent, topic, message, ttl)
+        message_id = entry["topic_message_id"]
+        _last[topic] = max(_last.get(topic, 0), message_id)
+        if any(topic in c for c in _cursors.values()):
+            expires_at = _expiry(ttl, entry["timestamp"])
+            _pending.setdefault(topic, []).append((message_id, sender_agent, expires_at))
+    notify.publish(MAILBOX_TOPIC)
+    return entry
+
+
+def subscribe(agent, topic):
+    with _lock:
+        _fresh()
+        created = db.subscribe(agent, topic)
+        if created:
+            _cursors.setdefault(agent, {})[topic] = _last.get(topic, 0)
+    notify.publish(MAILBOX_TOPIC)
+    return created
+
+
+def unsubscribe(agent, topic):
+    with _lock:
+        _fresh()
+        removed = db.unsubscribe(agent, topic)
+        if _cursors.get(agent, {}).pop(topic, None) is not None:
+            _prune(topic)
+    notify.publish(MAILBOX_TOPIC)
+    return removed
+
+
+def subscriptions(agent):
+    return db.get_subscriptions(agent)
+
+
+def topics():
+    return db.list_topics()
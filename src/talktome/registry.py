@@ -1,35 +1,98 @@
-from talktome import db
+import threading
 
-# thin wrapper, delegates to sqlite backed db module
+from talktome import db, notify
+
+# wrapper over the db module that keeps the agents table in memory. the table is
+# small and changes rarely while every send validates its peer and every /agents
+# poll reads each entry, so lookups are served from a dict that is reloaded in
+# one query after db reports a write to the agents table, or another worker does
+
+# topic published after every write to the agents table
+AGENTS_TOPIC = "agents"
+
+_lock = threading.Lock()
+_agents = {}
+_generation = None
+# agent writes reported by other workers
+_remote_writes = 0
+
+
+# the cached agents by name, reloaded when the table changed since the last load
+def _cached():
+    global _agents, _generation
+    generation = (db.agents_generation(), _remote_writes)
+    if generation == _generation:
+        return _agents
+    with _lock:
+        if generation != _generation:
+            # read the generation before the rows so a write that lands during
+            # the load bumps it again and the next lookup reloads
+            _agents = db.get_agents()
+            _generation = generation
+        return _agents
+
+
+# force the next lookup to read the table again
+def invalidate():
+    global _generation
+    _generation = None
+
+
+def _written_elsewhere(topic):
+    global _remote_writes
+    _remote_writes += 1
+
+
+notify.on_remote(AGENTS_TOPIC, _written_elsewhere)
+
+
+# tell other workers the agents table changed, the local cache sees it through db
+def changed():
+    notify.publish(AGENTS_TOPIC)
 
 
 def register(name, path, metadata=None):
-    return db.register(name, path, metadata)
+    entry = db.register(name, path, metadata)
+    changed()
+    return entry
 
 
 def deregister(name):
-    return db.deregister(name)
+    deleted = db.deregister(name)
+    changed()
+    return deleted
 
 
 def get(name):
-    return db.get_agent(name)
+    entry = _cached().get(name)
+    if entry is None:
+        return None
+    return dict(entry, metadata=dict(entry["metadata"]))
 
 
 def list_all():
-    return db.list_agents()
+    return sorted(_cached())
+
+
+def list_active():
+    return sorted(name for name, entry in _cached().items() if entry["status"] == "active")
 
 
 def update_status(name, status):
-    return db.update_status(name, status)
+    updated = db.update_status(name, status)
+    changed()
+    return updated
 
 
 def update_metadata(name, metadata):
-    return db.update_metadata(name, metadata)
+    updated = db.update_metadata(name, metadata)
+    changed()
+    return updated
 
 
 def is_registered(name):
-    return db.is_registered(name)
+    return name in _cached()
 
 
 def count():
-    return db.agent_count()
+    return len(_cached())
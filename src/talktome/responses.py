@@ -0,0 +1,75 @@
+import gzip
+import json
+import zlib
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse as StarletteJSONResponse
+
+# orjson is an optional speedup, the stdlib encoder is always available as a fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# bodies smaller than this are sent as is, compressing them costs more than it saves
+COMPRESS_MIN_BYTES = 1024
+
+# encodings we know how to produce, in order of preference
+ENCODINGS = ("gzip", "deflate")
+
+
+# serialize a payload to compact utf8 json bytes
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# pick the best encoding the client accepts from an accept encoding header
+# returns none when the client only accepts identity
+def choose_encoding(accept_encoding):
+    offered = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[token] = quality
+    for encoding in ENCODINGS:
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+# compress a body with the given content encoding
+# mtime is pinned so identical payloads produce identical bytes
+def compress(body, encoding):
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    if encoding == "deflate":
+        return zlib.compress(body, 6)
+    raise ValueError(f"unsupported encoding '{encoding}'")
+
+
+# json response with a fast compact encoder and negotiated compression
+# compression happens at send time because that is where the request headers are visible
+class JSONResponse(StarletteJSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+    async def __call__(self, scope, receive, send):
+        if len(self.body) >= COMPRESS_MIN_BYTES:
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding:
+                self.body = compress(self.body, encoding)
+                self.headers["content-encoding"] = encoding
+                self.headers["content-length"] = str(len(self.body))
+            self.headers.add_vary_header("Accept-Encoding")
+        await super().__call__(scope, receive, send)
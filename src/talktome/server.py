@@ -1,17 +1,123 @@
+import functools
+import hashlib
 import json
 import os
+import time
 import uuid
-from pathlib import Path
 
 from fastmcp import FastMCP
-from starlette.responses import HTMLResponse, JSONResponse
-
-from talktome import db, queue, registry
+from fastmcp.server.middleware import Middleware
+from starlette.responses import PlainTextResponse
+
+from talktome import (
+    assets,
+    db,
+    federation,
+    maintenance,
+    metrics,
+    notify,
+    presence,
+    profiler,
+    queue,
+    registry,
+)
+from talktome.responses import JSONResponse
 
 # path where claude code stores project session files on disk
 CLAUDE_PROJECTS_DIR = os.path.join(os.path.expanduser("~"), ".claude", "projects")
 
-mcp = FastMCP("talktome")
+mcp = FastMCP("talktome", lifespan=maintenance.lifespan)
+
+
+# counts and times every mcp tool call
+class ToolMetrics(Middleware):
+    async def on_call_tool(self, context, call_next):
+        tool = context.message.name
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await call_next(context)
+            outcome = "ok"
+            return result
+        finally:
+            metrics.TOOL_CALLS.inc(tool=tool, outcome=outcome)
+            metrics.TOOL_DURATION.observe(time.perf_counter() - start, tool=tool)
+
+
+mcp.add_middleware(ToolMetrics())
+
+
+# seconds a write's idempotency key and response are kept for retries
+IDEMPOTENCY_TTL = 86400.0
+
+# seconds after which a claimed key with no response is taken for abandoned, a
+# bridge that died mid request never stored one and would block retries for a day
+IDEMPOTENCY_CLAIM_STALE = 30.0
+
+
+# run a write once per idempotency key, a retry of a request that already
+# finished gets the first response back instead of applying the write again.
+# keys are scoped to the method and path, and a key reused with another body
+# is refused instead of answering it with the response to a different write
+async def idempotent(key, handler, request):
+    key = f"{request.method} {request.url.path} {key}"
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+    claimed, existing = db.claim_idempotency_key(
+        key, fingerprint, IDEMPOTENCY_TTL, IDEMPOTENCY_CLAIM_STALE
+    )
+    if not claimed:
+        if existing is not None and existing["fingerprint"] != fingerprint:
+            return JSONResponse(
+                {"error": "this idempotency key was used with a different request body"},
+                status_code=422,
+            )
+        if existing is None or existing["response"] is None:
+            return JSONResponse(
+                {"error": "a request with this idempotency key is in progress"}, status_code=409
+            )
+        return JSONResponse(
+            json.loads(existing["response"]),
+            status_code=existing["status"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+    try:
+        response = await handler(request)
+    except BaseException:
+        db.release_idempotency_key(key)
+        raise
+    if response.status_code >= 400:
+        # nothing was written, let a corrected retry through
+        db.release_idempotency_key(key)
+    else:
+        db.store_idempotent_response(key, response.status_code, response.body.decode())
+    return response
+
+
+# register a rest endpoint, recording request counts and latency under its path template
+# writes that carry an Idempotency-Key header are applied once per key
+def route(path, methods):
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def instrumented(request):
+            metrics.HTTP_IN_FLIGHT.inc()
+            start = time.perf_counter()
+            status = 500
+            try:
+                key = request.headers.get("idempotency-key")
+                if key and request.method in ("POST", "PATCH"):
+                    response = await idempotent(key, handler, request)
+                else:
+                    response = await handler(request)
+                status = response.status_code
+                return response
+            finally:
+                metrics.HTTP_IN_FLIGHT.dec()
+                metrics.HTTP_REQUESTS.inc(route=path, method=request.method, status=status)
+                metrics.HTTP_DURATION.observe(time.perf_counter() - start, route=path)
+
+        return mcp.custom_route(path, methods=methods)(instrumented)
+
+    return decorator
 
 
 @mcp.tool()
@@ -23,51 +129,253 @@ async def bridge_register(name: str, path: str) -> dict:
 
 @mcp.tool()
 async def bridge_list_peers() -> list:
-    """list all connected codebases"""
-    return registry.list_all()
+    """list connected codebases, agents that stopped checking in are left out"""
+    remote = [a["name"] for a in federation.remote_agents() if a["status"] == "active"]
+    return sorted(registry.list_active() + remote)
 
 
 @mcp.tool()
-async def bridge_send_message(sender: str, peer: str, message: str) -> str:
-    """send an async message to a peer codebase's mailbox"""
-    if not registry.is_registered(peer):
+async def bridge_send_message(
+    sender: str, peer: str, message: str, thread_id: str = "", ttl: int = 0
+) -> str:
+    """send an async message to a peer codebase's mailbox, optionally continuing a thread.
+    a ttl in seconds drops the message if it is still unread by then"""
+    bridge = federation.bridge_for(peer)
+    if bridge is None and not registry.is_registered(peer):
         return f"peer '{peer}' not found"
-    queue.send(sender, peer, message)
-    db.log_activity("message", sender=sender, peer=peer, content=message)
-    return f"message sent to {peer}"
+    presence.touch(sender)
+    if bridge:
+        entry = send_remote(bridge, sender, peer, message, thread_id or None, ttl)
+        return f"message queued for {peer} on {bridge} in thread {entry['thread_id']}"
+    entry = queue.send(sender, peer, message, thread_id=thread_id or None, ttl=ttl)
+    db.log_activity("message", sender=sender, peer=peer, content=db.preview(message))
+    return f"message sent to {peer} in thread {entry['thread_id']}"
+
+
+# queue a message for an agent on a peer bridge
+def send_remote(bridge, sender, peer, message, thread_id, ttl):
+    entry = federation.forward_message(bridge, sender, peer, message, thread_id, ttl)
+    db.log_activity("message", sender=sender, peer=peer, content=db.preview(message), via=bridge)
+    return entry
+
+
+# answer a message, forwarded when its sender is on a peer bridge
+def reply_any(sender, message_id, message):
+    entry = federation.reply(sender, message_id, message)
+    if entry is not None:
+        db.log_activity(
+            "message",
+            sender=sender,
+            peer=entry["to"],
+            content=db.preview(message),
+            via=entry["bridge"],
+        )
+        return entry
+    entry = queue.reply(sender, message_id, message)
+    if entry is not None:
+        db.log_activity("message", sender=sender, peer=entry["to"], content=db.preview(message))
+    return entry
 
 
 @mcp.tool()
-async def bridge_read_mailbox(name: str) -> list[dict]:
-    """read and drain all incoming messages for this agent"""
-    return queue.read(name)
+async def bridge_reply(sender: str, message_id: int, message: str) -> str:
+    """reply to a message by id, the answer goes to its sender in the same thread"""
+    presence.touch(sender)
+    entry = reply_any(sender, message_id, message)
+    if entry is None:
+        return f"message {message_id} not found"
+    if "bridge" in entry:
+        return f"reply queued for {entry['to']} on {entry['bridge']} in thread {entry['thread_id']}"
+    return f"reply sent to {entry['to']} in thread {entry['thread_id']}"
 
 
 @mcp.tool()
-async def bridge_share_context(owner: str, key: str, value: str) -> str:
-    """push a piece of context that other peers can read"""
-    db.set_context(owner, key, value)
-    return f"context '{key}' stored for {owner}"
+async def bridge_get_thread(thread_id: str) -> list[dict]:
+    """get every message in a conversation thread, oldest first"""
+    return queue.thread(thread_id)
 
 
 @mcp.tool()
-async def bridge_get_context(owner: str, key: str) -> str:
-    """pull a piece of context from a peer"""
-    value = db.get_context(owner, key)
-    if value is None:
+async def bridge_get_blob(hash: str) -> str:
+    """fetch the full text of a large message, task result or context value by its blob hash"""
+    blob = db.get_blob(hash)
+    if blob is None:
+        return f"blob '{hash}' not found"
+    return blob["value"]
+
+
+@mcp.tool()
+async def bridge_read_mailbox(name: str, thread_id: str = "") -> list[dict]:
+    """read and drain incoming messages for this agent, optionally only one thread"""
+    presence.touch(name)
+    return queue.read(name, thread_id or None)
+
+
+@mcp.tool()
+async def bridge_subscribe(agent: str, topic: str) -> str:
+    """subscribe to a named topic, messages published to it from now on show up
+    in your mailbox alongside direct messages"""
+    if not topic:
+        return "topic required"
+    if not queue.subscribe(agent, topic):
+        return f"{agent} is already subscribed to '{topic}'"
+    return f"{agent} subscribed to '{topic}'"
+
+
+@mcp.tool()
+async def bridge_unsubscribe(agent: str, topic: str) -> str:
+    """stop receiving messages published to a topic"""
+    if not queue.unsubscribe(agent, topic):
+        return f"{agent} is not subscribed to '{topic}'"
+    return f"{agent} unsubscribed from '{topic}'"
+
+
+@mcp.tool()
+async def bridge_publish(sender: str, topic: str, message: str, ttl: int = 0) -> str:
+    """publish a message to every subscriber of a topic. it is stored once however
+    many peers listen, a ttl in seconds drops it for anyone who has not read it by then"""
+    if not topic:
+        return "topic required"
+    presence.touch(sender)
+    entry = queue.publish(sender, topic, message, ttl)
+    db.log_activity("publish", sender=sender, topic=topic, content=db.preview(message))
+    return f"published to '{topic}' for {entry['subscribers']} subscriber(s)"
+
+
+@mcp.tool()
+async def bridge_list_topics() -> list[dict]:
+    """list topics with their subscribers and message counts"""
+    return queue.topics()
+
+
+# longest a context watch may block before it returns with no changes
+MAX_WATCH_SECONDS = 60
+
+
+# store a context value and wake anyone watching that owner
+# returns the new version, or none when an if_version condition failed
+def store_context(owner, key, value, if_version=None, ttl=None):
+    version = db.set_context(owner, key, value, if_version, ttl)
+    if version is not None:
+        notify.publish(f"context:{owner}")
+    return version
+
+
+# what a failed conditional write tells the caller
+def context_conflict(owner, key, if_version):
+    entry = db.get_context_entry(owner, key)
+    current = entry["version"] if entry else None
+    if if_version == 0:
+        message = f"context '{key}' already exists for {owner} at version {current}"
+    elif current is None:
+        message = f"no context '{key}' found for {owner}"
+    else:
+        message = f"context '{key}' for {owner} is at version {current}, not {if_version}"
+    return message, current
+
+
+# changes to an owner's context after since, waiting up to timeout seconds for one
+async def watch_context(owner, since, prefix, timeout):
+    deadline = time.monotonic() + min(max(timeout, 0), MAX_WATCH_SECONDS)
+    while True:
+        # listen before looking so a write in between still wakes us
+        event = notify.listen(f"context:{owner}")
+        result = db.context_changes(owner, since, prefix)
+        remaining = deadline - time.monotonic()
+        if result["changes"] or remaining <= 0:
+            return result
+        await notify.wait(event, remaining)
+
+
+@mcp.tool()
+async def bridge_share_context(
+    owner: str, key: str, value: str, if_version: int | None = None, ttl: int = 0
+) -> str:
+    """push a piece of context that other peers can read. pass if_version to only
+    write when the key is still at that version, 0 to only create it, and a ttl
+    in seconds to have the entry expire"""
+    version = store_context(owner, key, value, if_version, ttl)
+    if version is None:
+        return context_conflict(owner, key, if_version)[0]
+    return f"context '{key}' stored for {owner} (version {version})"
+
+
+@mcp.tool()
+async def bridge_get_context(owner: str, key: str, if_newer: int | None = None) -> str:
+    """pull a piece of context from a peer. pass the version of a cached copy as
+    if_newer to skip the value when it has not changed"""
+    entry = db.get_context_entry(owner, key, if_newer)
+    if entry is None:
         return f"no context '{key}' found for {owner}"
-    return value
+    if entry.get("unchanged"):
+        return f"context '{key}' unchanged since version {if_newer}"
+    return entry["value"]
 
 
 @mcp.tool()
-async def bridge_create_task(agent: str, description: str) -> dict:
-    """create a task assigned to an agent"""
+async def bridge_get_context_many(owner: str, keys: list[str]) -> dict:
+    """pull several context values from a peer in one call, missing keys are left out"""
+    return db.get_context_many(owner, keys)
+
+
+@mcp.tool()
+async def bridge_list_context(owner: str, prefix: str = "") -> list[dict]:
+    """list a peer's context keys with their versions, optionally only keys starting with prefix"""
+    return db.list_context(owner, prefix)
+
+
+@mcp.tool()
+async def bridge_watch_context(
+    owner: str, since: int = 0, prefix: str = "", timeout: int = 30
+) -> dict:
+    """wait for a peer's context to change after version since, returns the changed
+    entries and the version to pass as since next time, since 0 returns everything"""
+    return await watch_context(owner, since, prefix, timeout)
+
+
+# the kinds a search covers, from a comma separated list, empty means all of them
+def search_kinds(kinds):
+    requested = [k.strip() for k in kinds.split(",") if k.strip()]
+    return tuple(k for k in requested if k in db.SEARCH_KINDS) or db.SEARCH_KINDS
+
+
+@mcp.tool()
+async def bridge_search(
+    query: str, kinds: str = "", agent: str = "", limit: int = 20
+) -> list[dict]:
+    """full text search over messages, tasks and context, best matches first with
+    snippets. kinds is a comma separated subset of message,task,context and agent
+    limits it to what one agent sent, received, was assigned or owns"""
+    try:
+        return db.search(query, search_kinds(kinds), agent, min(max(limit, 1), 100))
+    except db.SearchUnavailable as e:
+        return [{"error": str(e)}]
+
+
+# create a task here, tasks for an agent on a peer bridge are also sent there
+# raises ValueError when that peer could not report back to this bridge
+def create_task(agent, description):
+    bridge = federation.bridge_for(agent)
+    reason = federation.unreachable_from(bridge) if bridge else None
+    if reason:
+        raise ValueError(reason)
     task_id = uuid.uuid4().hex[:8]
     task = db.create_task(task_id, agent, description)
     db.log_activity("task_created", agent=agent, task_id=task_id, description=description)
+    if bridge:
+        federation.forward_task(bridge, task)
     return task
 
 
+@mcp.tool()
+async def bridge_create_task(agent: str, description: str) -> dict:
+    """create a task assigned to an agent"""
+    try:
+        return create_task(agent, description)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
 @mcp.tool()
 async def bridge_get_tasks(agent: str = "") -> list:
     """get tasks, optionally filtered by agent"""
@@ -83,22 +391,74 @@ async def bridge_update_task(task_id: str, status: str, result: str = "") -> dic
     if task is None:
         return {"error": f"task '{task_id}' not found"}
     db.log_activity("task_updated", task_id=task_id, status=status)
+    federation.task_updated(task, result or None)
     return task
 
 
-@mcp.custom_route("/health", methods=["GET"])
+@route("/health", methods=["GET"])
 async def health(request):
     return JSONResponse({"status": "ok"})
 
 
-@mcp.custom_route("/peek/{name}", methods=["GET"])
+@route("/metrics", methods=["GET"])
+async def metrics_rest(request):
+    # gauges derived from the database are refreshed on each scrape
+    metrics.MAILBOX_DEPTH.replace(
+        ({"agent": agent}, count) for agent, count in db.mailbox_depths().items()
+    )
+    metrics.TASKS.replace(({"status": status}, n) for status, n in db.task_counts().items())
+    metrics.AGENTS.replace(({"status": status}, n) for status, n in db.agent_counts().items())
+    metrics.WAL_BYTES.set(db.wal_size())
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@route("/stats", methods=["GET"])
+async def stats_rest(request):
+    return JSONResponse(db.storage_stats())
+
+
+@route("/search", methods=["GET"])
+async def search_rest(request):
+    params = request.query_params
+    query = params.get("q", "")
+    if not query.strip():
+        return JSONResponse({"error": "q required"}, status_code=400)
+    try:
+        limit = min(max(int(params.get("limit", "20")), 1), 100)
+    except ValueError:
+        return JSONResponse({"error": "limit must be an integer"}, status_code=400)
+    try:
+        hits = db.search(
+            query, search_kinds(params.get("kinds", "")), params.get("agent", ""), limit
+        )
+    except db.SearchUnavailable as e:
+        return JSONResponse({"error": str(e)}, status_code=501)
+    return JSONResponse(hits)
+
+
+@route("/debug/queries", methods=["GET"])
+async def debug_queries(request):
+    try:
+        limit = max(int(request.query_params.get("limit", "20")), 1)
+    except ValueError:
+        return JSONResponse({"error": "limit must be an integer"}, status_code=400)
+    return JSONResponse(profiler.report(limit))
+
+
+@route("/debug/queries/reset", methods=["POST"])
+async def debug_queries_reset(request):
+    profiler.reset()
+    return JSONResponse({"result": "query profile cleared"})
+
+
+@route("/peek/{name}", methods=["GET"])
 async def peek(request):
     name = request.path_params["name"]
-    messages = queue.peek(name)
+    messages = queue.peek(name, request.query_params.get("thread") or None)
     return JSONResponse({"count": len(messages), "messages": messages})
 
 
-@mcp.custom_route("/register", methods=["POST"])
+@route("/register", methods=["POST"])
 async def register_rest(request):
     body = await request.json()
     name = body.get("name", "")
@@ -115,7 +475,7 @@ async def register_rest(request):
     return JSONResponse(entry)
 
 
-@mcp.custom_route("/deregister", methods=["POST"])
+@route("/deregister", methods=["POST"])
 async def deregister_rest(request):
     body = await request.json()
     name = body.get("name", "")
@@ -126,7 +486,7 @@ async def deregister_rest(request):
     return JSONResponse({"result": f"{name} marked inactive"})
 
 
-@mcp.custom_route("/agents", methods=["GET"])
+@route("/agents", methods=["GET"])
 async def agents(request):
     names = registry.list_all()
     result = []
@@ -143,21 +503,84 @@ async def agents(request):
                 "mailbox_count": queue.count(name),
             }
         )
+    # agents on peer bridges, messages to them are forwarded
+    for entry in federation.remote_agents():
+        result.append(
+            {
+                "name": entry["name"],
+                "path": "",
+                "status": entry["status"],
+                "last_seen": entry["last_seen"],
+                "session_id": "",
+                "mailbox_count": 0,
+                "bridge": entry["bridge"],
+            }
+        )
     return JSONResponse(result)
 
 
-@mcp.custom_route("/activity", methods=["GET"])
+# peers, the agents they reported and how many items wait for each
+@route("/federation", methods=["GET"])
+async def federation_rest(request):
+    return JSONResponse(federation.status())
+
+
+# a peer reporting its agents, answered with the agents registered here
+@route("/federation/sync", methods=["POST"])
+async def federation_sync_rest(request):
+    if not federation.authorized(request.headers):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    body = await request.json()
+    bridge = body.get("bridge", "")
+    agents = body.get("agents")
+    if not bridge or not isinstance(agents, list):
+        return JSONResponse({"error": "bridge and agents required"}, status_code=400)
+    bridge = bridge.rstrip("/")
+    if not federation.trusted(bridge):
+        return JSONResponse({"error": f"{bridge} is not a configured peer"}, status_code=403)
+    db.set_remote_agents(bridge, agents)
+    return JSONResponse({"bridge": federation.self_url(), "agents": federation.local_agents()})
+
+
+# a batch of messages, tasks and task updates from a peer's outbox
+@route("/federation/deliver", methods=["POST"])
+async def federation_deliver_rest(request):
+    if not federation.authorized(request.headers):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    body = await request.json()
+    origin = body.get("origin", "")
+    items = body.get("items")
+    if not origin or not isinstance(items, list):
+        return JSONResponse({"error": "origin and items required"}, status_code=400)
+    origin = origin.rstrip("/")
+    if not federation.trusted(origin):
+        return JSONResponse({"error": f"{origin} is not a configured peer"}, status_code=403)
+    for item in items:
+        error = federation.invalid(item)
+        if error:
+            return JSONResponse({"error": error}, status_code=400)
+    return JSONResponse({"accepted": federation.receive(origin, items)})
+
+
+@route("/activity", methods=["GET"])
 async def activity(request):
     return JSONResponse(db.get_activity())
 
 
-@mcp.custom_route("/", methods=["GET"])
+@route("/", methods=["GET"])
 async def dashboard(request):
-    html_path = Path(__file__).parent / "dashboard.html"
-    return HTMLResponse(html_path.read_text(encoding="utf-8"))
+    return assets.respond(request, assets.get("dashboard.html"), assets.PAGE_CACHE_CONTROL)
+
 
+@route("/static/{name}", methods=["GET"])
+async def static_asset(request):
+    asset = assets.get(request.path_params["name"])
+    if asset is None or asset.name == "dashboard.html":
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return assets.respond(request, asset, assets.STATIC_CACHE_CONTROL)
 
-@mcp.custom_route("/send", methods=["POST"])
+
+@route("/send", methods=["POST"])
 async def send_rest(request):
     body = await request.json()
     sender = body.get("sender", "")
@@ -165,65 +588,242 @@ async def send_rest(request):
     message = body.get("message", "")
     if not peer:
         return JSONResponse({"error": "peer required"}, status_code=400)
-    if not registry.is_registered(peer):
+    bridge = federation.bridge_for(peer)
+    if bridge is None and not registry.is_registered(peer):
         return JSONResponse({"result": f"peer '{peer}' not found"})
-    queue.send(sender, peer, message)
-    db.log_activity("message", sender=sender, peer=peer, content=message)
-    return JSONResponse({"result": f"message sent to {peer}"})
+    ttl = body.get("ttl") or 0
+    if not isinstance(ttl, (int, float)):
+        return JSONResponse({"error": "ttl must be a number of seconds"}, status_code=400)
+    presence.touch(sender)
+    if bridge:
+        entry = send_remote(bridge, sender, peer, message, body.get("thread_id") or None, ttl)
+        return JSONResponse(
+            {
+                "result": f"message queued for {peer} on {bridge} in thread {entry['thread_id']}",
+                "thread_id": entry["thread_id"],
+                "bridge": bridge,
+            }
+        )
+    entry = queue.send(sender, peer, message, thread_id=body.get("thread_id") or None, ttl=ttl)
+    db.log_activity("message", sender=sender, peer=peer, content=db.preview(message))
+    return JSONResponse(
+        {
+            "result": f"message sent to {peer} in thread {entry['thread_id']}",
+            "id": entry["id"],
+            "thread_id": entry["thread_id"],
+        }
+    )
 
 
-@mcp.custom_route("/read/{name}", methods=["GET"])
+@route("/reply", methods=["POST"])
+async def reply_rest(request):
+    body = await request.json()
+    sender = body.get("sender", "")
+    message_id = body.get("message_id")
+    message = body.get("message", "")
+    if not isinstance(message_id, int):
+        return JSONResponse({"error": "message_id required"}, status_code=400)
+    presence.touch(sender)
+    entry = reply_any(sender, message_id, message)
+    if entry is None:
+        return JSONResponse({"error": f"message {message_id} not found"}, status_code=404)
+    if "bridge" in entry:
+        # a forwarded reply gets its id on the peer bridge once it is delivered
+        return JSONResponse(
+            {
+                "result": f"reply queued for {entry['to']} on {entry['bridge']} in thread {entry['thread_id']}",
+                "bridge": entry["bridge"],
+                "thread_id": entry["thread_id"],
+            }
+        )
+    return JSONResponse(
+        {
+            "result": f"reply sent to {entry['to']} in thread {entry['thread_id']}",
+            "id": entry["id"],
+            "thread_id": entry["thread_id"],
+        }
+    )
+
+
+@route("/thread/{thread_id}", methods=["GET"])
+async def thread_rest(request):
+    return JSONResponse(queue.thread(request.path_params["thread_id"]))
+
+
+@route("/blob/{hash}", methods=["GET"])
+async def blob_rest(request):
+    blob = db.get_blob(request.path_params["hash"])
+    if blob is None:
+        return JSONResponse({"error": "blob not found"}, status_code=404)
+    # content addressed, a hash always maps to the same bytes
+    return JSONResponse(blob, headers={"Cache-Control": assets.STATIC_CACHE_CONTROL})
+
+
+@route("/read/{name}", methods=["GET"])
 async def read_rest(request):
     name = request.path_params["name"]
-    messages = queue.read(name)
+    presence.touch(name)
+    messages = queue.read(name, request.query_params.get("thread") or None)
     return JSONResponse(messages)
 
 
-@mcp.custom_route("/context", methods=["POST"])
+@route("/subscribe", methods=["POST"])
+async def subscribe_rest(request):
+    body = await request.json()
+    agent = body.get("agent", "")
+    topic = body.get("topic", "")
+    if not agent or not topic:
+        return JSONResponse({"error": "agent and topic required"}, status_code=400)
+    created = queue.subscribe(agent, topic)
+    return JSONResponse(
+        {
+            "result": f"{agent} subscribed to '{topic}'"
+            if created
+            else f"{agent} is already subscribed to '{topic}'",
+            "subscribed": created,
+        }
+    )
+
+
+@route("/unsubscribe", methods=["POST"])
+async def unsubscribe_rest(request):
+    body = await request.json()
+    agent = body.get("agent", "")
+    topic = body.get("topic", "")
+    if not agent or not topic:
+        return JSONResponse({"error": "agent and topic required"}, status_code=400)
+    removed = queue.unsubscribe(agent, topic)
+    return JSONResponse(
+        {
+            "result": f"{agent} unsubscribed from '{topic}'"
+            if removed
+            else f"{agent} is not subscribed to '{topic}'",
+            "unsubscribed": removed,
+        }
+    )
+
+
+@route("/publish", methods=["POST"])
+async def publish_rest(request):
+    body = await request.json()
+    sender = body.get("sender", "")
+    topic = body.get("topic", "")
+    message = body.get("message", "")
+    if not topic:
+        return JSONResponse({"error": "topic required"}, status_code=400)
+    ttl = body.get("ttl") or 0
+    if not isinstance(ttl, (int, float)):
+        return JSONResponse({"error": "ttl must be a number of seconds"}, status_code=400)
+    presence.touch(sender)
+    entry = queue.publish(sender, topic, message, ttl)
+    db.log_activity("publish", sender=sender, topic=topic, content=db.preview(message))
+    return JSONResponse(
+        {
+            "result": f"published to '{topic}' for {entry['subscribers']} subscriber(s)",
+            "topic_message_id": entry["topic_message_id"],
+            "subscribers": entry["subscribers"],
+        }
+    )
+
+
+@route("/topics", methods=["GET"])
+async def topics_rest(request):
+    return JSONResponse(queue.topics())
+
+
+@route("/subscriptions/{agent}", methods=["GET"])
+async def subscriptions_rest(request):
+    return JSONResponse(queue.subscriptions(request.path_params["agent"]))
+
+
+@route("/context", methods=["POST"])
 async def context_store_rest(request):
     body = await request.json()
     owner = body.get("owner", "")
     key = body.get("key", "")
     value = body.get("value", "")
-    db.set_context(owner, key, value)
-    return JSONResponse({"result": f"context '{key}' stored for {owner}"})
+    if_version = body.get("if_version")
+    if if_version is not None and not isinstance(if_version, int):
+        return JSONResponse({"error": "if_version must be an integer"}, status_code=400)
+    ttl = body.get("ttl") or 0
+    if not isinstance(ttl, (int, float)):
+        return JSONResponse({"error": "ttl must be a number of seconds"}, status_code=400)
+    version = store_context(owner, key, value, if_version, ttl)
+    if version is None:
+        message, current = context_conflict(owner, key, if_version)
+        return JSONResponse({"error": message, "version": current}, status_code=409)
+    return JSONResponse({"result": f"context '{key}' stored for {owner}", "version": version})
+
+
+@route("/context/{owner}", methods=["GET"])
+async def context_list_rest(request):
+    owner = request.path_params["owner"]
+    return JSONResponse(db.list_context(owner, request.query_params.get("prefix", "")))
+
+
+@route("/context/{owner}/many", methods=["POST"])
+async def context_many_rest(request):
+    body = await request.json()
+    keys = body.get("keys", [])
+    if not isinstance(keys, list):
+        return JSONResponse({"error": "keys must be a list"}, status_code=400)
+    return JSONResponse(db.get_context_many(request.path_params["owner"], keys))
+
+
+@route("/watch/context/{owner}", methods=["GET"])
+async def context_watch_rest(request):
+    params = request.query_params
+    try:
+        since = int(params.get("since", "0"))
+        timeout = float(params.get("timeout", "30"))
+    except ValueError:
+        return JSONResponse({"error": "since and timeout must be numbers"}, status_code=400)
+    result = await watch_context(
+        request.path_params["owner"], since, params.get("prefix", ""), timeout
+    )
+    return JSONResponse(result)
 
 
-@mcp.custom_route("/context/{owner}/{key}", methods=["GET"])
+@route("/context/{owner}/{key}", methods=["GET"])
 async def context_get_rest(request):
     owner = request.path_params["owner"]
     key = request.path_params["key"]
-    value = db.get_context(owner, key)
-    if value is None:
+    if_newer = request.query_params.get("if_newer")
+    try:
+        if_newer = int(if_newer) if if_newer is not None else None
+    except ValueError:
+        return JSONResponse({"error": "if_newer must be an integer"}, status_code=400)
+    entry = db.get_context_entry(owner, key, if_newer)
+    if entry is None:
         return JSONResponse({"error": f"no context '{key}' found for {owner}"})
-    return JSONResponse({"value": value})
+    return JSONResponse(entry)
 
 
-@mcp.custom_route("/task", methods=["POST"])
+@route("/task", methods=["POST"])
 async def task_create_rest(request):
     body = await request.json()
     agent = body.get("agent", "")
     description = body.get("description", "")
     if not agent or not description:
         return JSONResponse({"error": "agent and description required"}, status_code=400)
-    task_id = uuid.uuid4().hex[:8]
-    task = db.create_task(task_id, agent, description)
-    db.log_activity("task_created", agent=agent, task_id=task_id, description=description)
-    return JSONResponse(task)
+    try:
+        return JSONResponse(create_task(agent, description))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
 
 
-@mcp.custom_route("/tasks", methods=["GET"])
+@route("/tasks", methods=["GET"])
 async def tasks_list_rest(request):
     return JSONResponse(db.get_tasks())
 
 
-@mcp.custom_route("/tasks/{agent}", methods=["GET"])
+@route("/tasks/{agent}", methods=["GET"])
 async def tasks_agent_rest(request):
     agent = request.path_params["agent"]
     return JSONResponse(db.get_agent_tasks(agent))
 
 
-@mcp.custom_route("/task/{task_id}", methods=["PATCH"])
+@route("/task/{task_id}", methods=["PATCH"])
 async def task_update_rest(request):
     task_id = request.path_params["task_id"]
     body = await request.json()
@@ -233,12 +833,15 @@ async def task_update_rest(request):
     if task is None:
         return JSONResponse({"error": f"task '{task_id}' not found"}, status_code=404)
     db.log_activity("task_updated", task_id=task_id, status=status)
+    federation.task_updated(task, result)
     return JSONResponse(task)
 
 
-@mcp.custom_route("/tasks/{agent}/pending", methods=["GET"])
+@route("/tasks/{agent}/pending", methods=["GET"])
 async def tasks_pending_rest(request):
     agent = request.path_params["agent"]
+    # the inbox hook polls this on every check, which makes it the heartbeat
+    presence.touch(agent)
     return JSONResponse(db.get_pending_tasks(agent))
 
 
@@ -283,7 +886,7 @@ def read_session_meta(fpath):
     return {}
 
 
-@mcp.custom_route("/sessions", methods=["GET"])
+@route("/sessions", methods=["GET"])
 async def sessions_rest(request):
     # scans the claude projects directory on disk to discover all sessions
     # returns them grouped by project with metadata from the jsonl files
@@ -376,5 +979,24 @@ async def sessions_rest(request):
     return JSONResponse({"projects": projects})
 
 
+# asgi app for multi worker mode, every worker process builds its own from this
+# factory. mcp sessions live in one process, so the mcp endpoint runs stateless
+def http_app():
+    return mcp.http_app(stateless_http=True)
+
+
+# serve with several worker processes sharing one port
+def run_workers(workers, host, port):
+    import uvicorn
+
+    if db.is_memory():
+        raise ValueError("an in-memory database cannot be shared between workers")
+    # create the schema once up front so the workers do not race each other
+    # migrating it, and forget the workers of a previous run
+    db.init()
+    db.clear_workers()
+    uvicorn.run("talktome.server:http_app", factory=True, host=host, port=port, workers=workers)
+
+
 if __name__ == "__main__":
     mcp.run(transport="http", host="0.0.0.0", port=3456)
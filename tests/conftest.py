@@ -0,0 +1,6 @@
+import os
+
+# every test process runs against one in-memory database, wiped by the tests
+# with db.reset(), so the suite never touches ~/.talktome/bridge.db and separate
+# test processes can run side by side
+os.environ["TALKTOME_DB"] = ":memory:"
@@ -0,0 +1,112 @@
+import gzip
+import os
+import shutil
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from talktome import assets
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    assets.clear()
+    yield
+    assets.clear()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def test_assets_loaded_once():
+    first = assets.get("dashboard.html")
+    assert assets.get("dashboard.html") is first
+
+
+def test_page_links_fingerprinted_assets():
+    page = assets.get("dashboard.html").body.decode()
+    css = assets.get("dashboard.css").etag.strip('"')
+    js = assets.get("dashboard.js").etag.strip('"')
+    assert f"/static/dashboard.css?v={css}" in page
+    assert f"/static/dashboard.js?v={js}" in page
+
+
+def test_unknown_asset():
+    assert assets.get("secrets.txt") is None
+
+
+def test_dev_mode_reloads_edited_files(tmp_path, monkeypatch):
+    for name in assets.MEDIA_TYPES:
+        shutil.copy(assets.ASSET_DIR / name, tmp_path / name)
+    monkeypatch.setattr(assets, "ASSET_DIR", tmp_path)
+    monkeypatch.setattr(assets, "DEV_MODE", True)
+    page = assets.get("dashboard.html")
+    css = tmp_path / "dashboard.css"
+    css.write_text("body { color: red; }\n")
+    os.utime(css, (page.mtime + 5, page.mtime + 5))
+    # the page embeds the css fingerprint so it is rebuilt with it
+    assert assets.get("dashboard.css").body == b"body { color: red; }\n"
+    assert assets.get("dashboard.html").etag != page.etag
+
+
+@pytest.mark.asyncio
+async def test_dashboard_headers(http_client):
+    resp = await http_client.get("/")
+    assert resp.status_code == 200
+    page = assets.get("dashboard.html")
+    assert resp.headers["etag"] == page.tag(resp.headers.get("content-encoding"))
+    assert resp.headers["cache-control"] == "no-cache"
+
+
+@pytest.mark.asyncio
+async def test_dashboard_not_modified(http_client):
+    etag = (await http_client.get("/")).headers["etag"]
+    resp = await http_client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+
+@pytest.mark.asyncio
+async def test_each_encoding_has_its_own_etag(http_client):
+    gzipped = await http_client.get("/", headers={"Accept-Encoding": "gzip"})
+    plain = await http_client.get("/", headers={"Accept-Encoding": "identity"})
+    assert gzipped.headers["etag"] != plain.headers["etag"]
+    resp = await http_client.get(
+        "/", headers={"Accept-Encoding": "identity", "If-None-Match": gzipped.headers["etag"]}
+    )
+    assert resp.status_code == 200
+    resp = await http_client.get(
+        "/", headers={"Accept-Encoding": "gzip", "If-None-Match": "W/" + gzipped.headers["etag"]}
+    )
+    assert resp.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_dashboard_precompressed(http_client):
+    resp = await http_client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(assets.get("dashboard.html").encoded["gzip"]) == resp.content
+
+
+@pytest.mark.asyncio
+async def test_static_assets_are_immutable(http_client):
+    for name, media in [("dashboard.css", "text/css"), ("dashboard.js", "text/javascript")]:
+        resp = await http_client.get(f"/static/{name}")
+        assert resp.status_code == 200
+        assert media in resp.headers["content-type"]
+        assert "immutable" in resp.headers["cache-control"]
+
+
+@pytest.mark.asyncio
+async def test_static_unknown_asset(http_client):
+    resp = await http_client.get("/static/nope.js")
+    assert resp.status_code == 404
+    resp = await http_client.get("/static/dashboard.html")
+    assert resp.status_code == 404
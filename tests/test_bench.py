@@ -0,0 +1,71 @@
+import pytest
+
+from talktome.bench import Recorder, bridge_env, parse_args, percentile
+
+
+def test_percentile_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 95) == 95
+    assert percentile(samples, 99) == 99
+    assert percentile(samples, 100) == 100
+
+
+def test_percentile_small_and_empty():
+    assert percentile([], 50) == 0.0
+    assert percentile([7], 99) == 7
+
+
+def test_recorder_summary():
+    recorder = Recorder()
+    for ms in (1, 2, 3, 4):
+        recorder.add("hook_peek", ms / 1000)
+    recorder.add("hook_peek", 0.5, ok=False)
+    recorder.add("send_message", 0.1, ok=False)
+    summary = recorder.summary(elapsed=2.0)
+    assert summary["hook_peek"]["count"] == 4
+    assert summary["hook_peek"]["errors"] == 1
+    assert summary["hook_peek"]["per_sec"] == 2.0
+    assert summary["hook_peek"]["p50_ms"] == 2.0
+    assert summary["hook_peek"]["max_ms"] == 4.0
+    assert summary["send_message"]["count"] == 0
+    assert summary["send_message"]["errors"] == 1
+
+
+def test_parse_args_defaults():
+    args = parse_args([])
+    assert args.agents == 20
+    assert args.url == ""
+    args = parse_args(["--agents", "5", "--duration", "2", "--url", "http://127.0.0.1:3456"])
+    assert args.agents == 5
+    assert args.duration == 2.0
+
+
+def test_bridge_env_drops_caller_settings(monkeypatch, tmp_path):
+    monkeypatch.setenv("TALKTOME_DB", "/home/me/.talktome/bridge.db")
+    monkeypatch.setenv("TALKTOME_PEERS", "http://10.0.0.2:3456")
+    monkeypatch.setenv("TALKTOME_WORKERS", "4")
+    env = bridge_env(str(tmp_path), 4000)
+    assert env["TALKTOME_DB"].startswith(str(tmp_path))
+    assert env["TALKTOME_PORT"] == "4000"
+    assert "TALKTOME_PEERS" not in env
+    assert "TALKTOME_WORKERS" not in env
+
+
+def test_main_routes_to_bench(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["talktome", "bench", "--agents", "3"])
+
+    called = {"argv": None}
+
+    def fake_bench(argv=None):
+        called["argv"] = argv
+        return 0
+
+    monkeypatch.setattr("talktome.bench.main", fake_bench)
+
+    from talktome import main
+
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    assert exit_info.value.code == 0
+    assert called["argv"] is None
@@ -0,0 +1,178 @@
+import threading
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, maintenance, queue, registry
+from talktome.server import mcp
+
+BIG = "x" * (db.BLOB_THRESHOLD + 1)
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def blob_count():
+    conn = db.connect()
+    count = conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_small_message_stays_inline():
+    queue.send("a", "b", "short")
+    message = queue.peek("b")[0]
+    assert message["message"] == "short"
+    assert "blob" not in message
+    assert blob_count() == 0
+
+
+def test_large_message_is_offloaded():
+    entry = queue.send("a", "b", BIG)
+    assert entry["blob"]["size"] == len(BIG)
+    peeked = queue.peek("b")[0]
+    assert len(peeked["message"]) == db.PREVIEW_CHARS
+    assert peeked["blob"] == entry["blob"]
+    assert db.get_blob(entry["blob"]["hash"])["value"] == BIG
+    # reading the mailbox returns the whole message
+    assert queue.read("b")[0]["message"] == BIG
+
+
+def test_identical_payloads_are_stored_once():
+    for peer in ("b", "c", "d"):
+        queue.send("a", peer, BIG)
+    assert blob_count() == 1
+
+
+def test_large_task_result():
+    db.create_task("t1", "b", "dump the schema")
+    updated = db.update_task("t1", status="done", result=BIG)
+    assert updated["result_blob"]["size"] == len(BIG)
+    listed = db.get_tasks()[0]
+    assert len(listed["result"]) == db.PREVIEW_CHARS
+    assert listed["result_blob"] == updated["result_blob"]
+    assert db.get_task("t1")["result"] == BIG
+    # a status change keeps the offloaded result
+    assert db.update_task("t1", status="failed")["result_blob"] == updated["result_blob"]
+    assert db.get_task("t1")["result"] == BIG
+
+
+def test_large_context_value():
+    db.set_context("a", "schema", BIG)
+    assert db.get_context("a", "schema") == BIG
+    db.set_context("a", "schema", "small now")
+    assert db.get_context("a", "schema") == "small now"
+
+
+def test_gc_removes_only_unreferenced_blobs():
+    db.set_context("a", "schema", BIG)
+    queue.send("a", "b", "y" * (db.BLOB_THRESHOLD + 1))
+    db.set_context("a", "schema", "replaced")
+    assert blob_count() == 2
+    assert maintenance.collect_blobs() == 1
+    assert blob_count() == 1
+    assert queue.read("b")[0]["message"].startswith("y")
+
+
+def test_gc_waits_for_a_writer_reusing_an_orphaned_blob(tmp_path):
+    db.use(str(tmp_path / "bridge.db"))
+    try:
+        db.set_context("a", "schema", BIG)
+        db.set_context("a", "schema", "replaced")
+        conn = db.connect()
+        # the writer found the orphaned blob and is about to reference it
+        _, digest = db._offload(conn, BIG)
+        gc = threading.Thread(target=db.gc_blobs)
+        gc.start()
+        gc.join(0.5)
+        conn.execute(
+            "INSERT INTO messages (sender, receiver, message, timestamp, blob) VALUES (?, ?, ?, 0, ?)",
+            ("a", "b", BIG[: db.PREVIEW_CHARS], digest),
+        )
+        conn.commit()
+        conn.close()
+        gc.join()
+        assert db.get_blob(digest)["value"] == BIG
+    finally:
+        db.use()
+
+
+def test_threshold_setting_turns_offload_off(monkeypatch):
+    monkeypatch.setenv("TALKTOME_BLOB_THRESHOLD", "0")
+    queue.send("a", "b", BIG)
+    assert queue.peek("b")[0]["message"] == BIG
+    assert blob_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_blob_rest(http_client):
+    registry.register("b", "/b")
+    resp = await http_client.post("/send", json={"sender": "a", "peer": "b", "message": BIG})
+    assert resp.status_code == 200
+    ref = (await http_client.get("/peek/b")).json()["messages"][0]["blob"]
+    resp = await http_client.get(f"/blob/{ref['hash']}")
+    assert resp.json()["value"] == BIG
+    assert "immutable" in resp.headers["cache-control"]
+    resp = await http_client.get("/blob/0000")
+    assert resp.status_code == 404
+    # the dashboard activity feed only carries the preview
+    activity = (await http_client.get("/activity")).json()
+    assert len(activity[-1]["content"]) == db.PREVIEW_CHARS
+
+
+# compression tests
+
+
+def stored_blob(digest):
+    conn = db.connect()
+    row = conn.execute("SELECT size, data, encoding FROM blobs WHERE hash=?", (digest,)).fetchone()
+    conn.close()
+    return row
+
+
+def test_blobs_are_compressed():
+    entry = queue.send("a", "b", BIG)
+    row = stored_blob(entry["blob"]["hash"])
+    assert row["encoding"] == "zlib"
+    assert len(row["data"]) < row["size"] == len(BIG)
+    assert queue.read("b")[0]["message"] == BIG
+
+
+def test_compression_can_be_turned_off(monkeypatch):
+    monkeypatch.setenv("TALKTOME_BLOB_COMPRESSION", "none")
+    entry = queue.send("a", "b", BIG)
+    assert stored_blob(entry["blob"]["hash"])["encoding"] == "identity"
+    monkeypatch.delenv("TALKTOME_BLOB_COMPRESSION")
+    # stored raw, still readable once compression is back on
+    assert db.get_blob(entry["blob"]["hash"])["value"] == BIG
+
+
+def test_storage_stats_reports_savings():
+    for peer in ("b", "c"):
+        queue.send("a", peer, BIG)
+    report = db.storage_stats()
+    assert report["rows"]["messages"] == 2
+    assert report["rows"]["blobs"] == 1
+    blobs = report["blobs"]
+    assert blobs["raw_bytes"] == len(BIG)
+    assert blobs["compression_saved_bytes"] == len(BIG) - blobs["stored_bytes"] > 0
+    assert blobs["dedup_saved_bytes"] == len(BIG)
+    assert blobs["by_encoding"]["zlib"]["blobs"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stats_rest(http_client):
+    db.set_context("a", "schema", BIG)
+    resp = await http_client.get("/stats")
+    assert resp.json()["blobs"]["by_encoding"]["zlib"]["raw_bytes"] == len(BIG)
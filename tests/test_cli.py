@@ -11,7 +11,7 @@ def test_is_running_returns_false_when_no_server(monkeypatch):
     def fake_urlopen(req, timeout=None):
         raise urllib.error.URLError("connection refused")
 
-    monkeypatch.setattr("talktome.urllib.request.urlopen", fake_urlopen)
+    monkeypatch.setattr("urllib.request.urlopen", fake_urlopen)
     assert is_running() is False
 
 
@@ -23,7 +23,7 @@ def test_is_running_returns_true_on_200(monkeypatch):
     def fake_urlopen(req, timeout=None):
         return fake_resp
 
-    monkeypatch.setattr("talktome.urllib.request.urlopen", fake_urlopen)
+    monkeypatch.setattr("urllib.request.urlopen", fake_urlopen)
     assert is_running() is True
 
 
@@ -34,7 +34,7 @@ def test_is_running_returns_false_on_error(monkeypatch):
     def fake_urlopen(req, timeout=None):
         raise urllib.error.URLError("connection refused")
 
-    monkeypatch.setattr("talktome.urllib.request.urlopen", fake_urlopen)
+    monkeypatch.setattr("urllib.request.urlopen", fake_urlopen)
     assert is_running() is False
 
 
@@ -52,7 +52,7 @@ def test_wait_and_open_opens_browser_when_ready(monkeypatch):
         opened["url"] = url
 
     monkeypatch.setattr("talktome.is_running", fake_is_running)
-    monkeypatch.setattr("talktome.webbrowser.open", fake_open)
+    monkeypatch.setattr("webbrowser.open", fake_open)
     monkeypatch.setattr("talktome.time.sleep", lambda x: None)
 
     wait_and_open()
@@ -71,7 +71,7 @@ def test_wait_and_open_opens_browser_even_on_timeout(monkeypatch):
         opened["url"] = url
 
     monkeypatch.setattr("talktome.is_running", fake_is_running)
-    monkeypatch.setattr("talktome.webbrowser.open", fake_open)
+    monkeypatch.setattr("webbrowser.open", fake_open)
     monkeypatch.setattr("talktome.time.sleep", lambda x: None)
 
     wait_and_open()
@@ -88,7 +88,7 @@ def test_main_opens_browser_if_already_running(monkeypatch):
     def fake_open(url):
         opened["count"] += 1
 
-    monkeypatch.setattr("talktome.webbrowser.open", fake_open)
+    monkeypatch.setattr("webbrowser.open", fake_open)
 
     from talktome import main
 
@@ -108,7 +108,7 @@ def test_main_starts_server_if_not_running(monkeypatch):
             started["called"] = True
 
     monkeypatch.setattr("talktome.server.mcp", FakeMcp())
-    monkeypatch.setattr("talktome.webbrowser.open", lambda url: None)
+    monkeypatch.setattr("webbrowser.open", lambda url: None)
     monkeypatch.setattr("talktome.time.sleep", lambda x: None)
 
     # mock threading to avoid actual background thread
@@ -122,7 +122,7 @@ def test_main_starts_server_if_not_running(monkeypatch):
         t.start = lambda: None
         return t
 
-    monkeypatch.setattr("talktome.threading.Thread", fake_thread)
+    monkeypatch.setattr("threading.Thread", fake_thread)
 
     from talktome import main
 
@@ -213,3 +213,34 @@ def test_main_routes_to_hook_mailbox(monkeypatch):
 
     main()
     assert called["hook"] is True
+
+
+def test_cli_import_stays_light():
+    # every hook and cli command imports the package, keep the heavy modules out of it
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, talktome; "
+        "print(','.join(m for m in ('webbrowser', 'urllib.request', 'talktome.db', 'fastmcp') "
+        "if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+def test_stats_falls_back_to_the_database(monkeypatch, capsys):
+    import urllib.error
+
+    from talktome import db, stats
+
+    def fake_urlopen(req, timeout=None):
+        raise urllib.error.URLError("connection refused")
+
+    monkeypatch.setattr("urllib.request.urlopen", fake_urlopen)
+    db.reset()
+    db.set_context("a", "schema", "x" * 10000)
+    stats()
+    out = capsys.readouterr().out
+    assert "saved by compression" in out
+    assert "zlib" in out
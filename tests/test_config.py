@@ -0,0 +1,168 @@
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from talktome import apply_db_option, config, db
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CONFIG_PATH", str(tmp_path / "config.json"))
+    monkeypatch.delenv("TALKTOME_DB_PROFILE", raising=False)
+    config.reload()
+    monkeypatch.setattr(db, "_pragmas", None)
+    yield
+    config.reload()
+
+
+def write_config(data):
+    with open(config.CONFIG_PATH, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    config.reload()
+
+
+# config lookup tests
+
+
+def test_get_default_without_file():
+    assert config.get("db_profile", "fast") == "fast"
+
+
+def test_get_reads_config_file():
+    write_config({"db_profile": "durable"})
+    assert config.get("db_profile") == "durable"
+
+
+def test_environment_wins_over_file(monkeypatch):
+    write_config({"db_profile": "durable"})
+    monkeypatch.setenv("TALKTOME_DB_PROFILE", "fast")
+    assert config.get("db_profile") == "fast"
+
+
+def test_broken_config_file_is_ignored():
+    with open(config.CONFIG_PATH, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    config.reload()
+    assert config.get("db_profile", "fast") == "fast"
+
+
+# pragma profile tests
+
+
+def test_default_profile_is_fast():
+    assert db.pragmas()["synchronous"] == "NORMAL"
+
+
+def test_profile_from_environment(monkeypatch):
+    monkeypatch.setenv("TALKTOME_DB_PROFILE", "durable")
+    assert db.pragmas()["synchronous"] == "FULL"
+
+
+def test_unknown_profile_raises(monkeypatch):
+    monkeypatch.setenv("TALKTOME_DB_PROFILE", "reckless")
+    with pytest.raises(ValueError, match="unknown db profile"):
+        db.pragmas()
+
+
+def test_pragma_overrides_from_config_file():
+    write_config({"db_profile": "durable", "pragmas": {"cache_size": -64000, "bogus": 1}})
+    resolved = db.pragmas()
+    assert resolved["cache_size"] == -64000
+    assert resolved["synchronous"] == "FULL"
+    assert "bogus" not in resolved
+
+
+def test_pragma_override_rejects_statements():
+    write_config({"pragmas": {"temp_store": "MEMORY; DROP TABLE agents"}})
+    assert db.pragmas()["temp_store"] == "MEMORY"
+
+
+def test_connection_applies_profile():
+    db.use_profile("durable")
+    conn = db.connect()
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    conn.close()
+    db.use_profile("fast")
+    conn = db.connect()
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+    conn.close()
+
+
+# database location tests
+
+
+@pytest.fixture
+def restore_db():
+    yield
+    db.use()
+
+
+def test_import_has_no_side_effects(tmp_path):
+    env = dict(os.environ, HOME=str(tmp_path), USERPROFILE=str(tmp_path))
+    env.pop("TALKTOME_DB", None)
+    subprocess.run(
+        [sys.executable, "-c", "import talktome.db, talktome.server"], env=env, check=True
+    )
+    assert not (tmp_path / ".talktome").exists()
+
+
+def test_db_path_from_environment(tmp_path, monkeypatch, restore_db):
+    target = tmp_path / "nested" / "bridge.db"
+    monkeypatch.setenv("TALKTOME_DB", str(target))
+    db.use()
+    assert db.path() == str(target)
+    assert not target.exists()
+    db.register("alpha", "/a")
+    assert target.exists()
+    assert db.get_agent("alpha")["path"] == "/a"
+
+
+def test_memory_database_is_shared_between_connections(restore_db):
+    db.use(db.MEMORY)
+    assert db.is_memory()
+    db.register("alpha", "/a")
+    assert db.get_agent("alpha") is not None
+    assert db.wal_size() == 0
+
+
+def test_memory_database_takes_concurrent_writers(restore_db):
+    db.use(db.MEMORY)
+
+    def work(i):
+        for n in range(50):
+            db.send_message(f"agent-{i}", "web", f"hello {n}", ttl=0.001 if n % 2 else None)
+            db.sweep_expired()
+
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        list(pool.map(work, range(4)))
+    assert db.message_count("web") == 100
+
+
+def test_use_memory_starts_empty(restore_db):
+    db.use(db.MEMORY)
+    db.register("alpha", "/a")
+    db.use(db.MEMORY)
+    assert db.get_agent("alpha") is None
+
+
+def test_lazy_init_from_threads(tmp_path, restore_db):
+    db.use(str(tmp_path / "bridge.db"))
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: db.register(f"agent-{i}", "/p"), range(16)))
+    assert len(db.list_agents()) == 16
+
+
+def test_db_cli_option(monkeypatch):
+    monkeypatch.delenv("TALKTOME_DB", raising=False)
+    args = apply_db_option(["talktome", "--db", "/tmp/x.db", "--no-browser"])
+    assert args == ["talktome", "--no-browser"]
+    assert os.environ["TALKTOME_DB"] == "/tmp/x.db"
+    args = apply_db_option(["talktome", "--db=:memory:"])
+    assert args == ["talktome"]
+    assert os.environ["TALKTOME_DB"] == ":memory:"
@@ -0,0 +1,216 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from fastmcp import Client
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def test_versions_increase_across_owners():
+    first = db.set_context("api", "a", "1")
+    second = db.set_context("web", "b", "2")
+    third = db.set_context("api", "a", "3")
+    assert first < second < third
+
+
+def test_list_context_by_prefix():
+    for key in ("routes/users", "routes/auth", "schema/user", "routes"):
+        db.set_context("api", key, key.upper())
+    db.set_context("web", "routes/home", "x")
+    keys = [e["key"] for e in db.list_context("api", "routes/")]
+    assert keys == ["routes/auth", "routes/users"]
+    assert len(db.list_context("api")) == 4
+    assert db.list_context("api", "routes/auth")[0]["value"] == "ROUTES/AUTH"
+
+
+def test_list_context_uses_the_primary_key():
+    conn = db.connect()
+    plan = conn.execute(
+        f"EXPLAIN QUERY PLAN {db.CONTEXT_SELECT} WHERE c.owner=? AND c.key >= ? AND c.key < ?",
+        ("api", "a", "b"),
+    ).fetchall()
+    conn.close()
+    assert "USING INDEX sqlite_autoindex_context_1 (owner=? AND key>? AND key<?)" in " ".join(
+        r["detail"] for r in plan
+    )
+
+
+def test_get_context_many():
+    db.set_context("api", "a", "1")
+    db.set_context("api", "b", "x" * (db.BLOB_THRESHOLD + 1))
+    values = db.get_context_many("api", ["a", "b", "missing", "a"])
+    assert values == {"a": "1", "b": "x" * (db.BLOB_THRESHOLD + 1)}
+    assert db.get_context_many("api", []) == {}
+
+
+def test_context_changes_since_version():
+    v1 = db.set_context("api", "a", "1")
+    db.set_context("api", "b", "2")
+    everything = db.context_changes("api")
+    assert [c["key"] for c in everything["changes"]] == ["a", "b"]
+    db.set_context("api", "a", "updated")
+    later = db.context_changes("api", everything["version"])
+    assert [(c["key"], c["value"]) for c in later["changes"]] == [("a", "updated")]
+    assert db.context_changes("api", later["version"]) == {
+        "version": later["version"],
+        "changes": [],
+    }
+    assert db.context_changes("api", v1, prefix="b")["changes"][0]["key"] == "b"
+
+
+@pytest.mark.asyncio
+async def test_list_and_many_rest(http_client):
+    await http_client.post("/context", json={"owner": "api", "key": "routes/a", "value": "1"})
+    await http_client.post("/context", json={"owner": "api", "key": "routes/b", "value": "2"})
+    resp = await http_client.get("/context/api?prefix=routes/")
+    assert [e["key"] for e in resp.json()] == ["routes/a", "routes/b"]
+    resp = await http_client.post("/context/api/many", json={"keys": ["routes/a", "routes/b"]})
+    assert resp.json() == {"routes/a": "1", "routes/b": "2"}
+    resp = await http_client.post("/context/api/many", json={"keys": "routes/a"})
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_watch_returns_immediately_when_behind(http_client):
+    version = db.set_context("api", "a", "1")
+    resp = await http_client.get("/watch/context/api?since=0&timeout=5")
+    assert resp.json()["version"] == version
+    resp = await http_client.get(f"/watch/context/api?since={version}&timeout=0")
+    assert resp.json() == {"version": version, "changes": []}
+
+
+@pytest.mark.asyncio
+async def test_watch_wakes_on_write(http_client):
+    version = db.set_context("api", "a", "1")
+
+    async def write_later():
+        await asyncio.sleep(0.1)
+        await http_client.post("/context", json={"owner": "api", "key": "b", "value": "2"})
+
+    start = asyncio.get_running_loop().time()
+    resp, _ = await asyncio.gather(
+        http_client.get(f"/watch/context/api?since={version}&timeout=10"), write_later()
+    )
+    assert asyncio.get_running_loop().time() - start < 5
+    assert [c["key"] for c in resp.json()["changes"]] == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_watch_tool_times_out_without_changes():
+    version = db.set_context("api", "a", "1")
+    async with Client(mcp) as client:
+        result = await client.call_tool(
+            "bridge_watch_context", {"owner": "api", "since": version, "timeout": 0}
+        )
+        assert result.data == {"version": version, "changes": []}
+        result = await client.call_tool("bridge_get_context_many", {"owner": "api", "keys": ["a"]})
+        assert result.data == {"a": "1"}
+
+
+# compare and set tests
+
+
+def expire(owner, key):
+    conn = db.connect()
+    conn.execute("UPDATE context SET expires_at = 1 WHERE owner=? AND key=?", (owner, key))
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_watch_sees_writes_after_the_newest_entry_is_swept(http_client):
+    db.set_context("api", "k1", "1")
+    v2 = db.set_context("api", "k2", "2", ttl=60)
+    expire("api", "k2")
+    db.sweep_expired()
+    assert db.set_context("api", "k3", "3") > v2
+    resp = await http_client.get(f"/watch/context/api?since={v2}&timeout=1")
+    assert [c["key"] for c in resp.json()["changes"]] == ["k3"]
+
+
+def test_recreated_key_does_not_get_its_old_version_back():
+    old = db.set_context("api", "k", "first", ttl=60)
+    expire("api", "k")
+    assert db.set_context("api", "k", "second", if_version=0) > old
+    # a writer still holding the version of the expired value loses
+    assert db.set_context("api", "k", "stale", if_version=old) is None
+    assert db.get_context("api", "k") == "second"
+
+
+def test_set_if_version_only_writes_the_expected_version():
+    version = db.set_context("api", "a", "1")
+    assert db.set_context("api", "a", "stale", if_version=version - 1) is None
+    assert db.get_context("api", "a") == "1"
+    newer = db.set_context("api", "a", "2", if_version=version)
+    assert newer > version
+    # the second writer that read the same version loses
+    assert db.set_context("api", "a", "3", if_version=version) is None
+    assert db.get_context("api", "a") == "2"
+
+
+def test_set_if_version_zero_only_creates():
+    assert db.set_context("api", "a", "1", if_version=0) is not None
+    assert db.set_context("api", "a", "2", if_version=0) is None
+    assert db.get_context("api", "a") == "1"
+    assert db.set_context("api", "missing", "x", if_version=5) is None
+    assert db.get_context("api", "missing") is None
+
+
+def test_get_context_entry_if_newer():
+    version = db.set_context("api", "a", "1")
+    entry = db.get_context_entry("api", "a")
+    assert entry["value"] == "1" and entry["version"] == version and entry["updated_at"] > 0
+    unchanged = db.get_context_entry("api", "a", if_newer=version)
+    assert unchanged["unchanged"] is True and "value" not in unchanged
+    db.set_context("api", "a", "2")
+    assert db.get_context_entry("api", "a", if_newer=version)["value"] == "2"
+    assert db.get_context_entry("api", "missing", if_newer=1) is None
+
+
+@pytest.mark.asyncio
+async def test_conditional_write_rest(http_client):
+    resp = await http_client.post(
+        "/context", json={"owner": "api", "key": "a", "value": "1", "if_version": 0}
+    )
+    version = resp.json()["version"]
+    resp = await http_client.post(
+        "/context", json={"owner": "api", "key": "a", "value": "2", "if_version": version + 7}
+    )
+    assert resp.status_code == 409
+    assert resp.json()["version"] == version
+    resp = await http_client.get(f"/context/api/a?if_newer={version}")
+    assert resp.json()["unchanged"] is True
+    resp = await http_client.get("/context/api/a?if_newer=0")
+    assert resp.json()["value"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_conditional_write_tools():
+    async with Client(mcp) as client:
+        await client.call_tool("bridge_share_context", {"owner": "api", "key": "a", "value": "1"})
+        version = db.get_context_entry("api", "a")["version"]
+        result = await client.call_tool(
+            "bridge_share_context",
+            {"owner": "api", "key": "a", "value": "2", "if_version": version + 1},
+        )
+        assert f"is at version {version}" in result.data
+        result = await client.call_tool(
+            "bridge_get_context", {"owner": "api", "key": "a", "if_newer": version}
+        )
+        assert "unchanged" in result.data
@@ -2,6 +2,7 @@ import os
 import signal
 import subprocess
 import sys
+import tempfile
 import time
 
 import httpx
@@ -11,7 +12,8 @@ from playwright.sync_api import expect
 pytestmark = pytest.mark.e2e
 
 BASE_URL = "http://127.0.0.1:3456"
-DB_PATH = os.path.join(os.path.expanduser("~"), ".talktome", "bridge.db")
+# a throwaway database so the e2e run never wipes the real ~/.talktome/bridge.db
+DB_PATH = os.path.join(tempfile.gettempdir(), f"talktome-e2e-{os.getpid()}.db")
 
 
 def wait_for_health(timeout=10):
@@ -30,6 +32,7 @@ def wait_for_health(timeout=10):
 def start_server():
     proc = subprocess.Popen(
         [sys.executable, "-m", "talktome"],
+        env=dict(os.environ, TALKTOME_DB=DB_PATH),
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
         creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == "win32" else 0,
@@ -0,0 +1,120 @@
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, maintenance, metrics, queue, registry
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+    metrics.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+# move every row with a ttl into the past instead of sleeping through it
+def expire_all():
+    conn = db.connect()
+    conn.execute("UPDATE messages SET expires_at = 1 WHERE expires_at IS NOT NULL")
+    conn.execute("UPDATE context SET expires_at = 1 WHERE expires_at IS NOT NULL")
+    conn.commit()
+    conn.close()
+    # the unread index only sees writes made through queue
+    queue.rebuild()
+
+
+def row_count(table):
+    conn = db.connect()
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_messages_with_ttl_disappear_once_expired():
+    queue.send("a", "b", "short lived", ttl=30)
+    queue.send("a", "b", "forever")
+    assert queue.count("b") == 2
+    expire_all()
+    assert queue.count("b") == 1
+    assert [m["message"] for m in queue.peek("b")] == ["forever"]
+    assert [m["message"] for m in queue.read("b")] == ["forever"]
+
+
+def test_context_with_ttl_disappears_once_expired():
+    db.set_context("api", "lease", "held", ttl=30)
+    db.set_context("api", "schema", "v1")
+    expire_all()
+    assert db.get_context("api", "lease") is None
+    assert [e["key"] for e in db.list_context("api")] == ["schema"]
+    assert db.get_context_many("api", ["lease", "schema"]) == {"schema": "v1"}
+    assert [c["key"] for c in db.context_changes("api")["changes"]] == ["schema"]
+    # an expired key can be created again, but not compare-and-set
+    assert db.set_context("api", "lease", "again", if_version=0) is not None
+
+
+def test_rewrite_without_ttl_clears_the_expiry():
+    db.set_context("api", "a", "1", ttl=30)
+    db.set_context("api", "a", "2")
+    expire_all()
+    assert db.get_context("api", "a") == "2"
+
+
+def test_sweeper_deletes_in_batches():
+    for i in range(25):
+        queue.send("a", "b", f"m{i}", ttl=30)
+    db.set_context("api", "a", "1", ttl=30)
+    queue.send("a", "b", "keep")
+    expire_all()
+    assert db.sweep_expired(batch=10) == {
+        "messages": 25,
+        "topic_messages": 0,
+        "context": 1,
+        "idempotency_keys": 0,
+    }
+    assert row_count("messages") == 1
+    assert row_count("context") == 0
+    # capped runs leave the rest for the next sweep
+    for i in range(25):
+        queue.send("a", "b", f"n{i}", ttl=30)
+    expire_all()
+    assert db.sweep_expired(batch=10, max_batches=2)["messages"] == 20
+    assert db.sweep_expired(batch=10)["messages"] == 5
+
+
+def test_sweep_job_records_metrics():
+    queue.send("a", "b", "gone", ttl=30)
+    expire_all()
+    maintenance.sweep_expired()
+    assert 'talktome_expired_rows_total{table="messages"} 1' in metrics.render()
+
+
+def test_sweep_uses_the_expiry_index():
+    conn = db.connect()
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT rowid FROM messages WHERE expires_at <= ? LIMIT ?", (1, 10)
+    ).fetchall()
+    conn.close()
+    assert "idx_messages_expiry" in " ".join(r["detail"] for r in plan)
+
+
+@pytest.mark.asyncio
+async def test_ttl_over_rest(http_client):
+    registry.register("b", "/b")
+    resp = await http_client.post(
+        "/send", json={"sender": "a", "peer": "b", "message": "hi", "ttl": 30}
+    )
+    assert resp.status_code == 200
+    resp = await http_client.post(
+        "/context", json={"owner": "api", "key": "k", "value": "v", "ttl": "soon"}
+    )
+    assert resp.status_code == 400
+    expire_all()
+    assert (await http_client.get("/peek/b")).json()["count"] == 0
@@ -0,0 +1,306 @@
+import time
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, federation, queue
+from talktome.server import mcp
+
+PEER = "http://10.0.0.2:3456"
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+# a peer bridge that reported one agent
+@pytest.fixture
+def remote_web():
+    db.set_remote_agents(PEER, [{"name": "web", "status": "active", "last_seen": time.time()}])
+
+
+# deliveries land back in this bridge, standing in for the peer
+@pytest.fixture
+def loopback(monkeypatch):
+    sent = []
+
+    def post(bridge, endpoint, data):
+        sent.append((bridge, endpoint))
+        return {"accepted": federation.receive(data["origin"], data["items"])}
+
+    monkeypatch.setattr(federation, "_post", post)
+    return sent
+
+
+def test_peers_from_config(monkeypatch):
+    monkeypatch.setenv("TALKTOME_PEERS", "http://a:3456/, http://b:3456")
+    assert federation.peers() == ["http://a:3456", "http://b:3456"]
+
+
+# outbox tests
+
+
+def test_outbox_is_delivered_in_one_batch(remote_web, loopback):
+    for i in range(3):
+        federation.forward_message(PEER, "api", "web", f"msg {i}", thread_id="t1")
+    assert db.outbox_depths() == {PEER: 3}
+    assert federation.run()["sent"] == 3
+    assert loopback == [(PEER, "/federation/deliver")]
+    assert db.outbox_depths() == {}
+    messages = queue.read("web")
+    assert [m["message"] for m in messages] == ["msg 0", "msg 1", "msg 2"]
+    assert {m["thread_id"] for m in messages} == {"t1"}
+
+
+def test_redelivered_items_are_applied_once():
+    items = [
+        {
+            "id": 1,
+            "kind": "message",
+            "payload": {"sender": "api", "receiver": "web", "message": "hi"},
+        }
+    ]
+    assert federation.receive(PEER, items) == [1]
+    assert federation.receive(PEER, items) == [1]
+    assert queue.count("web") == 1
+
+
+def test_item_that_fails_to_apply_is_applied_on_redelivery(monkeypatch):
+    items = [
+        {
+            "id": 1,
+            "kind": "message",
+            "payload": {"sender": "api", "receiver": "web", "message": "hi"},
+        }
+    ]
+    apply = federation._apply
+
+    def broken(origin, kind, payload):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(federation, "_apply", broken)
+    with pytest.raises(RuntimeError):
+        federation.receive(PEER, items)
+    monkeypatch.setattr(federation, "_apply", apply)
+    assert federation.receive(PEER, items) == [1]
+    assert queue.count("web") == 1
+
+
+def test_expired_message_is_dropped_on_arrival():
+    payload = {"sender": "api", "receiver": "web", "message": "late", "expires_at": time.time() - 1}
+    federation.receive(PEER, [{"id": 1, "kind": "message", "payload": payload}])
+    assert queue.count("web") == 0
+
+
+def test_unreachable_peer_keeps_items_and_backs_off():
+    # nothing listens on the discard port
+    bridge = "http://127.0.0.1:9"
+    federation.forward_message(bridge, "api", "web", "first")
+    assert federation.flush(bridge) == 0
+    batch = db.outbox_batch(bridge)
+    assert batch[0]["attempts"] == 1
+    assert batch[0]["next_attempt"] > time.time()
+    # later items wait behind the failed one instead of overtaking it
+    federation.forward_message(bridge, "api", "web", "second")
+    assert federation.flush(bridge) == 0
+    assert [i["payload"]["message"] for i in db.outbox_batch(bridge)] == ["first", "second"]
+
+
+# routing tests
+
+
+@pytest.mark.asyncio
+async def test_send_to_remote_agent_is_queued(http_client, remote_web):
+    resp = await http_client.post("/send", json={"sender": "api", "peer": "web", "message": "hi"})
+    data = resp.json()
+    assert data["bridge"] == PEER
+    assert "queued" in data["result"]
+    assert db.outbox_depths() == {PEER: 1}
+    assert queue.count("web") == 0
+
+
+@pytest.mark.asyncio
+async def test_local_agent_wins_over_remote(http_client, remote_web):
+    await http_client.post("/register", json={"name": "web", "path": "/web"})
+    await http_client.post("/send", json={"sender": "api", "peer": "web", "message": "hi"})
+    assert db.outbox_depths() == {}
+    assert queue.count("web") == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_peer_is_not_found(http_client):
+    resp = await http_client.post("/send", json={"sender": "api", "peer": "ghost", "message": "hi"})
+    assert resp.json()["result"] == "peer 'ghost' not found"
+    assert db.outbox_depths() == {}
+
+
+@pytest.mark.asyncio
+async def test_reply_to_remote_sender_is_forwarded(http_client):
+    db.set_remote_agents(PEER, [{"name": "api", "status": "active"}])
+    payload = {"sender": "api", "receiver": "web", "message": "question", "thread_id": "t1"}
+    federation.receive(PEER, [{"id": 1, "kind": "message", "payload": payload}])
+    message_id = queue.read("web")[0]["id"]
+    resp = await http_client.post(
+        "/reply", json={"sender": "web", "message_id": message_id, "message": "answer"}
+    )
+    data = resp.json()
+    assert data["thread_id"] == "t1"
+    assert data["bridge"] == PEER
+    queued = db.outbox_batch(PEER)[0]
+    assert queued["payload"]["receiver"] == "api"
+    assert queued["payload"]["thread_id"] == "t1"
+    assert queued["payload"]["reply_to"] == message_id
+    assert queue.count("api") == 0
+
+
+def test_forwarded_reply_names_the_message_it_answers():
+    payload = {"sender": "web", "receiver": "api", "message": "answer", "reply_to": 7}
+    federation.receive(PEER, [{"id": 1, "kind": "message", "payload": payload}])
+    message = queue.read("api")[0]
+    assert message["reply_to"] == 7
+    assert message["reply_bridge"] == PEER
+
+
+@pytest.mark.asyncio
+async def test_task_for_remote_agent_reports_back(http_client, remote_web, monkeypatch):
+    monkeypatch.setenv("TALKTOME_PUBLIC_URL", "http://10.0.0.1:3456")
+    resp = await http_client.post("/task", json={"agent": "web", "description": "build"})
+    task_id = resp.json()["id"]
+    forwarded = db.outbox_batch(PEER)[0]
+    assert forwarded["kind"] == "task"
+    assert forwarded["payload"]["origin"] == federation.self_url()
+
+    # the receiving side, a task another bridge created
+    origin = "http://10.0.0.3:3456"
+    payload = {"id": "remote1", "agent": "cli", "description": "lint", "origin": origin}
+    federation.receive(origin, [{"id": 1, "kind": "task", "payload": payload}])
+    resp = await http_client.patch("/task/remote1", json={"status": "done", "result": "clean"})
+    assert resp.json()["origin"] == origin
+    update = db.outbox_batch(origin)[0]
+    assert update["kind"] == "task_update"
+    assert update["payload"] == {"id": "remote1", "status": "done", "result": "clean"}
+
+    # and the update arriving back where the task was created
+    federation.receive(
+        PEER,
+        [
+            {
+                "id": 2,
+                "kind": "task_update",
+                "payload": {"id": task_id, "status": "done", "result": "ok"},
+            }
+        ],
+    )
+    assert db.get_task(task_id)["result"] == "ok"
+
+
+@pytest.mark.asyncio
+async def test_remote_task_needs_a_public_url(http_client, remote_web):
+    resp = await http_client.post("/task", json={"agent": "web", "description": "build"})
+    assert resp.status_code == 400
+    assert "public_url" in resp.json()["error"]
+    assert db.get_tasks() == []
+    assert db.outbox_depths() == {}
+
+
+def test_peers_on_other_hosts_need_a_public_url(monkeypatch):
+    monkeypatch.setenv("TALKTOME_PEERS", "http://127.0.0.1:4000")
+    federation.check()
+    monkeypatch.setenv("TALKTOME_PEERS", PEER)
+    with pytest.raises(ValueError, match="public_url"):
+        federation.check()
+    monkeypatch.setenv("TALKTOME_PUBLIC_URL", "http://10.0.0.1:3456")
+    federation.check()
+
+
+# sync endpoint tests
+
+
+@pytest.mark.asyncio
+async def test_sync_swaps_agent_lists(http_client, monkeypatch):
+    monkeypatch.setenv("TALKTOME_PEERS", PEER)
+    await http_client.post("/register", json={"name": "api", "path": "/api"})
+    resp = await http_client.post(
+        "/federation/sync",
+        json={
+            "bridge": PEER + "/",
+            "agents": [{"name": "web", "status": "active", "last_seen": 1}],
+        },
+    )
+    data = resp.json()
+    assert data["bridge"] == federation.self_url()
+    assert [a["name"] for a in data["agents"]] == ["api"]
+    assert db.remote_bridge("web") == PEER
+    resp = await http_client.get("/agents")
+    remote = [a for a in resp.json() if a.get("bridge")]
+    assert [(a["name"], a["bridge"]) for a in remote] == [("web", PEER)]
+    resp = await http_client.get("/federation")
+    assert resp.json()["peers"] == [{"url": PEER, "agents": ["web"], "outbox": 0}]
+
+
+@pytest.mark.asyncio
+async def test_unknown_bridges_are_refused_without_a_token(http_client, monkeypatch):
+    monkeypatch.setenv("TALKTOME_PEERS", PEER)
+    stranger = "http://169.254.169.254"
+    resp = await http_client.post(
+        "/federation/sync", json={"bridge": stranger, "agents": [{"name": "web"}]}
+    )
+    assert resp.status_code == 403
+    assert db.remote_bridge("web") is None
+    resp = await http_client.post("/federation/deliver", json={"origin": stranger, "items": []})
+    assert resp.status_code == 403
+
+
+def test_task_updates_go_back_to_the_delivering_bridge():
+    payload = {"id": "t1", "agent": "cli", "description": "lint", "origin": "http://evil"}
+    federation.receive(PEER, [{"id": 1, "kind": "task", "payload": payload}])
+    assert db.get_task("t1")["origin"] == PEER
+
+
+def test_colliding_task_id_gets_a_new_one_here():
+    db.create_task("abc12345", "cli", "local work")
+    payload = {"id": "abc12345", "agent": "cli", "description": "remote work"}
+    assert federation.receive(PEER, [{"id": 1, "kind": "task", "payload": payload}]) == [1]
+    tasks = {t["description"]: t for t in db.get_tasks()}
+    remote = tasks["remote work"]
+    assert remote["id"] != "abc12345"
+    task = db.update_task(remote["id"], "done", "ok")
+    federation.task_updated(task, "ok")
+    update = db.outbox_batch(PEER)[0]
+    assert update["payload"]["id"] == "abc12345"
+
+
+@pytest.mark.asyncio
+async def test_malformed_items_are_rejected(http_client, monkeypatch):
+    monkeypatch.setenv("TALKTOME_PEERS", PEER)
+    for items in (
+        [{"kind": "message", "payload": {}}],
+        [{"id": 1, "kind": "message"}],
+        [{"id": 1, "kind": "message", "payload": {"sender": "api"}}],
+        ["junk"],
+    ):
+        resp = await http_client.post("/federation/deliver", json={"origin": PEER, "items": items})
+        assert resp.status_code == 400
+    assert queue.count("web") == 0
+
+
+@pytest.mark.asyncio
+async def test_federation_token_is_required_when_set(http_client, monkeypatch):
+    monkeypatch.setenv("TALKTOME_FEDERATION_TOKEN", "s3cret")
+    body = {"origin": PEER, "items": []}
+    resp = await http_client.post("/federation/deliver", json=body)
+    assert resp.status_code == 401
+    resp = await http_client.post(
+        "/federation/deliver", json=body, headers={"Authorization": "Bearer s3cret"}
+    )
+    assert resp.json() == {"accepted": []}
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from fastmcp import Client
+
+from talktome import db, maintenance, metrics
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+    metrics.reset()
+
+
+# the wal only exists for a database file, the rest of the suite runs in memory
+@pytest.fixture
+def file_db(tmp_path):
+    db.use(str(tmp_path / "bridge.db"))
+    yield
+    db.use()
+
+
+# a connection held open like the server lifespan does, so the wal is not
+# checkpointed away each time a db call closes its connection
+@pytest.fixture
+def anchor(file_db):
+    conn = db.connect()
+    yield conn
+    conn.close()
+
+
+def test_checkpoint_modes():
+    db.checkpoint("TRUNCATE")
+    status = db.checkpoint("PASSIVE")
+    assert set(status) == {"busy", "log", "checkpointed"}
+    with pytest.raises(ValueError):
+        db.checkpoint("NOW")
+
+
+def test_checkpointer_passive_while_writing(anchor):
+    checkpointer = maintenance.Checkpointer()
+    db.send_message("a", "b", "first")
+    assert checkpointer.tick() == "passive"
+    db.send_message("a", "b", "second")
+    assert checkpointer.tick() == "passive"
+
+
+def test_checkpointer_truncates_when_idle(anchor):
+    checkpointer = maintenance.Checkpointer()
+    db.send_message("a", "b", "hello")
+    assert db.wal_size() > 0
+    assert checkpointer.tick() == "passive"
+    # nothing written since the last tick
+    assert checkpointer.tick() == "truncate"
+    assert db.wal_size() == 0
+    assert 'talktome_wal_checkpoints_total{mode="truncate"} 1' in metrics.render()
+
+
+@pytest.mark.asyncio
+async def test_failing_job_keeps_running():
+    calls = {"n": 0}
+
+    def flaky():
+        calls["n"] += 1
+        raise RuntimeError("boom")
+
+    task = asyncio.create_task(maintenance.every("flaky", 0.01, flaky))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert calls["n"] >= 2
+    assert 'talktome_maintenance_errors_total{job="flaky"}' in metrics.render()
+
+
+def test_idle_checkpointer_without_wal_stays_passive():
+    # no open connection, sqlite already removed the wal on close
+    checkpointer = maintenance.Checkpointer()
+    db.send_message("a", "b", "hello")
+    assert checkpointer.tick() == "passive"
+    assert checkpointer.tick() == "passive"
+
+
+@pytest.mark.asyncio
+async def test_lifespan_starts_and_stops_jobs(monkeypatch):
+    ticks = {"n": 0}
+
+    def tick():
+        ticks["n"] += 1
+
+    monkeypatch.setattr(maintenance, "jobs", lambda: [("test", 0.01, tick)])
+    async with Client(mcp) as client:
+        await client.call_tool("bridge_list_peers", {})
+        await asyncio.sleep(0.1)
+    seen = ticks["n"]
+    assert seen >= 1
+    await asyncio.sleep(0.05)
+    assert ticks["n"] == seen
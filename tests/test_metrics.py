@@ -0,0 +1,102 @@
+import pytest
+import pytest_asyncio
+from fastmcp import Client
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, metrics, queue, registry
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+    metrics.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+# primitive tests, these use metrics that are not registered for rendering
+
+
+def test_counter_render():
+    counter = metrics.Counter("test_total", "a test counter", ("kind",))
+    metrics._metrics.remove(counter)
+    counter.inc(kind="a")
+    counter.inc(2, kind="a")
+    counter.inc(kind='q"uote')
+    lines = counter.render()
+    assert "# TYPE test_total counter" in lines
+    assert 'test_total{kind="a"} 3' in lines
+    assert 'test_total{kind="q\\"uote"} 1' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = metrics.Histogram("test_seconds", "a test histogram", buckets=(0.1, 1.0))
+    metrics._metrics.remove(hist)
+    hist.observe(0.05)
+    hist.observe(0.5)
+    hist.observe(5)
+    lines = hist.render()
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1"} 2' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_seconds_count 3" in lines
+    assert "test_seconds_sum 5.55" in lines
+
+
+def test_gauge_replace_drops_old_labels():
+    gauge = metrics.Gauge("test_depth", "a test gauge", ("agent",))
+    metrics._metrics.remove(gauge)
+    gauge.replace([({"agent": "a"}, 1), ({"agent": "b"}, 2)])
+    gauge.replace([({"agent": "b"}, 3)])
+    assert gauge.render()[2:] == ['test_depth{agent="b"} 3']
+
+
+def test_db_operations_are_timed():
+    db.send_message("a", "b", "hi")
+    text = metrics.render()
+    assert 'talktome_db_operation_duration_seconds_count{op="send_message"} 1' in text
+    assert "talktome_db_connections_total" in text
+
+
+# endpoint tests
+
+
+@pytest.mark.asyncio
+async def test_metrics_route_counts(http_client):
+    await http_client.get("/health")
+    await http_client.get("/peek/bob")
+    resp = await http_client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    text = resp.text
+    assert 'talktome_http_requests_total{route="/health",method="GET",status="200"} 1' in text
+    assert 'talktome_http_request_duration_seconds_count{route="/peek/{name}"} 1' in text
+
+
+@pytest.mark.asyncio
+async def test_metrics_tool_calls(http_client):
+    async with Client(mcp) as client:
+        await client.call_tool("bridge_register", {"name": "backend", "path": "/api"})
+    text = (await http_client.get("/metrics")).text
+    assert 'talktome_tool_calls_total{tool="bridge_register",outcome="ok"} 1' in text
+    assert 'talktome_tool_duration_seconds_count{tool="bridge_register"} 1' in text
+
+
+@pytest.mark.asyncio
+async def test_metrics_database_gauges(http_client):
+    registry.register("backend", "/api")
+    queue.send("frontend", "backend", "one")
+    queue.send("frontend", "backend", "two")
+    db.create_task("t1", "backend", "run tests")
+    text = (await http_client.get("/metrics")).text
+    assert 'talktome_mailbox_depth{agent="backend"} 2' in text
+    assert 'talktome_tasks{status="pending"} 1' in text
+    assert 'talktome_agents{status="active"} 1' in text
+    assert "talktome_wal_bytes" in text
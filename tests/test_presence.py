@@ -0,0 +1,123 @@
+import time
+
+import pytest
+import pytest_asyncio
+from fastmcp import Client
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, maintenance, metrics, presence, queue, registry
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+    metrics.reset()
+    presence.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+# move an agent's last heartbeat seconds into the past
+def age(name, seconds):
+    conn = db.connect()
+    conn.execute("UPDATE agents SET last_seen = ? WHERE name=?", (time.time() - seconds, name))
+    conn.commit()
+    conn.close()
+
+
+def test_touch_is_buffered_until_flush():
+    registry.register("web", "/web")
+    age("web", 100)
+    before = registry.get("web")["last_seen"]
+    presence.touch("web")
+    assert registry.get("web")["last_seen"] == before
+    assert presence.flush() == 1
+    assert registry.get("web")["last_seen"] > before
+    assert presence.flush() == 0
+
+
+def test_many_touches_are_one_update():
+    registry.register("web", "/web")
+    age("web", 100)
+    for _ in range(50):
+        presence.touch("web")
+    assert presence.flush() == 1
+
+
+def test_quiet_agents_go_stale_then_inactive():
+    registry.register("web", "/web")
+    registry.register("api", "/api")
+    age("web", presence.STALE_AFTER + 1)
+    assert presence.sweep() == {"stale": 1, "inactive": 0}
+    assert registry.get("web")["status"] == "stale"
+    assert registry.get("api")["status"] == "active"
+    age("web", presence.INACTIVE_AFTER + 1)
+    assert presence.sweep() == {"stale": 0, "inactive": 1}
+    assert registry.get("web")["status"] == "inactive"
+    assert registry.list_active() == ["api"]
+
+
+def test_heartbeat_brings_stale_agent_back():
+    registry.register("web", "/web")
+    age("web", presence.STALE_AFTER + 1)
+    presence.sweep()
+    presence.touch("web")
+    presence.sweep()
+    assert registry.get("web")["status"] == "active"
+
+
+def test_heartbeat_older_than_deregister_is_dropped():
+    registry.register("web", "/web")
+    presence.touch("web")
+    time.sleep(0.01)
+    registry.update_status("web", "inactive")
+    presence.flush()
+    assert registry.get("web")["status"] == "inactive"
+
+
+def test_timeouts_from_config(monkeypatch):
+    monkeypatch.setenv("TALKTOME_STALE_AFTER", "10")
+    registry.register("web", "/web")
+    age("web", 20)
+    assert maintenance.sweep_presence()["stale"] == 1
+    assert 'talktome_presence_changes_total{status="stale"} 1' in metrics.render()
+
+
+def test_publish_counts_only_live_subscribers():
+    registry.register("web", "/web")
+    registry.register("cli", "/cli")
+    queue.subscribe("web", "deploys")
+    queue.subscribe("cli", "deploys")
+    age("cli", presence.STALE_AFTER + 1)
+    presence.sweep()
+    assert queue.publish("api", "deploys", "v2")["subscribers"] == 1
+
+
+# server tests
+
+
+@pytest.mark.asyncio
+async def test_pending_tasks_poll_is_a_heartbeat(http_client):
+    registry.register("web", "/web")
+    age("web", 100)
+    before = registry.get("web")["last_seen"]
+    await http_client.get("/tasks/web/pending")
+    presence.flush()
+    assert registry.get("web")["last_seen"] > before
+
+
+@pytest.mark.asyncio
+async def test_list_peers_skips_inactive_agents():
+    registry.register("web", "/web")
+    registry.register("api", "/api")
+    registry.update_status("api", "inactive")
+    async with Client(mcp) as client:
+        result = await client.call_tool("bridge_list_peers", {})
+    assert result.content[0].text == '["web"]'
@@ -0,0 +1,134 @@
+import io
+import json
+import time
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, profiler
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+    profiler.reset()
+    yield
+    profiler.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def test_every_statement_is_counted():
+    db.register("backend", "/api")
+    db.get_agent("backend")
+    db.get_agent("backend")
+    stats = {s["sql"]: s for s in profiler.report()["statements"]}
+    assert stats["SELECT * FROM agents WHERE name=?"]["calls"] == 2
+
+
+def test_fast_statements_stay_out_of_slow_log(monkeypatch):
+    monkeypatch.setattr(profiler, "SLOW_QUERY_MS", 10_000)
+    db.get_agent("backend")
+    assert profiler.report()["slow"] == []
+
+
+def test_slow_statements_include_plan(monkeypatch):
+    monkeypatch.setattr(profiler, "SLOW_QUERY_MS", 0)
+    db.get_agent("backend")
+    slow = [e for e in profiler.report()["slow"] if e["sql"].startswith("SELECT * FROM agents")]
+    assert slow
+    assert any("agents" in step for step in slow[0]["plan"])
+
+
+def test_slow_log_keeps_top_n(monkeypatch):
+    monkeypatch.setattr(profiler, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(profiler, "SLOW_QUERY_TOP", 3)
+    for i in range(10):
+        db.get_agent(f"agent-{i}")
+    slow = profiler.report()["slow"]
+    assert len(slow) == 3
+    assert slow[0]["ms"] >= slow[-1]["ms"]
+
+
+def test_negative_threshold_disables_slow_log(monkeypatch):
+    monkeypatch.setattr(profiler, "SLOW_QUERY_MS", -1)
+    db.get_agent("backend")
+    assert profiler.report()["slow"] == []
+    assert profiler.report()["statements"]
+
+
+def test_threshold_from_config(monkeypatch):
+    monkeypatch.setattr(profiler, "SLOW_QUERY_MS", 10_000)
+    monkeypatch.setenv("TALKTOME_SLOW_QUERY_MS", "0")
+    db.get_agent("backend")
+    assert profiler.report()["threshold_ms"] == 0
+    assert profiler.report()["slow"]
+
+
+def test_fetching_rows_counts_toward_the_statement():
+    conn = db.connect()
+    conn.create_function("nap", 1, lambda v: time.sleep(0.02) or v)
+    rows = conn.execute(
+        "WITH RECURSIVE n(v) AS (SELECT 1 UNION ALL SELECT v + 1 FROM n WHERE v < 5)"
+        " SELECT nap(v) FROM n"
+    ).fetchall()
+    conn.close()
+    assert len(rows) == 5
+    stats = [s for s in profiler.report()["statements"] if "nap(v)" in s["sql"]]
+    assert stats[0]["calls"] == 1
+    assert stats[0]["total_ms"] >= 100
+
+
+@pytest.mark.asyncio
+async def test_debug_queries_endpoint(http_client):
+    db.register("backend", "/api")
+    resp = await http_client.get("/debug/queries")
+    data = resp.json()
+    assert "threshold_ms" in data
+    assert any("INSERT INTO agents" in s["sql"] for s in data["statements"])
+    resp = await http_client.post("/debug/queries/reset")
+    assert "cleared" in resp.json()["result"]
+    assert profiler.report()["statements"] == []
+
+
+@pytest.mark.asyncio
+async def test_debug_queries_rejects_a_bad_limit(http_client):
+    resp = await http_client.get("/debug/queries?limit=ten")
+    assert resp.status_code == 400
+    assert resp.json() == {"error": "limit must be an integer"}
+    db.register("backend", "/api")
+    db.get_agent("backend")
+    resp = await http_client.get("/debug/queries?limit=-5")
+    assert len(resp.json()["statements"]) == 1
+
+
+def test_profile_command_prints_report(monkeypatch, capsys):
+    report = {
+        "threshold_ms": 25.0,
+        "statements": [
+            {"sql": "SELECT 1", "calls": 3, "total_ms": 1.5, "avg_ms": 0.5, "max_ms": 0.9}
+        ],
+        "slow": [{"sql": "SELECT * FROM tasks", "ms": 40.0, "at": 0, "plan": ["SCAN tasks"]}],
+    }
+
+    def fake_urlopen(req, timeout=None):
+        return io.BytesIO(json.dumps(report).encode())
+
+    monkeypatch.setattr("urllib.request.urlopen", fake_urlopen)
+    monkeypatch.setattr("sys.argv", ["talktome", "profile"])
+
+    from talktome import main
+
+    main()
+    out = capsys.readouterr().out
+    assert "threshold: 25.0 ms" in out
+    assert "SELECT 1" in out
+    assert "plan: SCAN tasks" in out
@@ -1,3 +1,6 @@
+import sqlite3
+import time
+
 from talktome import db, queue
 
 
@@ -74,3 +77,121 @@ def test_count_after_send():
     queue.send("backend", "frontend", "two")
     queue.send("backend", "frontend", "three")
     assert queue.count("frontend") == 3
+
+
+# thread tests
+
+
+def test_send_starts_a_thread():
+    first = queue.send("backend", "frontend", "one")
+    second = queue.send("backend", "frontend", "two")
+    assert first["thread_id"] and first["thread_id"] != second["thread_id"]
+    assert first["reply_to"] is None
+
+
+def test_reply_goes_back_in_the_same_thread():
+    question = queue.send("backend", "frontend", "which port?")
+    answer = queue.reply("frontend", question["id"], "3456")
+    assert answer["to"] == "backend"
+    assert answer["thread_id"] == question["thread_id"]
+    assert answer["reply_to"] == question["id"]
+    assert queue.peek("backend")[0]["message"] == "3456"
+
+
+def test_reply_to_missing_message():
+    assert queue.reply("frontend", 999999, "hello?") is None
+
+
+def test_thread_returns_the_conversation_in_order():
+    question = queue.send("backend", "frontend", "ping")
+    queue.send("backend", "api", "unrelated")
+    queue.reply("frontend", question["id"], "pong")
+    queue.send("backend", "frontend", "thanks", thread_id=question["thread_id"])
+    messages = queue.thread(question["thread_id"])
+    assert [m["message"] for m in messages] == ["ping", "pong", "thanks"]
+    assert [m["to"] for m in messages] == ["frontend", "backend", "frontend"]
+
+
+def test_read_one_thread_leaves_the_rest():
+    question = queue.send("backend", "frontend", "question")
+    queue.send("api", "backend", "noise")
+    queue.reply("frontend", question["id"], "answer")
+    messages = queue.read("backend", question["thread_id"])
+    assert [m["message"] for m in messages] == ["answer"]
+    assert [m["message"] for m in queue.peek("backend")] == ["noise"]
+
+
+def test_thread_lookup_uses_the_index():
+    conn = db.connect()
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM messages WHERE thread_id=? ORDER BY id", ("t",)
+    ).fetchall()
+    conn.close()
+    assert "idx_messages_thread" in " ".join(r["detail"] for r in plan)
+
+
+def test_migration_adds_thread_columns(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, sender TEXT NOT NULL, "
+        "receiver TEXT NOT NULL, message TEXT NOT NULL, timestamp REAL NOT NULL, "
+        "read INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute(
+        "INSERT INTO messages (sender, receiver, message, timestamp) VALUES ('a', 'b', 'old', 1)"
+    )
+    conn.commit()
+    conn.close()
+    db.use(path)
+    try:
+        old = queue.peek("b")[0]
+        assert old["thread_id"] is None
+        reply = queue.reply("b", old["id"], "new")
+        assert reply["thread_id"] and reply["to"] == "a"
+    finally:
+        db.use()
+
+
+# unread index tests
+
+
+def test_count_and_empty_peek_skip_the_database(monkeypatch):
+    queue.count("frontend")
+
+    def fail(*args):
+        raise AssertionError("database touched")
+
+    monkeypatch.setattr(db, "connect", fail)
+    assert queue.count("frontend") == 0
+    assert queue.peek("frontend") == []
+    assert queue.read("frontend") == []
+
+
+def test_index_matches_database():
+    queue.subscribe("frontend", "deploys")
+    for i in range(5):
+        queue.send("backend", "frontend", f"m{i}")
+    queue.publish("backend", "deploys", "v2")
+    entry = queue.send("backend", "frontend", "threaded")
+    queue.read("frontend", entry["thread_id"])
+    expected = db.message_count("frontend") + db.topic_message_count("frontend")
+    assert queue.count("frontend") == expected == 6
+
+
+def test_index_rebuilds_from_database():
+    queue.send("backend", "frontend", "first")
+    # written behind the index, only a rebuild sees it
+    db.send_message("backend", "frontend", "second")
+    assert queue.count("frontend") == 1
+    queue.rebuild()
+    assert queue.count("frontend") == 2
+    assert len(queue.read("frontend")) == 2
+
+
+def test_index_drops_expired_messages():
+    queue.send("backend", "frontend", "short lived", ttl=0.05)
+    queue.send("backend", "frontend", "forever")
+    assert queue.count("frontend") == 2
+    time.sleep(0.1)
+    assert queue.count("frontend") == 1
@@ -1,3 +1,5 @@
+import pytest
+
 from talktome import db, registry
 
 
@@ -94,3 +96,53 @@ def test_count():
     assert registry.count() == 1
     registry.register("frontend", "/web")
     assert registry.count() == 2
+
+
+# cache tests
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+    original = db.get_agents
+
+    def counting():
+        calls.append(1)
+        return original()
+
+    monkeypatch.setattr(db, "get_agents", counting)
+    return calls
+
+
+def test_lookups_are_served_from_cache(loads):
+    registry.register("backend", "/api")
+    for _ in range(10):
+        assert registry.is_registered("backend")
+        registry.get("backend")
+        registry.list_all()
+    assert len(loads) == 1
+
+
+def test_writes_invalidate_cache(loads):
+    registry.register("backend", "/api")
+    assert registry.get("backend")["status"] == "active"
+    registry.update_status("backend", "inactive")
+    assert registry.get("backend")["status"] == "inactive"
+    registry.update_metadata("backend", {"lang": "go"})
+    assert registry.get("backend")["metadata"] == {"lang": "go"}
+    registry.deregister("backend")
+    assert registry.is_registered("backend") is False
+    assert len(loads) == 4
+
+
+def test_get_returns_a_copy():
+    registry.register("backend", "/api", metadata={"lang": "python"})
+    registry.get("backend")["metadata"]["lang"] = "rust"
+    assert registry.get("backend")["metadata"] == {"lang": "python"}
+
+
+def test_reset_clears_cache():
+    registry.register("backend", "/api")
+    assert registry.is_registered("backend")
+    db.reset()
+    assert registry.is_registered("backend") is False
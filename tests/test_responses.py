@@ -0,0 +1,95 @@
+import gzip
+import json
+import zlib
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db
+from talktome.responses import choose_encoding, compress, dumps
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+# encoder tests
+
+
+def test_dumps_is_compact():
+    assert dumps({"a": [1, 2], "b": "x"}) == b'{"a":[1,2],"b":"x"}'
+
+
+def test_dumps_keeps_unicode():
+    assert json.loads(dumps({"msg": "héllo ✓"})) == {"msg": "héllo ✓"}
+
+
+# negotiation tests
+
+
+def test_choose_encoding_prefers_gzip():
+    assert choose_encoding("deflate, gzip") == "gzip"
+
+
+def test_choose_encoding_deflate_only():
+    assert choose_encoding("deflate") == "deflate"
+
+
+def test_choose_encoding_respects_zero_quality():
+    assert choose_encoding("gzip;q=0, deflate") == "deflate"
+
+
+def test_choose_encoding_wildcard():
+    assert choose_encoding("*") == "gzip"
+
+
+def test_choose_encoding_identity():
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
+
+
+def test_compress_round_trip():
+    body = b"x" * 5000
+    assert gzip.decompress(compress(body, "gzip")) == body
+    assert zlib.decompress(compress(body, "deflate")) == body
+
+
+# endpoint tests
+
+
+@pytest.mark.asyncio
+async def test_large_response_is_gzipped(http_client):
+    for i in range(50):
+        db.create_task(f"t{i}", "backend", "run the full integration suite " * 5)
+    resp = await http_client.get("/tasks", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in resp.headers["vary"].lower()
+    assert int(resp.headers["content-length"]) < len(resp.content)
+    assert len(resp.json()) == 50
+
+
+@pytest.mark.asyncio
+async def test_large_response_uncompressed_for_identity(http_client):
+    for i in range(50):
+        db.create_task(f"t{i}", "backend", "run the full integration suite " * 5)
+    resp = await http_client.get("/tasks", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in resp.headers
+    assert len(resp.json()) == 50
+
+
+@pytest.mark.asyncio
+async def test_small_response_not_compressed(http_client):
+    resp = await http_client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert resp.json() == {"status": "ok"}
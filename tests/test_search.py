@@ -0,0 +1,124 @@
+import sqlite3
+
+import pytest
+import pytest_asyncio
+from fastmcp import Client
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, queue
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def seed():
+    queue.send("api", "web", "the auth endpoint moved to /api/login")
+    queue.send("web", "api", "thanks, updating the login form")
+    db.create_task("t1", "api", "rotate the auth signing keys")
+    db.set_context("api", "auth_endpoint", "/api/login")
+    db.set_context("web", "theme", "dark")
+
+
+def test_search_finds_every_kind():
+    seed()
+    hits = db.search("auth")
+    assert {h["kind"] for h in hits} == {"message", "task", "context"}
+    message = [h for h in hits if h["kind"] == "message"][0]
+    assert message["from"] == "api" and "[auth]" in message["snippet"]
+
+
+def test_search_filters_by_kind_and_agent():
+    seed()
+    assert {h["kind"] for h in db.search("auth", kinds=("task",))} == {"task"}
+    hits = db.search("login", agent="web")
+    assert {(h["kind"], h.get("owner")) for h in hits} == {("message", None)}
+    assert len(hits) == 2
+
+
+def test_search_ranks_better_matches_first():
+    queue.send("a", "b", "cache cache cache invalidation")
+    queue.send(
+        "a", "b", "we talked about the cache once in a very long message about lots of things"
+    )
+    hits = db.search("cache")
+    assert hits[0]["snippet"].count("[cache]") == 3
+
+
+def test_search_syntax_is_quoted():
+    queue.send("a", "b", "call auth-endpoint: now")
+    assert len(db.search('auth-endpoint: "now')) == 1
+    assert len(db.search("endp*")) == 1
+    assert db.search("   ") == []
+
+
+def test_index_follows_updates_and_deletes():
+    db.set_context("api", "k", "first draft")
+    db.set_context("api", "k", "second version")
+    assert db.search("draft") == []
+    assert len(db.search("second")) == 1
+    db.create_task("t1", "api", "write docs")
+    db.update_task("t1", status="done", result="published the handbook")
+    assert db.search("handbook")[0]["id"] == "t1"
+    queue.send("a", "b", "ephemeral note", ttl=30)
+    conn = db.connect()
+    conn.execute("UPDATE messages SET expires_at = 1")
+    conn.commit()
+    conn.close()
+    assert db.search("ephemeral") == []
+    db.sweep_expired()
+    conn = db.connect()
+    assert (
+        conn.execute(
+            "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'ephemeral'"
+        ).fetchone()[0]
+        == 0
+    )
+    conn.close()
+
+
+def test_existing_rows_are_indexed_on_upgrade(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, sender TEXT NOT NULL, "
+        "receiver TEXT NOT NULL, message TEXT NOT NULL, timestamp REAL NOT NULL, "
+        "read INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute(
+        "INSERT INTO messages (sender, receiver, message, timestamp) VALUES ('a', 'b', 'legacy hello', 1)"
+    )
+    conn.commit()
+    conn.close()
+    db.use(path)
+    try:
+        assert db.search("legacy")[0]["from"] == "a"
+    finally:
+        db.use()
+
+
+@pytest.mark.asyncio
+async def test_search_rest(http_client):
+    seed()
+    resp = await http_client.get("/search?q=auth&kinds=context")
+    assert [h["key"] for h in resp.json()] == ["auth_endpoint"]
+    resp = await http_client.get("/search?q=")
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_search_tool():
+    seed()
+    async with Client(mcp) as client:
+        result = await client.call_tool("bridge_search", {"query": "signing", "kinds": "task"})
+        assert result.data[0]["id"] == "t1"
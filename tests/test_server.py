@@ -325,3 +325,47 @@ async def test_wait_for_reply_via_peek_and_read(http_client):
     # now peek shows empty
     resp = await http_client.get("/peek/bob")
     assert resp.json()["count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_reply_and_thread_rest(http_client):
+    registry.register("alice", "/a")
+    registry.register("bob", "/b")
+    resp = await http_client.post("/send", json={"sender": "alice", "peer": "bob", "message": "hi"})
+    thread_id = resp.json()["thread_id"]
+    message_id = resp.json()["id"]
+    resp = await http_client.post(
+        "/reply", json={"sender": "bob", "message_id": message_id, "message": "hello"}
+    )
+    assert resp.json()["thread_id"] == thread_id
+    queue.send("carol", "alice", "unrelated")
+    resp = await http_client.get(f"/peek/alice?thread={thread_id}")
+    assert resp.json()["count"] == 1
+    resp = await http_client.get(f"/read/alice?thread={thread_id}")
+    assert [m["message"] for m in resp.json()] == ["hello"]
+    assert queue.count("alice") == 1
+    resp = await http_client.get(f"/thread/{thread_id}")
+    assert [m["message"] for m in resp.json()] == ["hi", "hello"]
+
+
+@pytest.mark.asyncio
+async def test_reply_rest_errors(http_client):
+    resp = await http_client.post("/reply", json={"sender": "bob", "message": "x"})
+    assert resp.status_code == 400
+    resp = await http_client.post(
+        "/reply", json={"sender": "bob", "message_id": 424242, "message": "x"}
+    )
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_bridge_reply_tool():
+    registry.register("alice", "/a")
+    question = queue.send("alice", "bob", "status?")
+    async with Client(mcp) as client:
+        result = await client.call_tool(
+            "bridge_reply", {"sender": "bob", "message_id": question["id"], "message": "green"}
+        )
+        assert question["thread_id"] in str(result)
+        result = await client.call_tool("bridge_get_thread", {"thread_id": question["thread_id"]})
+        assert "green" in str(result)
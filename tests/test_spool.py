@@ -0,0 +1,208 @@
+import time
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, proxy, queue
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+# a proxy whose bridge is down, spooling to a temp file
+@pytest.fixture
+def down(monkeypatch, tmp_path):
+    # nothing listens on the discard port
+    monkeypatch.setattr(proxy, "BRIDGE_URL", "http://127.0.0.1:9")
+    monkeypatch.setattr(proxy, "SPOOL_PATH", str(tmp_path / "spool.jsonl"))
+
+
+# the bridge coming back, records what the proxy sends and fails on request
+# with an unreachable bridge or the status set for a message
+@pytest.fixture
+def bridge(monkeypatch):
+    sent = []
+    state = {"fail_after": None, "status": {}}
+
+    def send(endpoint, method="GET", data=None, timeout=10, key=None):
+        if endpoint == "/health":
+            return 200, {"status": "ok"}
+        if state["fail_after"] is not None and len(sent) >= state["fail_after"]:
+            raise OSError("connection refused")
+        sent.append((endpoint, data["message"], key))
+        status = state["status"].get(data["message"], 200)
+        return status, {"result": "ok"} if status == 200 else {"error": "nope"}
+
+    monkeypatch.setattr(proxy, "send_request", send)
+    return sent, state
+
+
+def spool(*messages):
+    for message in messages:
+        proxy.append_spool(
+            {
+                "bridge": proxy.BRIDGE_URL,
+                "endpoint": "/send",
+                "method": "POST",
+                "data": {"message": message},
+                "key": message,
+                "queued_at": time.time(),
+            }
+        )
+
+
+# idempotency key tests
+
+
+@pytest.mark.asyncio
+async def test_retried_send_is_applied_once(http_client):
+    await http_client.post("/register", json={"name": "web", "path": "/web"})
+    body = {"sender": "api", "peer": "web", "message": "hi"}
+    headers = {"Idempotency-Key": "k1"}
+    first = await http_client.post("/send", json=body, headers=headers)
+    second = await http_client.post("/send", json=body, headers=headers)
+    assert second.json() == first.json()
+    assert second.headers["idempotent-replayed"] == "true"
+    assert queue.count("web") == 1
+
+
+@pytest.mark.asyncio
+async def test_rejected_request_frees_its_key(http_client):
+    await http_client.post("/register", json={"name": "web", "path": "/web"})
+    headers = {"Idempotency-Key": "k1"}
+    resp = await http_client.post("/send", json={"sender": "api"}, headers=headers)
+    assert resp.status_code == 400
+    body = {"sender": "api", "peer": "web", "message": "hi"}
+    await http_client.post("/send", json=body, headers=headers)
+    assert queue.count("web") == 1
+
+
+@pytest.mark.asyncio
+async def test_key_reused_for_another_request(http_client):
+    await http_client.post("/register", json={"name": "web", "path": "/web"})
+    headers = {"Idempotency-Key": "k1"}
+    body = {"sender": "api", "peer": "web", "message": "hi"}
+    await http_client.post("/send", json=body, headers=headers)
+    resp = await http_client.post("/send", json=dict(body, message="bye"), headers=headers)
+    assert resp.status_code == 422
+    # the same key on another endpoint is a request of its own
+    resp = await http_client.post(
+        "/task", json={"agent": "web", "description": "build"}, headers=headers
+    )
+    assert "idempotent-replayed" not in resp.headers
+    assert resp.json()["agent"] == "web"
+    assert queue.count("web") == 1
+
+
+def test_idempotency_keys_expire():
+    db.claim_idempotency_key("k1", "f", -1, 30)
+    assert db.sweep_expired()["idempotency_keys"] == 1
+    assert db.claim_idempotency_key("k1", "f", 60, 30) == (True, None)
+
+
+# forget the response to a finished request, as if the bridge died before storing it
+def abandon(age):
+    conn = db.connect()
+    conn.execute(
+        "UPDATE idempotency_keys SET status=NULL, response=NULL, claimed_at=claimed_at - ?",
+        (age,),
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_abandoned_claim_lets_the_retry_run(http_client):
+    await http_client.post("/register", json={"name": "web", "path": "/web"})
+    body = {"sender": "api", "peer": "web", "message": "hi"}
+    headers = {"Idempotency-Key": "k1"}
+    await http_client.post("/send", json=body, headers=headers)
+    queue.read("web")
+    abandon(0)
+    resp = await http_client.post("/send", json=body, headers=headers)
+    assert resp.status_code == 409
+    abandon(60)
+    resp = await http_client.post("/send", json=body, headers=headers)
+    assert resp.status_code == 200
+    assert queue.count("web") == 1
+
+
+# proxy spool tests
+
+
+def test_unreachable_bridge_spools_writes(down):
+    for message in ("one", "two"):
+        result = proxy.write_bridge("/send", "POST", {"peer": "web", "message": message})
+        assert result["queued"] is True
+    entries = proxy.read_spool()
+    assert [e["data"]["message"] for e in entries] == ["one", "two"]
+    assert len({e["key"] for e in entries}) == 2
+
+
+def test_replay_sends_in_order_and_stops_at_first_failure(down, bridge):
+    sent, state = bridge
+    spool("one", "two", "three")
+    state["fail_after"] = 1
+    assert proxy.replay() is False
+    assert [e["key"] for e in proxy.read_spool()] == ["two", "three"]
+    state["fail_after"] = None
+    assert proxy.replay() is True
+    assert sent == [("/send", m, m) for m in ("one", "two", "three")]
+    assert proxy.spooled() is False
+
+
+def test_replay_keeps_writes_the_bridge_did_not_settle(down, bridge):
+    sent, state = bridge
+    spool("one", "two", "three")
+    state["status"] = {"two": 503}
+    assert proxy.replay() is False
+    assert [e["key"] for e in proxy.read_spool()] == ["two", "three"]
+    state["status"] = {"two": 409}
+    assert proxy.replay() is False
+    assert [e["key"] for e in proxy.read_spool()] == ["two", "three"]
+    state["status"] = {}
+    assert proxy.replay() is True
+    assert [message for _, message, _ in sent] == ["one", "two", "two", "two", "three"]
+
+
+def test_replay_drops_writes_the_bridge_rejected(down, bridge):
+    sent, state = bridge
+    spool("bad", "good")
+    state["status"] = {"bad": 400}
+    assert proxy.replay() is True
+    assert [message for _, message, _ in sent] == ["bad", "good"]
+    assert proxy.spooled() is False
+
+
+def test_new_write_goes_out_after_the_spool(down, bridge):
+    sent, _ = bridge
+    proxy.append_spool(
+        {
+            "bridge": proxy.BRIDGE_URL,
+            "endpoint": "/send",
+            "method": "POST",
+            "data": {"message": "old"},
+            "key": "old",
+        }
+    )
+    proxy.write_bridge("/send", "POST", {"message": "new"})
+    assert [message for _, message, _ in sent] == ["old", "new"]
+
+
+def test_replay_leaves_other_bridges_entries(down, bridge):
+    entry = {"bridge": "http://other:3456", "endpoint": "/send", "method": "POST"}
+    proxy.append_spool(dict(entry, data={"message": "elsewhere"}, key="k1"))
+    assert proxy.replay() is True
+    assert [e["key"] for e in proxy.read_spool()] == ["k1"]
@@ -0,0 +1,159 @@
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from talktome import db, queue
+from talktome.server import mcp
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+
+
+@pytest_asyncio.fixture
+async def http_client():
+    app = mcp.http_app(path="/mcp")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def row_count(table):
+    conn = db.connect()
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.close()
+    return count
+
+
+# subscription and cursor tests
+
+
+def test_publish_is_one_row_for_all_subscribers():
+    for i in range(30):
+        queue.subscribe(f"agent-{i}", "schema-changes")
+    entry = queue.publish("api", "schema-changes", "users.email is now unique")
+    assert entry["subscribers"] == 30
+    assert row_count("topic_messages") == 1
+    assert row_count("messages") == 0
+    for i in range(30):
+        assert queue.count(f"agent-{i}") == 1
+
+
+def test_subscriber_only_sees_messages_after_subscribing():
+    queue.publish("api", "deploys", "before")
+    queue.subscribe("web", "deploys")
+    queue.publish("api", "deploys", "after")
+    assert [m["message"] for m in queue.peek("web")] == ["after"]
+
+
+def test_read_advances_only_the_readers_cursor():
+    queue.subscribe("web", "deploys")
+    queue.subscribe("cli", "deploys")
+    queue.publish("api", "deploys", "v2 is out")
+    read = queue.read("web")
+    assert read[0]["topic"] == "deploys"
+    assert read[0]["from"] == "api"
+    assert queue.read("web") == []
+    assert [m["message"] for m in queue.read("cli")] == ["v2 is out"]
+
+
+def test_mailbox_merges_direct_and_topic_messages():
+    queue.subscribe("web", "deploys")
+    queue.send("api", "web", "direct")
+    queue.publish("api", "deploys", "broadcast")
+    assert queue.count("web") == 2
+    assert [m["message"] for m in queue.read("web")] == ["direct", "broadcast"]
+    assert queue.count("web") == 0
+
+
+def test_thread_filter_leaves_topic_messages_unread():
+    queue.subscribe("web", "deploys")
+    entry = queue.send("api", "web", "in thread")
+    queue.publish("api", "deploys", "broadcast")
+    assert [m["message"] for m in queue.read("web", entry["thread_id"])] == ["in thread"]
+    assert [m["message"] for m in queue.read("web")] == ["broadcast"]
+
+
+def test_publisher_does_not_receive_own_message():
+    queue.subscribe("api", "deploys")
+    queue.subscribe("web", "deploys")
+    entry = queue.publish("api", "deploys", "v2")
+    assert entry["subscribers"] == 1
+    assert queue.count("api") == 0
+
+
+def test_unsubscribe_and_clear():
+    assert queue.subscribe("web", "deploys") is True
+    assert queue.subscribe("web", "deploys") is False
+    queue.publish("api", "deploys", "one")
+    assert queue.clear("web") is True
+    assert queue.count("web") == 0
+    assert queue.unsubscribe("web", "deploys") is True
+    assert queue.unsubscribe("web", "deploys") is False
+    queue.publish("api", "deploys", "two")
+    assert queue.count("web") == 0
+
+
+def test_large_topic_message_is_offloaded_and_read_in_full():
+    queue.subscribe("web", "dumps")
+    big = "x" * (db.BLOB_THRESHOLD + 10)
+    queue.publish("api", "dumps", big)
+    peeked = queue.peek("web")[0]
+    assert len(peeked["message"]) == db.PREVIEW_CHARS
+    assert peeked["blob"]["size"] == len(big)
+    assert queue.read("web")[0]["message"] == big
+    assert db.gc_blobs() == 0
+
+
+def test_expired_topic_messages_are_hidden_and_swept():
+    queue.subscribe("web", "deploys")
+    queue.publish("api", "deploys", "short lived", ttl=30)
+    conn = db.connect()
+    conn.execute("UPDATE topic_messages SET expires_at = 1")
+    conn.commit()
+    conn.close()
+    queue.rebuild()
+    assert queue.count("web") == 0
+    assert db.sweep_expired()["topic_messages"] == 1
+
+
+def test_list_topics():
+    queue.subscribe("web", "deploys")
+    queue.subscribe("cli", "deploys")
+    queue.publish("api", "deploys", "v2")
+    queue.publish("api", "alerts", "disk full")
+    assert queue.topics() == [
+        {"topic": "alerts", "subscribers": [], "messages": 1},
+        {"topic": "deploys", "subscribers": ["cli", "web"], "messages": 1},
+    ]
+    assert queue.subscriptions("web") == ["deploys"]
+
+
+# rest endpoint tests
+
+
+@pytest.mark.asyncio
+async def test_publish_and_peek_over_rest(http_client):
+    resp = await http_client.post("/subscribe", json={"agent": "web", "topic": "deploys"})
+    assert resp.json()["subscribed"] is True
+    resp = await http_client.post(
+        "/publish", json={"sender": "api", "topic": "deploys", "message": "v2"}
+    )
+    assert resp.json()["subscribers"] == 1
+    resp = await http_client.get("/peek/web")
+    data = resp.json()
+    assert data["count"] == 1
+    assert data["messages"][0]["topic"] == "deploys"
+    resp = await http_client.get("/topics")
+    assert resp.json()[0]["subscribers"] == ["web"]
+    resp = await http_client.post("/unsubscribe", json={"agent": "web", "topic": "deploys"})
+    assert resp.json()["unsubscribed"] is True
+
+
+@pytest.mark.asyncio
+async def test_publish_requires_topic(http_client):
+    resp = await http_client.post("/publish", json={"sender": "api", "message": "v2"})
+    assert resp.status_code == 400
+    resp = await http_client.post("/subscribe", json={"agent": "web"})
+    assert resp.status_code == 400
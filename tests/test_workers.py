@@ -0,0 +1,171 @@
+import asyncio
+import os
+import socket
+import time
+
+import pytest
+import pytest_asyncio
+
+from talktome import apply_option, db, maintenance, notify, queue, registry, server
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    db.reset()
+    notify.reset()
+    yield
+    notify.reset()
+
+
+# a udp socket standing in for another worker process
+@pytest.fixture
+def peer():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2)
+    db.add_worker(os.getpid() + 1, sock.getsockname()[1])
+    yield sock
+    sock.close()
+
+
+# this process joined as a worker, yields its notification port
+@pytest_asyncio.fixture
+async def channel():
+    port = await notify.open_channel()
+    yield port
+    notify.close_channel()
+
+
+async def from_peer(sock, port, topic):
+    sock.sendto(topic.encode(), ("127.0.0.1", port))
+    # let the event loop pick the datagram up
+    for _ in range(50):
+        await asyncio.sleep(0.01)
+
+
+# notification channel tests
+
+
+@pytest.mark.asyncio
+async def test_open_channel_registers_worker():
+    port = await notify.open_channel()
+    assert port in db.worker_ports()
+    notify.close_channel()
+    assert db.worker_ports() == []
+
+
+@pytest.mark.asyncio
+async def test_publish_reaches_other_workers(peer, channel):
+    # the new worker announces itself to the ones already running
+    assert peer.recv(100) == notify.WORKERS_TOPIC.encode()
+    notify.publish("context:api")
+    assert peer.recv(100) == b"context:api"
+
+
+@pytest.mark.asyncio
+async def test_publish_from_other_worker_wakes_waiters(peer, channel):
+    event = notify.listen("context:api")
+    await from_peer(peer, channel, "context:api")
+    assert event.is_set()
+
+
+@pytest.mark.asyncio
+async def test_mailbox_write_elsewhere_refreshes_index(peer, channel):
+    assert queue.count("web") == 0
+    # another worker wrote straight to the database
+    db.send_message("api", "web", "hello")
+    assert queue.count("web") == 0
+    await from_peer(peer, channel, queue.MAILBOX_TOPIC)
+    assert queue.count("web") == 1
+
+
+@pytest.mark.asyncio
+async def test_agent_write_elsewhere_refreshes_registry(peer, channel):
+    assert registry.is_registered("web") is False
+    db.register("web", "/web")
+    registry.invalidate()
+    assert registry.is_registered("web") is True
+    db.deregister("web")
+    await from_peer(peer, channel, registry.AGENTS_TOPIC)
+    assert registry.is_registered("web") is False
+
+
+# maintenance lease tests
+
+
+def test_lease_has_one_holder_until_it_lapses():
+    assert db.acquire_lease("maintenance", "1", 60) is True
+    assert db.acquire_lease("maintenance", "2", 60) is False
+    assert db.acquire_lease("maintenance", "1", 60) is True
+    conn = db.connect()
+    conn.execute("UPDATE leases SET expires_at = ?", (time.time() - 1,))
+    conn.commit()
+    conn.close()
+    assert db.acquire_lease("maintenance", "2", 60) is True
+
+
+def test_shared_jobs_only_run_in_the_lease_holder(monkeypatch):
+    monkeypatch.setenv("TALKTOME_WORKERS", "2")
+    db.acquire_lease("maintenance", "someone-else", 60)
+    jobs = {name: job for name, _, job in maintenance.jobs()}
+    assert jobs["expiry"]() is None
+    # heartbeats are buffered per worker, every worker flushes its own
+    assert jobs["presence"]() == {"stale": 0, "inactive": 0}
+
+
+@pytest.mark.asyncio
+async def test_read_checks_the_database_when_the_index_may_be_stale(channel):
+    queue.rebuild()
+    # another worker's write whose datagram never arrived
+    db.send_message("api", "web", "hi")
+    assert [m["message"] for m in queue.peek("web")] == ["hi"]
+    assert [m["message"] for m in queue.read("web")] == ["hi"]
+
+
+def test_resync_catches_a_lost_notification(monkeypatch):
+    monkeypatch.setenv("TALKTOME_WORKERS", "2")
+    queue.rebuild()
+    # another worker's write whose datagram never arrived
+    db.send_message("api", "web", "hi")
+    assert queue.count("web") == 0
+    jobs = {name: job for name, _, job in maintenance.jobs()}
+    jobs["resync"]()
+    assert queue.count("web") == 1
+
+
+def test_single_worker_runs_every_job():
+    db.acquire_lease("maintenance", "someone-else", 60)
+    jobs = {name: job for name, _, job in maintenance.jobs()}
+    assert "resync" not in jobs
+    assert jobs["expiry"]() == {
+        "messages": 0,
+        "topic_messages": 0,
+        "context": 0,
+        "idempotency_keys": 0,
+    }
+
+
+# startup tests
+
+
+def test_workers_cli_option(monkeypatch):
+    monkeypatch.delenv("TALKTOME_WORKERS", raising=False)
+    args = apply_option(["talktome", "--workers", "4", "--no-browser"], "workers")
+    assert args == ["talktome", "--no-browser"]
+    assert maintenance.worker_count() == 4
+
+
+def test_workers_need_a_database_file():
+    with pytest.raises(ValueError, match="in-memory"):
+        server.run_workers(2, "127.0.0.1", 0)
+
+
+def test_migration_tolerates_a_concurrent_worker():
+    conn = db.connect()
+    # a column another process added between the check and the alter
+    db.MIGRATIONS["messages"].append(("thread_id", "TEXT"))
+    try:
+        db._migrate(conn)
+    finally:
+        db.MIGRATIONS["messages"].pop()
+        conn.close()